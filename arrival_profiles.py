@@ -0,0 +1,198 @@
+"""
+Hour-of-week and hour-of-day arrival profiles (notebooks 1 and 1b).
+
+A profile is the average number of task submissions per hour, over all hours of the trace that have at least one
+submission, grouped by the hour of the week (or day). Every trace is read in a single streaming pass over ts_submit
+into an HourlyCounts partial: a dense array of submissions per absolute hour. Partials of different files or workers
+of the same trace merge by adding their arrays, and are folded into fixed-size sum/count arrays of length 168 (or 24)
+only at the end, so memory stays bounded by the length of the traces rather than their number of tasks.
+"""
+
+import multiprocessing
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+import trace_names
+import trace_reader
+
+one_hour_in_milliseconds = 1000*60*60
+hours_in_a_week = 24*7
+hours_in_a_day = 24
+
+# Hours added to the hour of every submission, per folder-name prefix, to line traces up on local time. These replace
+# the np.roll calls of the notebooks: np.roll(hours, k) relabels hour h as h - k.
+week_offsets = OrderedDict([
+    ("Two_Sigma", -110),
+    ("alibaba", -25),
+])
+day_offsets = OrderedDict([
+    ("Two_Sigma", 12),
+])
+
+excluded_prefixes = ["askalon-new_ee68_"]
+
+
+class HourlyCounts(object):
+    """
+    Number of submissions in each hour [first_hour, first_hour + len(counts)), with hours counted from ts_submit 0.
+    """
+
+    def __init__(self, first_hour=None, counts=None):
+        self.first_hour = first_hour
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    def _grow(self, low, high):
+        # Extends the array to cover hours [low, high].
+        if self.first_hour is None:
+            self.first_hour = low
+        new_first = min(self.first_hour, low)
+        new_length = max(self.first_hour + self.counts.shape[0], high + 1) - new_first
+        if new_first != self.first_hour or new_length != self.counts.shape[0]:
+            grown = np.zeros(new_length, dtype=np.int64)
+            offset = self.first_hour - new_first
+            grown[offset:offset + self.counts.shape[0]] = self.counts
+            self.counts = grown
+            self.first_hour = new_first
+
+    def add_timestamps(self, ts_submit):
+        ts_submit = np.asarray(ts_submit)
+        if ts_submit.dtype.kind == "f":
+            ts_submit = ts_submit[np.isfinite(ts_submit)]
+        if ts_submit.shape[0] == 0:
+            return self
+        hours = np.floor_divide(ts_submit, one_hour_in_milliseconds).astype(np.int64)
+        self._grow(int(hours.min()), int(hours.max()))
+        self.counts += np.bincount(hours - self.first_hour, minlength=self.counts.shape[0])
+        return self
+
+    def merge(self, other):
+        if other.first_hour is None or other.counts.shape[0] == 0:
+            return self
+        self._grow(other.first_hour, other.first_hour + other.counts.shape[0] - 1)
+        offset = other.first_hour - self.first_hour
+        self.counts[offset:offset + other.counts.shape[0]] += other.counts
+        return self
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def fold(self, period, offset=0):
+        """
+        Returns (sums, hours): per hour of the period, the number of submissions and the number of non-empty hours.
+        """
+        sums = np.zeros(period, dtype=np.int64)
+        hours = np.zeros(period, dtype=np.int64)
+        if self.first_hour is None:
+            return sums, hours
+        nonempty = np.flatnonzero(self.counts)
+        hour_of_period = (nonempty + self.first_hour + offset) % period
+        sums += np.bincount(hour_of_period, weights=self.counts[nonempty], minlength=period).astype(np.int64)
+        hours += np.bincount(hour_of_period, minlength=period)
+        return sums, hours
+
+
+def average(sums, hours):
+    # Hours of the period in which the trace never submitted anything are left out, as in the Spark groupby.
+    present = hours > 0
+    return np.flatnonzero(present), sums[present] / hours[present]
+
+
+def trace_hourly_counts(trace_location):
+    hourly = HourlyCounts()
+    for batch in trace_reader.iter_batches(trace_location, ["ts_submit"]):
+        hourly.add_timestamps(batch.column(0).to_numpy(zero_copy_only=False))
+    return hourly
+
+
+def trace_offset(trace_name, offsets):
+    offset = trace_names.match_prefix(trace_name, offsets)
+    return 0 if offset is None else offset
+
+
+def profile_frame(hourly, period, offset, workload_name):
+    column = "hour_of_week" if period == hours_in_a_week else "hour_of_day"
+    hours, averages = average(*hourly.fold(period, offset))
+    return pd.DataFrame({column: hours, "avg(count)": averages, "workload": workload_name},
+                        columns=[column, "avg(count)", "workload"])
+
+
+def _selected_traces(traces_location, min_duration, catalog):
+    selected = []
+    for trace_name in sorted(os.listdir(traces_location)):
+        trace_location = os.path.join(traces_location, trace_name)
+        if trace_name.endswith("py") or not os.path.isdir(trace_location):
+            continue
+        if any(trace_name.startswith(prefix) for prefix in excluded_prefixes):
+            continue
+        if catalog is not None and trace_name in catalog:
+            max_ts_submit = catalog[trace_name]["max_ts_submit"]
+            if max_ts_submit is None or max_ts_submit < min_duration:
+                continue
+        else:
+            if not trace_reader.do_tasks_exist(trace_location):
+                continue
+            if not trace_reader.is_trace_long_enough(trace_location, min_duration):
+                continue
+        selected.append(trace_name)
+    return selected
+
+
+def _read_hourly(trace_location):
+    return trace_hourly_counts(trace_location)
+
+
+def hourly_counts_per_trace(traces_location, min_duration=trace_reader.one_week_in_milliseconds, catalog=None,
+                            processes=None):
+    """
+    Returns an OrderedDict of trace name to HourlyCounts for every trace that is long enough. Traces in the catalog
+    (see trace_catalog) are not read again.
+    """
+    trace_names_to_read = []
+    result = OrderedDict()
+    for trace_name in _selected_traces(traces_location, min_duration, catalog):
+        if catalog is not None and trace_name in catalog:
+            result[trace_name] = HourlyCounts(*catalog.hourly_counts(trace_name))
+        else:
+            result[trace_name] = None
+            trace_names_to_read.append(trace_name)
+
+    locations = [os.path.join(traces_location, trace_name) for trace_name in trace_names_to_read]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or len(locations) <= 1:
+        partials = [_read_hourly(location) for location in locations]
+    else:
+        pool = multiprocessing.Pool(processes=min(processes, len(locations)))
+        try:
+            partials = instrumentation.pool_map(pool, _read_hourly, locations)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    for trace_name, partial in zip(trace_names_to_read, partials):
+        result[trace_name] = partial
+    return result
+
+
+def arrival_profiles(traces_location, period=hours_in_a_week, offsets=None,
+                     min_duration=trace_reader.one_week_in_milliseconds, catalog=None, processes=None,
+                     display_names=trace_names.name_to_name_map):
+    """
+    Returns the profile of every trace as one DataFrame with columns hour_of_week (or hour_of_day), avg(count) and
+    workload, like hist_df in notebooks 1 and 1b.
+    """
+    if offsets is None:
+        offsets = week_offsets if period == hours_in_a_week else day_offsets
+
+    frames = []
+    for trace_name, hourly in hourly_counts_per_trace(traces_location, min_duration, catalog, processes).items():
+        workload_name = trace_names.folder_name_to_display_name(trace_name, display_names)
+        frames.append(profile_frame(hourly, period, trace_offset(trace_name, offsets), workload_name))
+
+    if len(frames) == 0:
+        return profile_frame(HourlyCounts(), period, 0, "")
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,147 @@
+"""
+Builds the task-arrival time series used by the Hurst parameter analysis (notebook 2).
+
+ts_submit is streamed once per trace. Submissions are counted at the finest time scale with np.bincount, and every
+coarser scale is derived from those counts by reshaping and summing. The series are dense: periods without submissions
+are stored as zeros, so no gap filling is needed afterwards. They are written as .npy files next to each other, one per
+time scale, and read back memory-mapped (see columnar_store).
+"""
+
+import os
+import sys
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+import columnar_store
+import trace_reader
+
+# 100ms, 500ms, 1s, 5s, 10s, 50s, 100s, 500s, 1000s (16.6min.)
+time_scales = [100, 500, 1000, 1000*5, 1000*10, 1000*50, 1000*100, 1000*500, 1000*1000]
+num_samples = [10, 10, 10, 10, 1, 1, 1, 1, 1]
+size_of_sample = 500
+
+six_days_in_milliseconds = 1000*60*60*24*6
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+def read_submit_times(trace_location):
+    return trace_reader.read_column(trace_location, "ts_submit", dtype=np.int64)
+
+
+def _finest_resolution(scales, lengths):
+    if lengths is None:
+        lengths = [samples * size_of_sample for samples in num_samples]
+    base = reduce(_gcd, scales)
+    factors = [scale // base for scale in scales]
+    finest_length = max(factor * length for factor, length in zip(factors, lengths))
+    return base, factors, lengths, finest_length
+
+
+def _count_finest(ts_submit, base, finest_length):
+    ts_submit = np.asarray(ts_submit)
+    ts_submit = ts_submit[(ts_submit >= 0) & (ts_submit < finest_length * base)]
+    return np.bincount((ts_submit // base).astype(np.int64), minlength=finest_length)
+
+
+def _coarsen(finest, factors, lengths):
+    return [finest[:factor * length].reshape(length, factor).sum(axis=1)
+            for factor, length in zip(factors, lengths)]
+
+
+def multi_scale_counts(ts_submit, scales=time_scales, lengths=None):
+    """
+    Returns a list with, for every time scale, the number of submissions in each of the first lengths[i] periods
+    floor(ts_submit / scale). By default every scale gets num_samples[i] * size_of_sample periods.
+    """
+    base, factors, lengths, finest_length = _finest_resolution(scales, lengths)
+    return _coarsen(_count_finest(ts_submit, base, finest_length), factors, lengths)
+
+
+def trace_multi_scale_counts(trace_location, scales=time_scales, lengths=None):
+    """
+    Same as multi_scale_counts, but streams ts_submit from the trace. Only submissions inside the longest requested
+    period are read, the rest is filtered out by the Parquet reader.
+    """
+    base, factors, lengths, finest_length = _finest_resolution(scales, lengths)
+    ts_submit = ds.field("ts_submit")
+    finest = np.zeros(finest_length, dtype=np.int64)
+    for batch in trace_reader.iter_batches(trace_location, ["ts_submit"],
+                                           filter=(ts_submit >= 0) & (ts_submit < finest_length * base)):
+        finest += _count_finest(batch.column(0).to_numpy(), base, finest_length)
+    return _coarsen(finest, factors, lengths)
+
+
+def series_file_name(time_scale, samples, sample_size=size_of_sample):
+    return "time_scale={}&num_samples={}&sample_size={}.npy".format(time_scale, samples, sample_size)
+
+
+def write_series(output_location, counts_per_scale, scales=time_scales, samples_per_scale=num_samples,
+                 sample_size=size_of_sample):
+    for counts, time_scale, samples in zip(counts_per_scale, scales, samples_per_scale):
+        columnar_store.save_array(os.path.join(output_location, series_file_name(time_scale, samples, sample_size)),
+                                  counts.astype(np.int64))
+
+
+def read_series(output_location, time_scale, samples, sample_size=size_of_sample, mmap=True):
+    return columnar_store.load_array(os.path.join(output_location, series_file_name(time_scale, samples, sample_size)),
+                                     mmap=mmap)
+
+
+def sample_windows(counts, samples, sample_size=size_of_sample, skip_empty=True):
+    """
+    Splits a series into a (samples, sample_size) batch of consecutive windows. Windows without any submission are
+    dropped, as in the original per-sample loop.
+    """
+    windows = np.asarray(counts)[:samples * sample_size].reshape(samples, sample_size)
+    if skip_empty:
+        windows = windows[windows.sum(axis=1) > 0]
+    return windows
+
+
+def fill_missing_periods(dataset, total_entries=100, column="time_period"):
+    """
+    Vectorized fill_in_missing_entries of notebook 2: the sparse per-period counts of a Spark groupby as a dense frame
+    of total_entries consecutive periods from the first one, with zeros for the periods without submissions.
+    """
+    if dataset.shape[0] >= total_entries:
+        return dataset.sort_values(column).reset_index(drop=True).loc[0:total_entries, :]
+
+    start = dataset[column].min()
+    if np.isnan(start):
+        start = 0
+    filled = pd.DataFrame(np.zeros((total_entries, dataset.shape[1])), columns=dataset.columns.tolist(),
+                          dtype=np.float64)
+    filled[column] = float(start) + np.arange(total_entries)
+
+    positions = (dataset[column].values - start).astype(np.int64)
+    present = (positions >= 0) & (positions < total_entries)
+    filled.iloc[positions[present], :] = dataset.values[present].astype(np.float64)
+    return filled
+
+
+def build_series(traces_location, output_location):
+    for workload in sorted(os.listdir(traces_location)):
+        trace_location = os.path.join(traces_location, workload)
+        if not workload.endswith("parquet"):
+            continue
+        if not trace_reader.do_tasks_exist(trace_location):
+            continue
+        if not trace_reader.is_trace_long_enough(trace_location, six_days_in_milliseconds):
+            continue
+
+        write_series(os.path.join(output_location, workload), trace_multi_scale_counts(trace_location))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python arrival_series.py <dir with trace directories> <output dir>")
+        sys.exit(1)
+    build_series(sys.argv[1], sys.argv[2])
@@ -0,0 +1,288 @@
+"""
+Times the analysis stages on synthetic traces (see synthetic_traces) of increasing size, and flags regressions against
+stored baselines.
+
+    python benchmarks.py --work <dir> --scales 1e4,1e5,1e6 --stages hurst,structure,regression
+    python benchmarks.py --work <dir> --scales 1e4,1e5,1e6 --update-baseline
+
+For every scale a trace with that many tasks is generated once under <work>/traces/<scale> (it is kept as long as the
+generation parameters stay the same), and the stages are run on it with run_analysis, forced, --repeats times. The
+regression stage fits the workflow interarrival times and task runtimes of the trace, which are written next to it.
+The fastest wall time of every stage is compared with the baseline file: a stage regressed when it is more than
+--tolerance slower and the difference is larger than --min-difference seconds, which keeps tiny stages from being
+flagged for noise. Stage times do not include importing the modules of the stage. The results, the comparison and the
+profile of the hot paths of every scale are written to <work>/benchmark_results.json. The exit status is 1 if a stage
+regressed or failed.
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+import instrumentation
+import run_analysis
+import synthetic_traces
+import trace_names
+import trace_reader
+
+default_scales = [10**4, 10**5, 10**6]
+default_stages = ["catalog", "profiles", "hurst", "structure", "metrics", "cp", "lop", "regression"]
+default_tolerance = 0.25
+default_min_difference = 0.5
+
+baseline_format = 1
+results_file_name = "benchmark_results.json"
+
+
+def benchmark_key(stage_name, scale):
+    return "{}@{}".format(stage_name, scale)
+
+
+def machine():
+    return {"platform": platform.platform(), "processor": platform.processor(),
+            "cpu_count": multiprocessing.cpu_count(), "python": platform.python_version()}
+
+
+def _merge_counts(values, counts, new_values, new_counts):
+    merged, inverse = np.unique(np.concatenate((values, new_values)), return_inverse=True)
+    return merged, np.bincount(inverse, weights=np.concatenate((counts, new_counts))).astype(np.int64)
+
+
+def _write_counts(path, column_name, values, counts):
+    pd.DataFrame({column_name: values, "count": counts}, columns=[column_name, "count"]).to_csv(path, index=False)
+
+
+def write_regression_inputs(trace_location, directory):
+    """
+    Writes interarrival.csv (time between consecutive workflow submissions) and lifetime.csv (task runtimes) as value
+    and count columns, the input format of regression.prepare_datasets. The generated traces are sorted by
+    ts_submit across their files, so the interarrival times are taken batch by batch.
+    """
+    os.makedirs(directory, exist_ok=True)
+    empty = np.zeros(0, dtype=np.int64)
+
+    values, counts = empty, empty
+    previous = None
+    for batch in trace_reader.iter_batches(trace_location, ["ts_submit"], table="workflows"):
+        ts_submit = np.sort(batch.column(0).to_numpy())
+        if previous is not None:
+            ts_submit = np.concatenate(([previous], ts_submit))
+        previous = ts_submit[-1]
+        batch_values, batch_counts = np.unique(np.diff(ts_submit), return_counts=True)
+        values, counts = _merge_counts(values, counts, batch_values, batch_counts)
+    _write_counts(os.path.join(directory, "interarrival.csv"), "interarrival", values, counts)
+
+    values, counts = empty, empty
+    for batch in trace_reader.iter_batches(trace_location, ["runtime"], filter=ds.field("runtime") > 0):
+        batch_values, batch_counts = np.unique(batch.column(0).to_numpy(), return_counts=True)
+        values, counts = _merge_counts(values, counts, batch_values, batch_counts)
+    _write_counts(os.path.join(directory, "lifetime.csv"), "lifetime", values, counts)
+
+
+def prepare_scale(work_location, scale, shape="mixed", seed=0, tasks_per_file=synthetic_traces.default_tasks_per_file,
+                  regression_mode="least_squares"):
+    """
+    Generates the trace of one scale if needed, and the input and configuration of the regression stage. Returns the
+    directory with the trace directory and the path of the regression configuration.
+    """
+    traces_location = os.path.join(work_location, "traces", str(scale))
+    trace_location = os.path.join(traces_location, synthetic_traces.trace_name(scale, shape))
+    parameters = synthetic_traces.generation_parameters(scale, shape, seed=seed, tasks_per_file=tasks_per_file)
+    regression_location = os.path.join(work_location, "regression", str(scale))
+    if synthetic_traces.read_parameters(trace_location) != parameters or not os.path.exists(regression_location):
+        synthetic_traces.generate_trace(trace_location, parameters)
+        write_regression_inputs(trace_location, regression_location)
+
+    config = {
+        "available_data": {"synthetic": OrderedDict([("interarrival", {"filename": "interarrival.csv"}),
+                                                     ("lifetime", {"filename": "lifetime.csv"})])},
+        "source_directory": regression_location,
+        "mode": regression_mode,
+        "render": "sync",
+    }
+    config_location = os.path.join(regression_location, "regression_config.json")
+    with open(config_location, "w") as f:
+        json.dump(config, f, indent=2)
+    return traces_location, config_location
+
+
+@contextmanager
+def synthetic_trace_names():
+    """
+    Gives the synthetic traces a domain and source in trace_names while the stages run, so that the cp and lop stages
+    can group them. The maps of trace_names themselves only know the real traces.
+    """
+    prefix = synthetic_traces.trace_prefix
+    mappings = [trace_names.name_to_domain_map, trace_names.name_to_source_map]
+    prefix_lists = [trace_names.has_cp_info, trace_names.trace_has_structural_information]
+    for mapping in mappings:
+        mapping[prefix] = "Synthetic"
+    for prefixes in prefix_lists:
+        prefixes.append(prefix)
+    try:
+        yield
+    finally:
+        for mapping in mappings:
+            del mapping[prefix]
+        for prefixes in prefix_lists:
+            prefixes.remove(prefix)
+
+
+def import_stage_modules(stage_names):
+    # Imported here, the modules are inherited by the forked stage processes, so a stage's time does not depend on
+    # whether an earlier stage already paid for importing scipy or plotnine.
+    for stage_name in run_analysis.with_dependencies(stage_names):
+        for source in run_analysis.stages[stage_name].sources:
+            importlib.import_module(os.path.splitext(source)[0].replace(os.sep, "."))
+
+
+def run_scale(work_location, scale, stage_names, repeats=1, processes=None, **kwargs):
+    """
+    Runs the stages on the trace of one scale. Returns (results, profile): per benchmark key the status and the
+    fastest wall and CPU time, and the summary of the spans recorded in the last repeat.
+    """
+    traces_location, config_location = prepare_scale(work_location, scale, **kwargs)
+    context = {
+        "traces": traces_location,
+        "output": os.path.join(work_location, "output", str(scale)),
+        "processes": processes,
+        "regression_config": config_location,
+        "profile": True,
+    }
+    os.makedirs(context["output"], exist_ok=True)
+    import_stage_modules(stage_names)
+
+    results = OrderedDict()
+    for _ in range(repeats):
+        instrumentation.reset()
+        with synthetic_trace_names():
+            timings = run_analysis.run(context, stage_names, force=True)
+        for stage_name, timing in timings.items():
+            key = benchmark_key(stage_name, scale)
+            previous = results.get(key)
+            if timing["status"] != "ran":
+                results[key] = {"status": timing["status"], "error": timing.get("error")}
+            elif previous is None or (previous["status"] == "ran" and timing["wall_time"] < previous["wall_time"]):
+                results[key] = {"status": "ran", "wall_time": timing["wall_time"], "cpu_time": timing["cpu_time"]}
+    return results, instrumentation.summary()
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    return stored if stored.get("format") == baseline_format else None
+
+
+def save_baseline(path, results, baseline=None):
+    # Measured benchmarks replace their baseline, the others are kept.
+    stored = {"format": baseline_format, "machine": machine(),
+              "results": dict(baseline["results"]) if baseline is not None else {}}
+    for key, result in results.items():
+        if result["status"] == "ran":
+            stored["results"][key] = {"wall_time": result["wall_time"], "cpu_time": result["cpu_time"]}
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(stored, f, indent=2, sort_keys=True)
+    os.replace(temporary_path, path)
+
+
+def compare(results, baseline, tolerance=default_tolerance, min_difference=default_min_difference):
+    """
+    Returns a DataFrame with, for every benchmark, its baseline and current wall time, their ratio and a status:
+    regression, improved, ok, new (no baseline) or failed.
+    """
+    baseline_results = baseline["results"] if baseline is not None else {}
+    rows = []
+    for key, result in results.items():
+        expected = baseline_results.get(key, {}).get("wall_time")
+        current = result.get("wall_time")
+        ratio = None
+        if result["status"] != "ran":
+            status = "failed"
+        elif expected is None:
+            status = "new"
+        else:
+            ratio = current / expected if expected > 0 else None
+            difference = current - expected
+            if difference > min_difference and current > expected * (1 + tolerance):
+                status = "regression"
+            elif -difference > min_difference and current < expected / (1 + tolerance):
+                status = "improved"
+            else:
+                status = "ok"
+        rows.append({"benchmark": key, "baseline": expected, "wall_time": current, "ratio": ratio, "status": status})
+    return pd.DataFrame(rows, columns=["benchmark", "baseline", "wall_time", "ratio", "status"])
+
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Benchmark the WTA analyses on synthetic traces.")
+    parser.add_argument("--work", required=True, help="directory for the generated traces and the stage outputs")
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in default_scales),
+                        help="comma separated numbers of tasks, e.g. 1e4,1e6,1e9 (default: %(default)s)")
+    parser.add_argument("--stages", default=",".join(default_stages),
+                        help="comma separated stages, dependencies are added (default: %(default)s)")
+    parser.add_argument("--shape", default="mixed", choices=synthetic_traces.shape_choices,
+                        help="workflow shape of the traces")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the trace generator")
+    parser.add_argument("--tasks-per-file", type=int, default=synthetic_traces.default_tasks_per_file,
+                        help="tasks per generated Parquet file")
+    parser.add_argument("--regression-mode", default="least_squares", help="fitting mode of the regression stage")
+    parser.add_argument("--repeats", type=int, default=1, help="runs per scale, the fastest one counts")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="processes per stage for per-trace work (default: number of CPUs)")
+    parser.add_argument("--baseline", default="benchmark_baselines.json", help="baseline file (default: %(default)s)")
+    parser.add_argument("--update-baseline", action="store_true", help="store the measured times as the baseline")
+    parser.add_argument("--tolerance", type=float, default=default_tolerance,
+                        help="relative slowdown that counts as a regression (default: %(default)s)")
+    parser.add_argument("--min-difference", type=float, default=default_min_difference,
+                        help="smallest slowdown in seconds that counts as a regression (default: %(default)s)")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    arguments = parse_arguments(sys.argv[1:] if arguments is None else arguments)
+    work_location = os.path.abspath(arguments.work)
+    scales = [int(float(scale)) for scale in arguments.scales.split(",") if scale.strip()]
+    stage_names = [stage_name.strip() for stage_name in arguments.stages.split(",") if stage_name.strip()]
+
+    results = OrderedDict()
+    profiles = OrderedDict()
+    for scale in scales:
+        print("Scale: {} tasks".format(scale))
+        scale_results, profile = run_scale(work_location, scale, stage_names, repeats=arguments.repeats,
+                                           processes=arguments.processes, shape=arguments.shape, seed=arguments.seed,
+                                           tasks_per_file=arguments.tasks_per_file,
+                                           regression_mode=arguments.regression_mode)
+        results.update(scale_results)
+        profiles[str(scale)] = profile.to_dict(orient="records")
+
+    baseline = load_baseline(arguments.baseline)
+    if baseline is not None and baseline["machine"] != machine():
+        print("The baseline was measured on another machine: {}".format(baseline["machine"]))
+    comparison = compare(results, baseline, arguments.tolerance, arguments.min_difference)
+    print(comparison.to_string(index=False))
+
+    with open(os.path.join(work_location, results_file_name), "w") as f:
+        json.dump({"machine": machine(), "results": results, "comparison": comparison.to_dict(orient="records"),
+                   "profiles": profiles}, f, indent=2, default=str)
+    if arguments.update_baseline:
+        save_baseline(arguments.baseline, results, baseline)
+
+    return 1 if comparison["status"].isin(["regression", "failed"]).any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+Bootstrap confidence intervals for the fitted distribution parameters, and how stable the choice of the best fitting
+distribution is.
+
+The rebinned histogram of a feature is resampled multinomially, a whole batch of resamples in one call, and every
+candidate is refitted on every resample, starting from its original parameters. Warm-started fits of data that is
+close to the original converge in a few iterations, so a refit is much cheaper than the cold fit. Resamples are drawn
+in rounds and the refits of a round are spread over a process pool. After every round the percentile intervals of the
+parameters and the frequencies with which each candidate fits best (lowest KS distance) are compared with those of
+the previous round, and the bootstrap stops once none of them moves by more than the tolerance.
+"""
+
+import json
+import multiprocessing
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+
+import dist_functions
+import fit_metrics
+import fit_scheduler
+import instrumentation
+import mle_fitting
+
+default_max_resamples = 1000
+default_min_resamples = 100
+default_round_size = 100
+default_tolerance = 0.05
+default_confidence = 0.95
+default_maxfev = 2000
+default_timeout = 10
+
+
+def bootstrap_location(fileprefix, regression_type, weight_nature):
+    return "{}_{}_{}_bootstrap.json".format(fileprefix, regression_type, weight_nature)
+
+
+def histogram_totals(dataset):
+    """
+    Returns (total, dropped): the number of observations the normalized dataset was computed from, and how many of
+    them are in rows that normalize_count dropped (the first bin). The pdf column is count / total.
+    """
+    counts = dataset["count"].values.astype(np.float64)
+    pdf = dataset["pdf"].values
+    total = int(round(counts[0] / pdf[0])) if counts.shape[0] > 0 and pdf[0] > 0 else int(counts.sum())
+    return total, max(total - int(counts.sum()), 0)
+
+
+def resample_counts(counts, dropped, num_resamples, rng):
+    """
+    Draws num_resamples multinomial resamples of the histogram counts plus the dropped observations. Returns the
+    resampled counts (num_resamples, len(counts)) and the resampled number of dropped observations.
+    """
+    weights = np.append(np.asarray(counts, dtype=np.float64), float(dropped))
+    resampled = rng.multinomial(int(weights.sum()), weights / weights.sum(), size=num_resamples)
+    return resampled[:, :-1], resampled[:, -1]
+
+
+def observed_curves(resampled, dropped, total):
+    # pdf, cdf and survival of resampled histograms, normalized like normalize_count.
+    pdf = resampled / float(total)
+    cdf = dropped[:, np.newaxis] / float(total) + np.cumsum(pdf, axis=1)
+    return pdf, cdf, 1 - cdf
+
+
+def _refit_chunk(task):
+    """
+    Refits one candidate on a chunk of resamples. Returns an array with one row of parameters per resample, NaN where
+    the refit failed.
+    """
+    kind, target, x, rows, sigma, popt, maxfev, timeout = task
+    popts = np.full((rows.shape[0], len(popt)), np.nan)
+    with instrumentation.span("bootstrap_refit", rows=rows.shape[0], kind=kind):
+        for index, row in enumerate(rows):
+            if kind == "mle":
+                result = fit_scheduler.run_fit(mle_fitting.fit_binned, (target, x, row), {"p0": popt},
+                                               timeout=timeout)
+            else:
+                result = fit_scheduler.run_fit(fit_scheduler.fit_function, (target, x, row),
+                                               {"sigma": sigma, "maxfev": maxfev, "p0": popt}, timeout=timeout)
+            if result.popt is not None:
+                popts[index] = result.popt
+    return popts
+
+
+def _chunks(rows, num_chunks):
+    return [chunk for chunk in np.array_split(rows, max(num_chunks, 1)) if chunk.shape[0] > 0]
+
+
+def ks_distances(dist_name, x, popts, observed_cdf):
+    """
+    KS distance between every resampled cdf and the curve refitted on it, over the points where the curve is valid.
+    """
+    curves = dist_functions.evaluate(dist_name, x, popts, ["pdf", "cdf", "sf"])
+    mask = fit_metrics.valid_mask(curves["pdf"], curves["sf"])
+    with np.errstate(invalid="ignore"):
+        distances = np.max(np.where(mask, np.abs(observed_cdf - curves["cdf"]), 0), axis=1)
+    return np.where(np.any(np.isnan(popts), axis=1) | ~np.any(mask, axis=1), np.nan, distances)
+
+
+def _intervals(values, confidence):
+    tail = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        # Columns without a single successful refit give NaN.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        lower, median, upper = np.nanpercentile(values, [tail, 50, 100 - tail], axis=0)
+    return lower, median, upper
+
+
+def selection_frequencies(distances):
+    # Fraction of the resamples in which each candidate (column) has the lowest KS distance.
+    distances = np.where(np.isnan(distances), np.inf, distances)
+    fitted = np.isfinite(distances).any(axis=1)
+    best = np.argmin(distances, axis=1)[fitted]
+    return np.bincount(best, minlength=distances.shape[1]) / float(max(fitted.sum(), 1))
+
+
+def _converged(previous, current, tolerance):
+    if previous is None:
+        return False
+    previous_widths, previous_selection = previous
+    widths, selection = current
+    with np.errstate(divide="ignore", invalid="ignore"):
+        changes = np.abs(widths - previous_widths) / np.abs(previous_widths)
+    changes = changes[np.isfinite(changes)]
+    return (changes.shape[0] == 0 or changes.max() <= tolerance) and \
+        np.max(np.abs(selection - previous_selection)) <= tolerance
+
+
+def bootstrap_fits(dataset, fits, functions=None, mode="least_squares", regression_type="survival",
+                   weight_nature="unweighted", processes=None, max_resamples=default_max_resamples,
+                   min_resamples=default_min_resamples, round_size=default_round_size, tolerance=default_tolerance,
+                   confidence=default_confidence, seed=0, maxfev=default_maxfev, timeout=default_timeout):
+    """
+    Bootstraps the fits of one dataset. fits maps dist_name to the FitResult of the original fit, functions maps
+    dist_name to the function curve_fit fits (unused with mode "mle"). Returns an OrderedDict with the number of
+    resamples, whether the intervals converged, the selection frequencies and, per candidate, the original
+    parameters, their standard errors from pcov and the bootstrap intervals of the parameters and of the KS distance.
+    """
+    feature_column_name = dataset.columns[0]
+    x = dataset[feature_column_name].values.astype(np.float64)
+    counts = dataset["count"].values
+    total, dropped = histogram_totals(dataset)
+    sigma = dataset["weight"].values.astype(np.float64) if weight_nature == "weighted" else None
+    candidates = [dist_name for dist_name, fit in fits.items() if fit is not None and fit.popt is not None]
+    rng = np.random.RandomState(seed)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes=processes) if processes > 1 and len(candidates) > 0 else None
+
+    popts = dict((dist_name, np.zeros((0, len(fits[dist_name].popt)))) for dist_name in candidates)
+    distances = np.zeros((0, len(candidates)))
+    previous = None
+    converged = False
+    try:
+        while distances.shape[0] < max_resamples and len(candidates) > 0:
+            size = min(round_size, max_resamples - distances.shape[0])
+            resampled, resampled_dropped = resample_counts(counts, dropped, size, rng)
+            pdf, cdf, survival = observed_curves(resampled, resampled_dropped, total)
+
+            tasks = []
+            owners = []
+            for dist_name in candidates:
+                if mode == "mle":
+                    kind, target, rows = "mle", dist_name, resampled
+                else:
+                    kind, target = "least_squares", functions[dist_name]
+                    rows = survival if regression_type == "survival" else pdf
+                popt = np.asarray(fits[dist_name].popt, dtype=np.float64)
+                for chunk in _chunks(rows, processes):
+                    tasks.append((kind, target, x, chunk, sigma, popt, maxfev, timeout))
+                    owners.append(dist_name)
+
+            if pool is None:
+                results = [_refit_chunk(task) for task in tasks]
+            else:
+                results = instrumentation.pool_map(pool, _refit_chunk, tasks)
+
+            round_distances = []
+            for dist_name in candidates:
+                refitted = np.vstack([result for owner, result in zip(owners, results) if owner == dist_name])
+                popts[dist_name] = np.vstack((popts[dist_name], refitted))
+                round_distances.append(ks_distances(dist_name, x, refitted, cdf))
+            distances = np.vstack((distances, np.column_stack(round_distances)))
+
+            lower_upper = [_intervals(popts[dist_name], confidence) for dist_name in candidates]
+            current = (np.concatenate([upper - lower for lower, _, upper in lower_upper]),
+                       selection_frequencies(distances))
+            if distances.shape[0] >= min_resamples and _converged(previous, current, tolerance):
+                converged = True
+                break
+            previous = current
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    result = OrderedDict([
+        ("resamples", int(distances.shape[0])),
+        ("converged", converged),
+        ("confidence", confidence),
+        ("selection", OrderedDict(zip(candidates, selection_frequencies(distances).tolist())
+                                  if distances.shape[0] > 0 else [])),
+        ("distributions", OrderedDict()),
+    ])
+    for index, dist_name in enumerate(candidates):
+        fit = fits[dist_name]
+        lower, median, upper = _intervals(popts[dist_name], confidence)
+        ks_lower, ks_median, ks_upper = _intervals(distances[:, [index]], confidence)
+        stderr = None if fit.pcov is None else np.sqrt(np.abs(np.diag(np.asarray(fit.pcov, dtype=np.float64))))
+        result["distributions"][dist_name] = OrderedDict([
+            ("popt", np.asarray(fit.popt, dtype=np.float64).tolist()),
+            ("stderr", None if stderr is None else stderr.tolist()),
+            ("lower", lower.tolist()),
+            ("median", median.tolist()),
+            ("upper", upper.tolist()),
+            ("failures", int(np.any(np.isnan(popts[dist_name]), axis=1).sum())),
+            ("ks_dist", OrderedDict([("lower", float(ks_lower[0])), ("median", float(ks_median[0])),
+                                     ("upper", float(ks_upper[0]))])),
+        ])
+    return result
+
+
+def _json_value(value):
+    # NaN and infinite values, e.g. the interval of a parameter that never refitted, are stored as null.
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return OrderedDict((key, _json_value(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_json_value(item) for item in value]
+    return value
+
+
+def store_bootstrap(result, fileprefix, regression_type, weight_nature):
+    with open(bootstrap_location(fileprefix, regression_type, weight_nature), "w") as f:
+        json.dump(_json_value(result), f, indent=2)
@@ -0,0 +1,484 @@
+"""
+Streaming version of the burstiness analysis of notebook 2, for live task-submission feeds.
+
+The monitor consumes ts_submit values (milliseconds, one per line; further comma separated fields are ignored) from a
+file that is appended to, or from clients connected to a local TCP or Unix socket. For every time scale of
+arrival_series it keeps a ring of the submission counts of the last num_samples * size_of_sample periods, so memory
+does not grow with the stream. Submissions arriving late are still counted while their period is in the ring, older
+ones are dropped and counted as late. Periods only become part of the series once a submission of a later period has
+been seen, and only periods from the first submission on are used.
+
+At most every --interval seconds the estimates of the scales whose counts changed are recomputed from the complete
+periods in their rings and published:
+
+- the Hurst parameter (rescaled range, as in the offline analysis) averaged over the most recent complete windows of
+  size_of_sample periods, with its confidence interval,
+- the index of dispersion for counts (variance over mean of the counts per period; 1 for Poisson arrivals),
+- the peak-to-mean ratio (largest count per period over the mean count).
+
+Every publication is a JSON line on stdout or in --output, and --snapshot is atomically replaced with the latest one.
+A recorded trace can be replayed as a stand-in for the scheduler, as fast as possible or at a multiple of real time:
+
+    python burstiness_monitor.py monitor --listen 127.0.0.1:9123 --snapshot burstiness.json
+    python burstiness_monitor.py replay <trace dir> --connect 127.0.0.1:9123 --speedup 600
+
+    python burstiness_monitor.py monitor --file submissions.log --idle-exit 5 --output burstiness.jsonl
+    python burstiness_monitor.py replay <trace dir> --file submissions.log --speedup 0
+"""
+
+import argparse
+import json
+import os
+import selectors
+import socket
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import arrival_series
+import hurst_estimators
+import instrumentation
+import trace_reader
+
+default_interval = 1.0
+default_poll_interval = 0.05
+default_speedup = 1.0
+default_confidence = 0.95
+read_size = 1 << 20
+replay_batch_size = 100000
+
+
+class CountRing(object):
+    """
+    Submission counts of the last length periods of one time scale. Period p is stored at p % length, head is the
+    latest period seen.
+    """
+
+    def __init__(self, time_scale, length):
+        self.time_scale = time_scale
+        self.counts = np.zeros(length, dtype=np.int64)
+        self.head = None
+        self.first = None
+        self.late = 0
+
+    def add(self, ts_submit):
+        if ts_submit.shape[0] == 0:
+            return False
+        length = self.counts.shape[0]
+        periods = ts_submit // self.time_scale
+        latest = int(periods.max())
+        if self.head is not None:
+            self.late += int((periods <= self.head - length).sum())
+        if self.head is None:
+            self.head = latest
+        elif latest > self.head:
+            if latest - self.head >= length:
+                self.counts[:] = 0
+            else:
+                self.counts[np.arange(self.head + 1, latest + 1) % length] = 0
+            self.head = latest
+
+        # Submissions of periods that already left the ring are late, the ones the batch itself pushed out are not.
+        kept = periods[periods > self.head - length]
+        if kept.shape[0] == 0:
+            return False
+        earliest = int(kept.min())
+        self.first = earliest if self.first is None else min(self.first, earliest)
+        self.counts += np.bincount(kept % length, minlength=length)
+        return True
+
+    def complete_counts(self):
+        # The counts of the complete periods in the ring, oldest first. The period at head is still filling up.
+        if self.head is None:
+            return np.zeros(0, dtype=np.int64)
+        start = max(self.first, self.head - self.counts.shape[0] + 1)
+        return self.counts[np.arange(start, self.head) % self.counts.shape[0]]
+
+
+def burstiness(counts, samples, sample_size=arrival_series.size_of_sample, confidence=default_confidence):
+    """
+    Estimates of one series of counts per period: the Hurst parameter of its last (at most samples) complete windows
+    of sample_size periods, and the index of dispersion and peak-to-mean ratio of the whole series.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    windows = min(counts.shape[0] // sample_size, samples)
+    estimate = hurst_estimators.HurstEstimate(np.nan, np.nan, np.nan, np.nan, np.nan)
+    if windows > 0:
+        batch = arrival_series.sample_windows(counts[counts.shape[0] - windows * sample_size:], windows, sample_size)
+        windows = batch.shape[0]
+        if windows > 0:
+            estimate = hurst_estimators.combine_samples(hurst_estimators.rescaled_range(batch), confidence)
+
+    mean = counts.mean() if counts.shape[0] > 0 else np.nan
+    dispersion = counts.var(ddof=1) / mean if counts.shape[0] > 1 and mean > 0 else np.nan
+    peak_to_mean = counts.max() / mean if counts.shape[0] > 0 and mean > 0 else np.nan
+    return OrderedDict([
+        ("periods", int(counts.shape[0])),
+        ("windows", int(windows)),
+        ("mean", mean),
+        ("hurst_parameter", estimate.hurst),
+        ("stderr", estimate.stderr),
+        ("lower", estimate.lower),
+        ("upper", estimate.upper),
+        ("index_of_dispersion", dispersion),
+        ("peak_to_mean", peak_to_mean),
+    ])
+
+
+class BurstinessMonitor(object):
+
+    def __init__(self, scales=arrival_series.time_scales, samples_per_scale=arrival_series.num_samples,
+                 sample_size=arrival_series.size_of_sample, confidence=default_confidence):
+        self.samples_per_scale = samples_per_scale
+        self.sample_size = sample_size
+        self.confidence = confidence
+        # One period more than the windows need, for the period that is still filling up.
+        self.rings = [CountRing(scale, samples * sample_size + 1) for scale, samples in zip(scales, samples_per_scale)]
+        self.estimates = [None] * len(self.rings)
+        self.changed = [False] * len(self.rings)
+        self.events = 0
+        self.invalid = 0
+        self.latest = None
+
+    def add(self, ts_submit):
+        ts_submit = np.asarray(ts_submit, dtype=np.int64)
+        valid = ts_submit >= 0
+        self.invalid += ts_submit.shape[0] - int(valid.sum())
+        ts_submit = ts_submit[valid]
+        self.events += ts_submit.shape[0]
+        if ts_submit.shape[0] > 0:
+            latest = int(ts_submit.max())
+            self.latest = latest if self.latest is None else max(self.latest, latest)
+        for index, ring in enumerate(self.rings):
+            if ring.add(ts_submit):
+                self.changed[index] = True
+
+    def update(self):
+        """
+        Recomputes the estimates of the scales whose counts changed. Returns whether any of them did.
+        """
+        changed = [index for index, flag in enumerate(self.changed) if flag]
+        with instrumentation.span("burstiness_estimates", scales=len(changed)):
+            for index in changed:
+                ring = self.rings[index]
+                self.estimates[index] = burstiness(ring.complete_counts(), self.samples_per_scale[index],
+                                                   self.sample_size, self.confidence)
+                self.changed[index] = False
+        return len(changed) > 0
+
+    def record(self):
+        scales = []
+        for ring, estimate in zip(self.rings, self.estimates):
+            if estimate is None:
+                continue
+            scale = OrderedDict([("window_size", ring.time_scale)])
+            scale.update(estimate)
+            scale["late"] = ring.late
+            scales.append(scale)
+        return OrderedDict([
+            ("time", time.time()),
+            ("ts_submit", self.latest),
+            ("events", self.events),
+            ("invalid", self.invalid),
+            ("scales", scales),
+        ])
+
+
+def parse_submit_times(lines):
+    """
+    Returns (ts_submit, invalid) of a batch of lines: the first field of every line as an integer, and the number of
+    lines that are not a number, such as a CSV header. Empty lines are skipped.
+    """
+    values = []
+    invalid = 0
+    for line in lines:
+        field = line.split(b",", 1)[0].strip()
+        if not field:
+            continue
+        try:
+            values.append(int(field))
+        except ValueError:
+            try:
+                values.append(int(float(field)))
+            except ValueError:
+                invalid += 1
+    return np.array(values, dtype=np.int64), invalid
+
+
+def _split_lines(pending, data):
+    # Complete lines of pending + data, and the incomplete rest.
+    complete, _, rest = (pending + data).rpartition(b"\n")
+    return (complete.split(b"\n") if complete else []), rest
+
+
+def tail_batches(path, poll_interval=default_poll_interval, from_start=True):
+    """
+    Yields the lines appended to a file, in batches, like tail -F: the file is reopened from its start when it is
+    replaced or truncated, and may not exist yet. Yields an empty batch after every poll_interval without new lines.
+    """
+    f = None
+    inode = None
+    pending = b""
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, "rb")
+                except (IOError, OSError):
+                    yield []
+                    time.sleep(poll_interval)
+                    continue
+                inode = os.fstat(f.fileno()).st_ino
+                if not from_start:
+                    f.seek(0, os.SEEK_END)
+                from_start = True
+
+            data = f.read(read_size)
+            if data:
+                lines, pending = _split_lines(pending, data)
+                yield lines
+                continue
+
+            try:
+                stat = os.stat(path)
+            except (IOError, OSError):
+                stat = None
+            if stat is None or stat.st_ino != inode or stat.st_size < f.tell():
+                f.close()
+                f = None
+                pending = b""
+            yield []
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def parse_address(address):
+    # "unix:<path>" for a Unix socket, "[host:]port" for TCP, on localhost by default.
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def socket_batches(address, poll_interval=default_poll_interval):
+    """
+    Listens on a local socket and yields the lines sent by any number of clients, in batches. Yields an empty batch
+    after every poll_interval without new lines.
+    """
+    family, target = parse_address(address)
+    server = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_UNIX:
+        if os.path.exists(target):
+            os.remove(target)
+    else:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(target)
+    server.listen(16)
+    server.setblocking(False)
+
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    pending = {}
+    try:
+        while True:
+            lines = []
+            for key, _ in selector.select(poll_interval):
+                if key.fileobj is server:
+                    connection, _ = server.accept()
+                    connection.setblocking(False)
+                    selector.register(connection, selectors.EVENT_READ)
+                    pending[connection] = b""
+                    continue
+                connection = key.fileobj
+                try:
+                    data = connection.recv(read_size)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except (IOError, OSError):
+                    data = b""
+                if data:
+                    new_lines, pending[connection] = _split_lines(pending[connection], data)
+                    lines.extend(new_lines)
+                else:
+                    selector.unregister(connection)
+                    connection.close()
+                    lines.append(pending.pop(connection))
+            yield lines
+    finally:
+        for connection in pending:
+            connection.close()
+        selector.close()
+        server.close()
+        if family == socket.AF_UNIX and os.path.exists(target):
+            os.remove(target)
+
+
+class Publisher(object):
+    """
+    Writes every record as a JSON line to stream, and atomically replaces snapshot_location with the latest one.
+    """
+
+    def __init__(self, stream=None, snapshot_location=None):
+        self.stream = stream
+        self.snapshot_location = snapshot_location
+
+    def publish(self, record):
+        line = json.dumps(_json_value(record))
+        if self.stream is not None:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+        if self.snapshot_location is not None:
+            temporary_path = self.snapshot_location + ".tmp"
+            with open(temporary_path, "w") as f:
+                f.write(line + "\n")
+            os.replace(temporary_path, self.snapshot_location)
+
+
+def _json_value(value):
+    # numpy scalars as Python numbers, NaN (no estimate yet) as null.
+    if isinstance(value, dict):
+        return OrderedDict((key, _json_value(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_json_value(item) for item in value]
+    if isinstance(value, (np.integer, np.floating)):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def run_monitor(batches, monitor, publisher, interval=default_interval, idle_exit=None):
+    """
+    Feeds the batches of lines to the monitor and publishes its estimates at most every interval seconds, when they
+    changed. Stops when the batches end or, with idle_exit, when no line came for idle_exit seconds after the first one.
+    """
+    last_publication = None
+    last_line = None
+    for lines in batches:
+        now = time.time()
+        if len(lines) > 0:
+            ts_submit, invalid = parse_submit_times(lines)
+            monitor.invalid += invalid
+            monitor.add(ts_submit)
+            last_line = now
+        idle = idle_exit is not None and last_line is not None and now - last_line >= idle_exit
+        if (last_publication is None or now - last_publication >= interval or idle) and monitor.update():
+            publisher.publish(monitor.record())
+            last_publication = now
+        if idle:
+            break
+    if monitor.update():
+        publisher.publish(monitor.record())
+    return monitor
+
+
+def recorded_submit_times(trace_location):
+    ts_submit = trace_reader.read_column(trace_location, "ts_submit")
+    if ts_submit.dtype.kind == "f":
+        ts_submit = ts_submit[np.isfinite(ts_submit)]
+    return np.sort(ts_submit.astype(np.int64))
+
+
+def _sink(file_location=None, address=None):
+    if file_location is not None:
+        f = open(file_location, "ab")
+        return f.write, f.flush, f.close
+    family, target = parse_address(address)
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    connection.connect(target)
+    return connection.sendall, lambda: None, connection.close
+
+
+def replay(trace_location, file_location=None, address=None, speedup=default_speedup, offset=None):
+    """
+    Sends the ts_submit of a recorded trace, in order, to a file or a socket the monitor reads, as a stand-in for a
+    live scheduler. With speedup s, the submissions of s milliseconds of the trace are sent per millisecond, and with
+    speedup 0 as fast as possible. offset is added to every ts_submit. Returns the number of submissions sent.
+    """
+    ts_submit = recorded_submit_times(trace_location)
+    if offset is not None:
+        ts_submit = ts_submit + offset
+    write, flush, close = _sink(file_location, address)
+    sent = 0
+    start = time.time()
+    try:
+        while sent < ts_submit.shape[0]:
+            if speedup > 0:
+                replayed = ts_submit[0] + (time.time() - start) * 1000 * speedup
+                end = int(np.searchsorted(ts_submit, replayed, side="right"))
+                end = min(end, sent + replay_batch_size)
+            else:
+                end = min(sent + replay_batch_size, ts_submit.shape[0])
+            if end > sent:
+                write(("\n".join(str(value) for value in ts_submit[sent:end].tolist()) + "\n").encode())
+                flush()
+                sent = end
+            elif speedup > 0:
+                time.sleep(min(default_poll_interval, (ts_submit[sent] - replayed) / 1000.0 / speedup))
+    finally:
+        close()
+    return sent
+
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Monitor the burstiness of a live task-submission feed.")
+    commands = parser.add_subparsers(dest="command")
+
+    monitor_parser = commands.add_parser("monitor", help="consume ts_submit values and publish the estimates")
+    source = monitor_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="file the ts_submit values are appended to")
+    source.add_argument("--listen", help="local socket to accept ts_submit values on, [host:]port or unix:<path>")
+    monitor_parser.add_argument("--from-end", action="store_true",
+                                help="only consume lines appended to --file after the monitor started")
+    monitor_parser.add_argument("--output", help="file to append the published JSON lines to (default: stdout)")
+    monitor_parser.add_argument("--snapshot", help="file that always holds the latest publication")
+    monitor_parser.add_argument("--interval", type=float, default=default_interval,
+                                help="seconds between publications (default: %(default)s)")
+    monitor_parser.add_argument("--poll-interval", type=float, default=default_poll_interval,
+                                help="seconds to wait for new lines (default: %(default)s)")
+    monitor_parser.add_argument("--idle-exit", type=float, default=None,
+                                help="stop after this many seconds without new lines, once lines came in")
+
+    replay_parser = commands.add_parser("replay", help="replay the ts_submit of a recorded trace")
+    replay_parser.add_argument("trace", help="trace directory")
+    sink = replay_parser.add_mutually_exclusive_group(required=True)
+    sink.add_argument("--file", help="file to append the ts_submit values to")
+    sink.add_argument("--connect", help="socket of a monitor, [host:]port or unix:<path>")
+    replay_parser.add_argument("--speedup", type=float, default=default_speedup,
+                               help="trace time per wall time, 0 to send as fast as possible (default: %(default)s)")
+    replay_parser.add_argument("--offset", type=int, default=None, help="milliseconds to add to every ts_submit")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    arguments = parse_arguments(sys.argv[1:] if arguments is None else arguments)
+    if arguments.command == "replay":
+        print(replay(arguments.trace, arguments.file, arguments.connect, arguments.speedup, arguments.offset))
+        return 0
+    if arguments.command != "monitor":
+        print("Usage: python burstiness_monitor.py monitor|replay ... (see --help)")
+        return 1
+
+    if arguments.file is not None:
+        batches = tail_batches(arguments.file, arguments.poll_interval, from_start=not arguments.from_end)
+    else:
+        batches = socket_batches(arguments.listen, arguments.poll_interval)
+    stream = sys.stdout if arguments.output is None else open(arguments.output, "a")
+    try:
+        run_monitor(batches, BurstinessMonitor(), Publisher(stream, arguments.snapshot), arguments.interval,
+                    arguments.idle_exit)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        batches.close()
+        if stream is not sys.stdout:
+            stream.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
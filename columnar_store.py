@@ -0,0 +1,144 @@
+"""
+Memory-mapped columnar storage for intermediate arrays, such as the feature histograms of the regression and the
+arrival series of the Hurst analysis.
+
+A store is a directory with one .npy file per column and a store.json holding the column names, the number of rows,
+the column the rows are sorted by and, for stores converted from a CSV file, the size and modification time of that
+file. Columns are opened with np.load(mmap_mode="r"): opening only maps the file, pages are read on demand and shared
+by every process that maps the same store, and sorted stores can be searched and sliced without a copy. Every file is
+written under a temporary name and moved into place, and store.json is written last, so a store is either complete
+or not a store at all.
+"""
+
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+store_format = 1
+meta_file_name = "store.json"
+
+
+def column_location(location, column_name):
+    return os.path.join(location, "{}.npy".format(column_name))
+
+
+def save_array(path, array):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(temporary_path, path)
+
+
+def load_array(path, mmap=True):
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def read_meta(location):
+    try:
+        with open(os.path.join(location, meta_file_name)) as f:
+            meta = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    return meta if meta.get("format") == store_format else None
+
+
+def is_store(location):
+    return os.path.isdir(location) and read_meta(location) is not None
+
+
+def source_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _is_sorted(values):
+    return values.shape[0] < 2 or not np.any(values[1:] < values[:-1])
+
+
+def write_store(location, columns, sort_by=None, source=None):
+    """
+    Writes columns, an OrderedDict of column name to array of equal length, as a store. Rows are sorted by the sort_by
+    column first (stably, NaNs last), unless they already are. source is the path of the file the columns came from.
+    """
+    columns = OrderedDict((name, np.asarray(values)) for name, values in columns.items())
+    lengths = set(values.shape[0] for values in columns.values())
+    if len(lengths) > 1:
+        raise ValueError("Columns of a store must have the same length")
+
+    if sort_by is not None and not _is_sorted(columns[sort_by]):
+        order = np.argsort(columns[sort_by], kind="mergesort")
+        columns = OrderedDict((name, values[order]) for name, values in columns.items())
+
+    os.makedirs(location, exist_ok=True)
+    meta_location = os.path.join(location, meta_file_name)
+    if os.path.exists(meta_location):
+        os.remove(meta_location)
+    for name, values in columns.items():
+        save_array(column_location(location, name), values)
+
+    meta = {
+        "format": store_format,
+        "columns": list(columns),
+        "rows": lengths.pop() if lengths else 0,
+        "sorted_by": sort_by,
+        "source": None if source is None else [os.path.abspath(source)] + source_stat(source),
+    }
+    temporary_path = meta_location + ".tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(temporary_path, meta_location)
+    return location
+
+
+def open_store(location, column_names=None, mmap=True):
+    """
+    Returns an OrderedDict of column name to the (memory-mapped, read-only) array of every column, or of the
+    requested ones.
+    """
+    meta = read_meta(location)
+    if meta is None:
+        raise ValueError("Not a columnar store: {}".format(location))
+    return OrderedDict((name, load_array(column_location(location, name), mmap=mmap))
+                       for name in (meta["columns"] if column_names is None else column_names))
+
+
+def is_current(location, source):
+    meta = read_meta(location)
+    return (meta is not None and meta["source"] is not None and
+            meta["source"] == [os.path.abspath(source)] + source_stat(source))
+
+
+def csv_to_store(csv_location, location, sort_by=0):
+    """
+    Converts a CSV file with a header to a store sorted by the sort_by column (a name or a position).
+    """
+    frame = pd.read_csv(csv_location, header=0)
+    if not isinstance(sort_by, str) and sort_by is not None:
+        sort_by = frame.columns[sort_by]
+    columns = OrderedDict((name, frame[name].values) for name in frame.columns)
+    del frame
+    return write_store(location, columns, sort_by=sort_by, source=csv_location)
+
+
+def cached_store(csv_location, store_directory, sort_by=0):
+    """
+    Returns the location of the store of a CSV file in store_directory, converting the file only when it is new or
+    changed since its last conversion.
+    """
+    location = os.path.join(store_directory, os.path.splitext(os.path.basename(csv_location))[0])
+    if not is_current(location, csv_location):
+        csv_to_store(csv_location, location, sort_by=sort_by)
+    return location
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python columnar_store.py <csv file> <store dir>")
+        sys.exit(1)
+    print(csv_to_store(sys.argv[1], sys.argv[2]))
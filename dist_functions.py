@@ -1,88 +1,316 @@
-from scipy import stats
+from collections import namedtuple
+
+import numpy as np
+from scipy import special, stats
 
 # Weibull
 def weibull_pdf(x, c, loc, scale):
-    return stats.weibull_min.pdf(x, c, loc=loc, scale=scale).flatten()
+    return stats.weibull_min.pdf(x, c, loc=loc, scale=scale).ravel()
 
 def weibull_cdf(x, c, loc, scale):
-    return stats.weibull_min.cdf(x, c, loc=loc, scale=scale).flatten()
+    return stats.weibull_min.cdf(x, c, loc=loc, scale=scale).ravel()
 
 def weibull_sf(x, c, loc, scale):
-    return stats.weibull_min.sf(x, c, loc=loc, scale=scale).flatten()
+    return stats.weibull_min.sf(x, c, loc=loc, scale=scale).ravel()
 
 
 # Pareto
 def pareto_pdf(x, b, loc, scale):
-    return stats.pareto.pdf([x], b, loc=loc, scale=scale).flatten()
+    return stats.pareto.pdf(np.asarray(x), b, loc=loc, scale=scale).ravel()
 
 def pareto_cdf(x, b, loc, scale):
-    return stats.pareto.cdf([x], b, loc=loc, scale=scale).flatten()
+    return stats.pareto.cdf(np.asarray(x), b, loc=loc, scale=scale).ravel()
 
 def pareto_sf(x, b, loc, scale):
-    return stats.pareto.sf([x], b, loc=loc, scale=scale).flatten()
+    return stats.pareto.sf(np.asarray(x), b, loc=loc, scale=scale).ravel()
 
 
 # Generalized Pareto
 def gen_pareto_pdf(x, c, loc, scale):
-    return stats.genpareto.pdf(x, c, loc=loc, scale=scale).flatten()
+    return stats.genpareto.pdf(x, c, loc=loc, scale=scale).ravel()
 
 def gen_pareto_cdf(x, c, loc, scale):
-    return stats.genpareto.cdf(x, c, loc=loc, scale=scale).flatten()
+    return stats.genpareto.cdf(x, c, loc=loc, scale=scale).ravel()
 
 def gen_pareto_sf(x, c, loc, scale):
-    return stats.genpareto.sf(x, c, loc=loc, scale=scale).flatten()
+    return stats.genpareto.sf(x, c, loc=loc, scale=scale).ravel()
 
 
 # Exponential
 def expon_pdf(x, loc, scale):
-    return stats.expon.pdf(x, loc=loc, scale=scale).flatten()
+    return stats.expon.pdf(x, loc=loc, scale=scale).ravel()
 
 def expon_cdf(x, loc, scale):
-    return stats.expon.cdf(x, loc=loc, scale=scale).flatten()
+    return stats.expon.cdf(x, loc=loc, scale=scale).ravel()
 
 def expon_sf(x, loc, scale):
-    return stats.expon.sf(x, loc=loc, scale=scale).flatten()
+    return stats.expon.sf(x, loc=loc, scale=scale).ravel()
 
 
 # non-central Student's t
 def student_pdf(x, df, nc, loc, scale):
-    return stats.nct.pdf(x, df, nc, loc=loc, scale=scale).flatten()
+    return stats.nct.pdf(x, df, nc, loc=loc, scale=scale).ravel()
 
 def student_cdf(x, df, nc, loc, scale):
-    return stats.nct.cdf(x, df, nc, loc=loc, scale=scale).flatten()
+    return stats.nct.cdf(x, df, nc, loc=loc, scale=scale).ravel()
 
 def student_sf(x, df, nc, loc, scale):
-    return stats.nct.sf(x, df, nc, loc=loc, scale=scale).flatten()
+    return stats.nct.sf(x, df, nc, loc=loc, scale=scale).ravel()
 
 
 # Gamma
 def gamma_pdf(x, a, loc, scale):
-    return stats.gamma.pdf(x, a, loc=loc, scale=scale).flatten()
+    return stats.gamma.pdf(x, a, loc=loc, scale=scale).ravel()
 
 def gamma_cdf(x, a, loc, scale):
-    return stats.gamma.cdf(x, a, loc=loc, scale=scale).flatten()
+    return stats.gamma.cdf(x, a, loc=loc, scale=scale).ravel()
 
 def gamma_sf(x, a, loc, scale):
-    return stats.gamma.sf(x, a, loc=loc, scale=scale).flatten()
+    return stats.gamma.sf(x, a, loc=loc, scale=scale).ravel()
 
 
 # Log-normal
 def lognormal_pdf(x, s, loc, scale):
-    return stats.lognorm.pdf(x, s, loc=loc, scale=scale).flatten()
+    return stats.lognorm.pdf(x, s, loc=loc, scale=scale).ravel()
 
 def lognormal_cdf(x, s, loc, scale):
-    return stats.lognorm.cdf(x, s, loc=loc, scale=scale).flatten()
+    return stats.lognorm.cdf(x, s, loc=loc, scale=scale).ravel()
 
 def lognormal_sf(x, s, loc, scale):
-    return stats.lognorm.sf(x, s, loc=loc, scale=scale).flatten()
+    return stats.lognorm.sf(x, s, loc=loc, scale=scale).ravel()
 
 
 # Levy
 def levy_pdf(x, loc, scale):
-    return stats.levy.pdf(x, loc=loc, scale=scale).flatten()
+    return stats.levy.pdf(x, loc=loc, scale=scale).ravel()
 
 def levy_cdf(x, loc, scale):
-    return stats.levy.cdf(x, loc=loc, scale=scale).flatten()
+    return stats.levy.cdf(x, loc=loc, scale=scale).ravel()
 
 def levy_sf(x, loc, scale):
-    return stats.levy.sf(x, loc=loc, scale=scale).flatten()
+    return stats.levy.sf(x, loc=loc, scale=scale).ravel()
+
+
+# Fused evaluator
+#
+# evaluate() returns any of pdf, cdf, sf and their logs for one parameter set or a matrix of parameter sets in a
+# single call. x is standardized once, the parameters are checked once per set, and the quantities are derived from
+# shared terms of closed forms (e.g. the Weibull pdf, cdf and sf all come from (x / scale) ** c), with the tails
+# computed in log space. Distributions without a closed form here fall back to broadcast scipy calls.
+
+quantities = ["pdf", "cdf", "sf", "logpdf", "logcdf", "logsf"]
+default_quantities = ["pdf", "cdf", "sf"]
+
+
+def _log1mexp(log_p):
+    # log(1 - exp(log_p)), accurate both for tiny probabilities and for probabilities close to 1.
+    return np.where(log_p < -np.log(2), np.log1p(-np.exp(log_p)), np.log(-np.expm1(log_p)))
+
+
+def _expon(z, shapes):
+    return {"logpdf": lambda: -z, "logsf": lambda: -z, "cdf": lambda: -np.expm1(-z)}
+
+
+def _weibull(z, shapes):
+    c, = shapes
+    t = z ** c
+    return {"logpdf": lambda: np.log(c) + special.xlogy(c - 1, z) - t, "logsf": lambda: -t,
+            "cdf": lambda: -np.expm1(-t)}
+
+
+def _pareto(z, shapes):
+    b, = shapes
+    log_z = np.log(z)
+    return {"logpdf": lambda: np.log(b) - (b + 1) * log_z, "logsf": lambda: -b * log_z,
+            "cdf": lambda: -np.expm1(-b * log_z)}
+
+
+def _gen_pareto(z, shapes):
+    c, = shapes
+    # log1p(c z) / c, with its limit z at c = 0.
+    log1pcz = np.where(c == 0, z, np.log1p(c * z) / np.where(c == 0, 1, c))
+    return {"logpdf": lambda: -(c + 1) * log1pcz, "logsf": lambda: -log1pcz, "cdf": lambda: -np.expm1(-log1pcz)}
+
+
+def _lognormal(z, shapes):
+    s, = shapes
+    u = np.log(z) / s
+    return {"logpdf": lambda: -u ** 2 / 2 - np.log(s * z * np.sqrt(2 * np.pi)), "logsf": lambda: special.log_ndtr(-u),
+            "logcdf": lambda: special.log_ndtr(u), "sf": lambda: special.ndtr(-u), "cdf": lambda: special.ndtr(u)}
+
+
+def _levy(z, shapes):
+    root = np.sqrt(1 / (2 * z))
+    # Close to the lower end erf(root) rounds to 1 and erfc(root) underflows: log sf from erfc there, and log cdf
+    # through log_ndtr.
+    return {"logpdf": lambda: -0.5 * np.log(2 * np.pi) - 1.5 * np.log(z) - 1 / (2 * z),
+            "sf": lambda: special.erf(root), "cdf": lambda: special.erfc(root),
+            "logsf": lambda: np.where(root > 0.5, np.log1p(-special.erfc(root)), np.log(special.erf(root))),
+            "logcdf": lambda: np.log(2) + special.log_ndtr(-np.sqrt(2) * root)}
+
+
+# Below this gammaincc is too close to underflowing to take its log.
+_gamma_tail_threshold = 1e-250
+_tiny = 1e-300
+
+
+def _log_gamma_fraction(a, z, max_iterations=200, tolerance=1e-15):
+    # log of the continued fraction of Gamma(a, z) e^z z^-a (modified Lentz), which converges quickly for z > a + 1.
+    b = z + 1 - a
+    c = np.full(z.shape, 1 / _tiny)
+    d = 1 / b
+    h = d
+    for i in range(1, max_iterations + 1):
+        an = -i * (i - a)
+        b = b + 2
+        d = an * d + b
+        d = np.where(np.abs(d) < _tiny, _tiny, d)
+        c = b + an / c
+        c = np.where(np.abs(c) < _tiny, _tiny, c)
+        d = 1 / d
+        delta = d * c
+        h = h * delta
+        if np.all(np.abs(delta - 1) < tolerance):
+            break
+    return np.log(h)
+
+
+def _log_gammaincc(a, z):
+    """
+    log of the regularized upper incomplete gamma function, from the lower one where it is close to 1. Far in the
+    upper tail, where gammaincc underflows, it is a log z - z - log Gamma(a) plus the log of the continued fraction of
+    Gamma(a, z).
+    """
+    q = special.gammaincc(a, z)
+    result = np.where(q > 0.5, np.log1p(-special.gammainc(a, z)), np.log(q))
+    tail = (q < _gamma_tail_threshold) & (z > a + 1) & np.isfinite(z)
+    if np.any(tail):
+        a_tail = np.broadcast_to(a, z.shape)[tail]
+        z_tail = z[tail]
+        result[tail] = (special.xlogy(a_tail, z_tail) - z_tail - special.gammaln(a_tail) +
+                        _log_gamma_fraction(a_tail, z_tail))
+    return result
+
+
+def _gamma(z, shapes):
+    a, = shapes
+    return {"logpdf": lambda: special.xlogy(a - 1, z) - z - special.gammaln(a),
+            "sf": lambda: special.gammaincc(a, z), "cdf": lambda: special.gammainc(a, z),
+            "logsf": lambda: _log_gammaincc(a, z)}
+
+
+def _always_valid(shapes):
+    return True
+
+
+def _positive(shapes):
+    return shapes[0] > 0
+
+
+# Per distribution name (the prefixes of the wrappers above): the scipy distribution, its number of shape parameters,
+# a check of the shape parameters, the ends of the support as functions of the shape parameters, whether the lower end
+# itself is outside the support, and the closed forms. Every closed form returns the quantities it computes directly;
+# the others are derived from those.
+Evaluator = namedtuple("Evaluator", ["dist", "num_shapes", "valid_shapes", "lower", "upper", "open_lower",
+                                     "closed_form"])
+
+
+def _zero(shapes):
+    return 0
+
+
+def _one(shapes):
+    return 1
+
+
+def _infinity(shapes):
+    return np.inf
+
+
+def _gen_pareto_upper(shapes):
+    c = shapes[0]
+    return np.where(c < 0, -1 / np.where(c < 0, c, -1), np.inf)
+
+
+evaluators = {
+    "weibull": Evaluator(stats.weibull_min, 1, _positive, _zero, _infinity, False, _weibull),
+    "pareto": Evaluator(stats.pareto, 1, _positive, _one, _infinity, False, _pareto),
+    "gen_pareto": Evaluator(stats.genpareto, 1, _always_valid, _zero, _gen_pareto_upper, False, _gen_pareto),
+    "expon": Evaluator(stats.expon, 0, _always_valid, _zero, _infinity, False, _expon),
+    "student": Evaluator(stats.nct, 2, _positive, None, None, False, None),
+    "gamma": Evaluator(stats.gamma, 1, _positive, _zero, _infinity, False, _gamma),
+    "lognormal": Evaluator(stats.lognorm, 1, _positive, _zero, _infinity, True, _lognormal),
+    "levy": Evaluator(stats.levy, 0, _always_valid, _zero, _infinity, True, _levy),
+}
+
+
+def _complete(computed, name):
+    # Derives a quantity from the ones the closed form computes, preferring the log-space forms.
+    if name in computed:
+        return computed[name]()
+    if name == "pdf":
+        return np.exp(_complete(computed, "logpdf"))
+    if name == "sf":
+        return np.exp(computed["logsf"]()) if "logsf" in computed else 1 - computed["cdf"]()
+    if name == "cdf":
+        return -np.expm1(computed["logsf"]()) if "logsf" in computed else 1 - computed["sf"]()
+    if name == "logpdf":
+        return np.log(computed["pdf"]())
+    if name == "logsf":
+        return np.log(computed["sf"]()) if "sf" in computed else np.log(_complete(computed, "sf"))
+    if name == "logcdf":
+        return _log1mexp(computed["logsf"]()) if "logsf" in computed else np.log(computed["cdf"]())
+    raise ValueError("Unknown quantity: {}".format(name))
+
+
+# Values outside the support: below it and above it.
+_below_support = {"pdf": 0.0, "cdf": 0.0, "sf": 1.0, "logpdf": -np.inf, "logcdf": -np.inf, "logsf": 0.0}
+_above_support = {"pdf": 0.0, "cdf": 1.0, "sf": 0.0, "logpdf": -np.inf, "logcdf": 0.0, "logsf": -np.inf}
+
+
+def evaluate(dist_name, x, params, wanted=default_quantities):
+    """
+    Evaluates dist_name at x for params, either one parameter set in the argument order of the wrappers above
+    (shapes, loc, scale) or an (m, k) matrix of m sets. Returns a dict of quantity to an array of shape (len(x),),
+    or (m, len(x)) for a matrix. Invalid parameter sets give NaN, like scipy.
+    """
+    evaluator = evaluators[dist_name]
+    num_shapes = evaluator.num_shapes
+    x = np.asarray(getattr(x, "values", x), dtype=np.float64).ravel()
+    params = np.asarray(params, dtype=np.float64)
+    single = params.ndim == 1
+    params = np.atleast_2d(params)
+    if params.shape[1] != num_shapes + 2:
+        raise ValueError("{} takes {} parameters, got {}".format(dist_name, num_shapes + 2, params.shape[1]))
+
+    shapes = [params[:, [i]] for i in range(num_shapes)]
+    loc = params[:, [num_shapes]]
+    scale = params[:, [num_shapes + 1]]
+
+    with np.errstate(all="ignore"):
+        valid = (scale > 0) & evaluator.valid_shapes(shapes) & np.all(np.isfinite(params), axis=1, keepdims=True)
+        if evaluator.closed_form is None:
+            result = dict((name, getattr(evaluator.dist, name)(x[np.newaxis, :], *shapes, loc=loc, scale=scale))
+                          for name in wanted)
+        else:
+            z = (x[np.newaxis, :] - loc) / np.where(valid, scale, 1)
+            lower = evaluator.lower(shapes)
+            below = (z <= lower) if evaluator.open_lower else (z < lower)
+            above = z > evaluator.upper(shapes)
+            # Points outside the support are evaluated at 1, then replaced.
+            computed = evaluator.closed_form(np.where(below | above, 1.0, z), shapes)
+            result = {}
+            for name in wanted:
+                values = _complete(computed, name)
+                if name == "pdf":
+                    values = values / scale
+                elif name == "logpdf":
+                    values = values - np.log(scale)
+                values = np.where(below, _below_support[name], np.where(above, _above_support[name], values))
+                result[name] = values
+        for name in wanted:
+            result[name] = np.where(valid, np.broadcast_to(result[name], (params.shape[0], x.shape[0])), np.nan)
+
+    if single:
+        return dict((name, values[0]) for name, values in result.items())
+    return result
@@ -0,0 +1,129 @@
+"""
+On-disk cache of fit results, keyed by the content of the rebinned histogram and the fit configuration.
+
+Every entry is a small JSON file named after its key. Reading an entry refreshes its modification time, and the least
+recently used entries are evicted once the cache grows beyond its size limit. The size of the cache is kept in memory
+between evictions, so the directory is only scanned when the limit is exceeded.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Source files whose contents determine the outcome of a fit. Changing any of them invalidates the cache. The key only
+# holds the rebinned histogram, so the code that rebins it and derives the fitted columns (normalize_count) is included.
+versioned_sources = ["dist_functions.py", "fit_scheduler.py", "mle_fitting.py", "regression.py", "rebinning.py"]
+
+default_max_bytes = 256 * 1024 * 1024
+# Eviction frees the cache down to this fraction of its limit, so a full cache is not scanned again on the next put.
+eviction_target = 0.9
+
+
+def code_version():
+    digest = hashlib.sha256()
+    base_directory = os.path.dirname(os.path.abspath(__file__))
+    for source in versioned_sources:
+        with open(os.path.join(base_directory, source), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def fit_key(bins, counts, dist_name, regression_type, weight_nature, mode="least_squares", version=None):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(bins, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(counts, dtype=np.float64).tobytes())
+    for part in [dist_name, regression_type, weight_nature, mode, version or code_version()]:
+        digest.update(b"\0")
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _to_json(value):
+    if value is None:
+        return None
+    return np.asarray(value, dtype=np.float64).tolist()
+
+
+class FitCache(object):
+
+    def __init__(self, directory, max_bytes=default_max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = code_version()
+        self.total_size = None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, bins, counts, dist_name, regression_type, weight_nature, mode="least_squares"):
+        return fit_key(bins, counts, dist_name, regression_type, weight_nature, mode, self.version)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        os.utime(path, None)
+        return entry
+
+    def put(self, key, popt, pcov, error=None, metrics=None):
+        entry = {
+            "popt": _to_json(popt),
+            "pcov": _to_json(pcov),
+            "error": error,
+            "metrics": metrics or {},
+        }
+        path = self._path(key)
+        previous_size = _file_size(path)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(temporary_path, path)
+        if self.total_size is None:
+            self.evict()
+        else:
+            self.total_size += _file_size(path) - previous_size
+            if self.total_size > self.max_bytes:
+                self.evict()
+        return entry
+
+    def add_metrics(self, key, run_name, metrics):
+        entry = self.get(key)
+        if entry is None:
+            return None
+        entry["metrics"][run_name] = metrics
+        return self.put(key, entry["popt"], entry["pcov"], entry["error"], entry["metrics"])
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            stat = os.stat(os.path.join(self.directory, file_name))
+            entries.append((stat.st_mtime, stat.st_size, file_name))
+            total_size += stat.st_size
+
+        entries.sort()
+        if total_size > self.max_bytes:
+            for _, size, file_name in entries:
+                if total_size <= self.max_bytes * eviction_target:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    pass
+                total_size -= size
+        self.total_size = total_size
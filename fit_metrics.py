@@ -0,0 +1,97 @@
+"""
+Goodness-of-fit metrics for fitted distributions, computed for all candidates at once.
+
+The fitted curves of k candidates are stacked into (k, n) arrays aligned with the n bins of the observed histogram.
+Points where a candidate is not finite or not positive are masked out per candidate, which replaces the per-candidate
+DataFrame join on the filtered index.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from scipy import stats
+
+
+def valid_mask(fitted_pdf, fitted_sf):
+    with np.errstate(invalid="ignore"):
+        return np.isfinite(fitted_pdf) & (fitted_pdf > 0) & np.isfinite(fitted_sf) & (fitted_sf > 0)
+
+
+def goodness_of_fit(observed_pdf, observed_cdf, counts, fitted_pdf, fitted_cdf, mask=None):
+    """
+    Returns a dict of metric name to an array with one value per candidate (row of fitted_pdf/fitted_cdf).
+
+    ks_dist and chi2_dist are computed as the per-distribution scoring of regression was (chi2 compares the fitted pdf
+    against the observed pdf). kl_divergence is D(observed || fitted) over the pdf values. anderson_darling and
+    log_likelihood use the probability mass the fitted cdf puts in every bin.
+    """
+    observed_pdf = np.asarray(observed_pdf, dtype=np.float64)
+    observed_cdf = np.asarray(observed_cdf, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.float64)
+    fitted_pdf = np.atleast_2d(np.asarray(fitted_pdf, dtype=np.float64))
+    fitted_cdf = np.atleast_2d(np.asarray(fitted_cdf, dtype=np.float64))
+
+    if mask is None:
+        mask = valid_mask(fitted_pdf, 1 - fitted_cdf)
+    mask = np.atleast_2d(mask)
+    num_valid = mask.sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ks_dist = np.max(np.where(mask, np.abs(observed_cdf - fitted_cdf), 0), axis=1)
+
+        chi2_terms = (fitted_pdf - observed_pdf) ** 2 / observed_pdf
+        chi2_dist = np.sum(np.where(mask, chi2_terms, 0), axis=1)
+        chi2_p = stats.chi2.sf(chi2_dist, np.maximum(num_valid - 1, 1))
+
+        kl_mask = mask & (observed_pdf > 0)
+        kl_terms = observed_pdf * (np.log(observed_pdf) - np.log(fitted_pdf))
+        kl_divergence = np.sum(np.where(kl_mask, kl_terms, 0), axis=1)
+
+        fitted_mass = np.hstack((fitted_cdf[:, :1], np.diff(fitted_cdf, axis=1)))
+        ad_mask = mask & (fitted_cdf > 0) & (fitted_cdf < 1) & (fitted_mass > 0)
+        ad_terms = (observed_cdf - fitted_cdf) ** 2 / (fitted_cdf * (1 - fitted_cdf)) * fitted_mass
+        anderson_darling = counts.sum() * np.sum(np.where(ad_mask, ad_terms, 0), axis=1)
+
+        ll_mask = mask & (fitted_mass > 0)
+        mass_total = np.sum(np.where(ll_mask, fitted_mass, 0), axis=1, keepdims=True)
+        ll_terms = counts * (np.log(fitted_mass) - np.log(mass_total))
+        log_likelihood = np.sum(np.where(ll_mask, ll_terms, 0), axis=1)
+
+    return {
+        "ks_dist": ks_dist,
+        "chi2_dist": chi2_dist,
+        "chi2_p": chi2_p,
+        "kl_divergence": kl_divergence,
+        "anderson_darling": anderson_darling,
+        "log_likelihood": log_likelihood,
+    }
+
+
+def score_fits(dataset, fitted):
+    """
+    Scores every candidate in fitted, a dict of dist_name to a dict with "pdf", "cdf" and "survival" arrays evaluated
+    on the bins of dataset. Returns an OrderedDict of dist_name to its metrics, in the order of fitted.
+    """
+    if len(fitted) == 0:
+        return OrderedDict()
+
+    names = list(fitted.keys())
+    fitted_pdf = np.vstack([fitted[name]["pdf"] for name in names])
+    fitted_cdf = np.vstack([fitted[name]["cdf"] for name in names])
+    fitted_sf = np.vstack([fitted[name]["survival"] for name in names])
+
+    metrics = goodness_of_fit(dataset["pdf"].values, dataset["cdf"].values, dataset["count"].values,
+                              fitted_pdf, fitted_cdf, mask=valid_mask(fitted_pdf, fitted_sf))
+
+    return OrderedDict(
+        (name, OrderedDict((metric, float(values[index])) for metric, values in metrics.items()))
+        for index, name in enumerate(names)
+    )
+
+
+def best_fit(scores, metric="ks_dist"):
+    # Lower is better for every metric except the log-likelihood and the chi2 p-value.
+    if len(scores) == 0:
+        return None
+    sign = -1 if metric in ("log_likelihood", "chi2_p") else 1
+    return min(scores, key=lambda name: sign * scores[name][metric])
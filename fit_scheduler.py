@@ -0,0 +1,109 @@
+"""
+Schedules independent distribution fits over a process pool.
+
+Every (data type, feature, distribution, regression_type, weight_nature) combination is a separate job. Jobs are
+bounded by a wall-clock timeout rather than a small maxfev, and results are returned in the order the jobs were
+submitted, so the output does not depend on which worker finished first.
+"""
+
+import multiprocessing
+import signal
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+import instrumentation
+
+FitJob = namedtuple("FitJob", ["data_type", "feature_name", "dist_name", "regression_type", "weight_nature"])
+FitResult = namedtuple("FitResult", ["popt", "pcov", "error"])
+
+default_timeout = 60
+default_maxfev = 100000
+timeout_error = "timeout"
+
+
+class FitTimeout(RuntimeError):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise FitTimeout("Fit exceeded its time budget")
+
+
+def fit_function(func, x, y, sigma=None, maxfev=default_maxfev, p0=None):
+    if sigma is not None:
+        return curve_fit(func, x, y, p0=p0, maxfev=maxfev, sigma=sigma, absolute_sigma=True)
+    return curve_fit(func, x, y, p0=p0, maxfev=maxfev)
+
+
+def run_fit(fit_callable, args, kwargs=None, timeout=default_timeout):
+    """
+    Calls fit_callable(*args, **kwargs), which returns (popt, pcov), and wraps the outcome in a FitResult.
+    """
+    # SIGALRM interrupts the fit from within the process running it, which works both in the pool workers and in
+    # the main thread when fitting serially.
+    use_alarm = timeout is not None and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        popt, pcov = fit_callable(*args, **(kwargs or {}))
+        return FitResult(popt, pcov, None)
+    except FitTimeout:
+        return FitResult(None, None, timeout_error)
+    except (RuntimeError, ValueError) as e:
+        return FitResult(None, None, str(e))
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _run_task(task):
+    fit_callable, args, kwargs, timeout = task
+    return run_fit(fit_callable, args, kwargs, timeout=timeout)
+
+
+def _run_job(item):
+    job, task = item
+    # Both task kinds take the data points as their second argument: (func, x, y) and (dist_name, bins, counts).
+    args = task[1]
+    rows = len(args[1]) if len(args) > 1 else None
+    with instrumentation.span("fit", rows=rows, **job._asdict()) as record:
+        result = _run_task(task)
+        record["attributes"]["error"] = result.error
+        return result
+
+
+def make_task(func, x, y, sigma=None, timeout=default_timeout, maxfev=default_maxfev, p0=None):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    sigma = None if sigma is None else np.asarray(sigma, dtype=np.float64)
+    return fit_function, (func, x, y), {"sigma": sigma, "maxfev": maxfev, "p0": p0}, timeout
+
+
+def make_generic_task(fit_callable, args, kwargs=None, timeout=default_timeout):
+    return fit_callable, tuple(args), kwargs or {}, timeout
+
+
+def run_fits(jobs, tasks, processes=None):
+    """
+    Runs every task and returns an OrderedDict mapping each job to its FitResult, in the order of jobs.
+    processes=1 fits in the calling process, None uses one worker per core.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    items = list(zip(jobs, tasks))
+    if processes <= 1 or len(tasks) <= 1:
+        results = [_run_job(item) for item in items]
+    else:
+        pool = multiprocessing.Pool(processes=min(processes, len(tasks)))
+        try:
+            results = instrumentation.pool_map(pool, _run_job, items)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    return OrderedDict(zip(jobs, results))
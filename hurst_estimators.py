@@ -0,0 +1,169 @@
+"""
+Batched Hurst exponent estimators.
+
+Every estimator takes a 2-D batch of equally long windows (one series per row) and estimates all rows at once:
+the windows are cut into non-overlapping blocks with strided views, the block statistics are computed along the last
+axis, and the log-log regression is solved in closed form per row. Estimates come with the standard error of the
+regression slope and a confidence interval.
+
+- rescaled_range: R/S analysis, matches hurst.compute_Hc with simplified=True for kind "random_walk" and "change".
+- dfa: detrended fluctuation analysis (linear detrending) of the cumulative profile.
+- aggregated_variance: slope of the variance of block means over the block size, H = 1 + slope / 2.
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy import stats
+
+HurstEstimate = namedtuple("HurstEstimate", ["hurst", "stderr", "lower", "upper", "intercept"])
+
+
+def rs_window_sizes(length, min_window=10, max_window=None):
+    # Same window sizes as hurst.compute_Hc.
+    max_window = max_window or length - 1
+    window_sizes = [int(10 ** x) for x in np.arange(math.log10(min_window), math.log10(max_window), 0.25)]
+    window_sizes.append(length)
+    return window_sizes
+
+
+def log_window_sizes(length, min_window=4, max_window=None, num=12, min_blocks=2):
+    max_window = max_window or length // min_blocks
+    sizes = np.unique(np.floor(np.logspace(np.log10(min_window), np.log10(max_window), num=num)).astype(np.int64))
+    return [int(size) for size in sizes if min_window <= size <= length // min_blocks]
+
+
+def _blocks(batch, size):
+    # (rows, length) -> (rows, length // size, size) view without copying.
+    num_blocks = batch.shape[1] // size
+    row_stride, column_stride = batch.strides
+    return as_strided(batch, shape=(batch.shape[0], num_blocks, size),
+                      strides=(row_stride, size * column_stride, column_stride), writeable=False)
+
+
+def _as_batch(windows):
+    batch = np.asarray(windows, dtype=np.float64)
+    if batch.ndim == 1:
+        batch = batch[np.newaxis, :]
+    return batch
+
+
+def fit_loglog(x, y, confidence=0.95):
+    """
+    Least-squares slope of log10(y) over log10(x) for every row of y, ignoring non-finite points.
+    """
+    log_x = np.log10(np.asarray(x, dtype=np.float64))[np.newaxis, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_y = np.log10(y)
+    valid = np.isfinite(log_y)
+    log_x = np.broadcast_to(log_x, log_y.shape)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        count = valid.sum(axis=1)
+        mean_x = np.where(valid, log_x, 0).sum(axis=1) / count
+        mean_y = np.where(valid, log_y, 0).sum(axis=1) / count
+        dx = np.where(valid, log_x - mean_x[:, np.newaxis], 0)
+        dy = np.where(valid, log_y - mean_y[:, np.newaxis], 0)
+        sxx = (dx * dx).sum(axis=1)
+        slope = (dx * dy).sum(axis=1) / sxx
+        intercept = mean_y - slope * mean_x
+
+        residuals = np.where(valid, dy - slope[:, np.newaxis] * dx, 0)
+        dof = count - 2
+        stderr = np.sqrt((residuals ** 2).sum(axis=1) / dof / sxx)
+        stderr = np.where(dof > 0, stderr, np.nan)
+        t_value = stats.t.ppf(0.5 + confidence / 2, np.maximum(dof, 1))
+
+    return HurstEstimate(slope, stderr, slope - t_value * stderr, slope + t_value * stderr, intercept)
+
+
+def rescaled_range_curve(windows, kind="random_walk", min_window=10, max_window=None):
+    batch = _as_batch(windows)
+    window_sizes = rs_window_sizes(batch.shape[1], min_window, max_window)
+
+    rs = np.empty((batch.shape[0], len(window_sizes)))
+    for index, size in enumerate(window_sizes):
+        blocks = _blocks(batch, size)
+        if kind == "random_walk":
+            ranges = blocks.max(axis=2) - blocks.min(axis=2)
+            deviations = np.diff(blocks, axis=2).std(axis=2, ddof=1)
+        elif kind == "change":
+            profile = np.cumsum(blocks, axis=2)
+            ranges = np.maximum(profile.max(axis=2), 0) - np.minimum(profile.min(axis=2), 0)
+            deviations = blocks.std(axis=2, ddof=1)
+        else:
+            raise ValueError("Unknown kind of series: {}".format(kind))
+
+        # Blocks with an undefined R/S ratio are skipped, like in hurst.compute_Hc.
+        defined = (ranges != 0) & (deviations != 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = np.where(defined, ranges / deviations, 0)
+            rs[:, index] = ratios.sum(axis=1) / defined.sum(axis=1)
+
+    return window_sizes, rs
+
+
+def rescaled_range(windows, kind="random_walk", min_window=10, max_window=None, confidence=0.95):
+    window_sizes, rs = rescaled_range_curve(windows, kind, min_window, max_window)
+    return fit_loglog(window_sizes, rs, confidence)
+
+
+def dfa(windows, min_window=4, max_window=None, num=12, confidence=0.95):
+    batch = _as_batch(windows)
+    profile = np.cumsum(batch - batch.mean(axis=1, keepdims=True), axis=1)
+    window_sizes = log_window_sizes(batch.shape[1], min_window, max_window, num)
+
+    fluctuations = np.empty((batch.shape[0], len(window_sizes)))
+    for index, size in enumerate(window_sizes):
+        blocks = _blocks(profile, size)
+        t = np.arange(size, dtype=np.float64) - (size - 1) / 2.0
+        # Closed-form linear fit per block with a centred time axis.
+        slope = (blocks * t).sum(axis=2) / (t * t).sum()
+        intercept = blocks.mean(axis=2)
+        residuals = blocks - intercept[:, :, np.newaxis] - slope[:, :, np.newaxis] * t
+        fluctuations[:, index] = np.sqrt((residuals ** 2).mean(axis=(1, 2)))
+
+    return fit_loglog(window_sizes, fluctuations, confidence)
+
+
+def aggregated_variance(windows, min_window=1, max_window=None, num=12, min_blocks=10, confidence=0.95):
+    batch = _as_batch(windows)
+    window_sizes = log_window_sizes(batch.shape[1], min_window, max_window, num, min_blocks)
+
+    variances = np.empty((batch.shape[0], len(window_sizes)))
+    for index, size in enumerate(window_sizes):
+        variances[:, index] = _blocks(batch, size).mean(axis=2).var(axis=1, ddof=1)
+
+    beta = fit_loglog(window_sizes, variances, confidence)
+    return HurstEstimate(1 + beta.hurst / 2, beta.stderr / 2, 1 + beta.lower / 2, 1 + beta.upper / 2,
+                         beta.intercept)
+
+
+estimators = {
+    "rs": rescaled_range,
+    "dfa": dfa,
+    "aggvar": aggregated_variance,
+}
+
+
+def combine_samples(estimate, confidence=0.95):
+    """
+    Averages the per-window estimates of one series into a single estimate, with a t-interval over the windows.
+    """
+    finite = np.flatnonzero(np.isfinite(estimate.hurst))
+    values = np.asarray(estimate.hurst, dtype=np.float64)[finite]
+    if values.shape[0] == 0:
+        return HurstEstimate(np.nan, np.nan, np.nan, np.nan, np.nan)
+
+    mean = values.mean()
+    if values.shape[0] == 1:
+        index = finite[0]
+        return HurstEstimate(mean, estimate.stderr[index], estimate.lower[index], estimate.upper[index],
+                             estimate.intercept[index])
+
+    stderr = values.std(ddof=1) / np.sqrt(values.shape[0])
+    t_value = stats.t.ppf(0.5 + confidence / 2, values.shape[0] - 1)
+    return HurstEstimate(mean, stderr, mean - t_value * stderr, mean + t_value * stderr,
+                         np.nanmean(estimate.intercept))
@@ -0,0 +1,308 @@
+"""
+Incremental re-analysis of traces that grow by appended Parquet part files.
+
+For every trace a state directory records which part files of the tasks table have been folded in, with their size
+and modification time, and keeps mergeable partial results of the analyses:
+- the submissions per hour (arrival_profiles.HourlyCounts),
+- the submissions per period of every time scale of the Hurst analysis (arrival_series.multi_scale_counts),
+- the relationship tallies of workflow_structure, and the workflow ids they cover,
+- the task lifetime and interarrival histograms, the inputs of the regression.
+
+An update reads only the new part files and adds their partials. Two partials need more than an addition: the
+interarrival histogram needs the new submissions to come after the processed ones, and the relationship tallies need
+the new files to hold new workflows only. When new files break that, the partial is rebuilt from the whole trace.
+When a processed file changed or disappeared, the whole state is rebuilt.
+
+Fits are redone only when a histogram moved: when the KS distance between the histogram and the one of the last fit
+exceeds the refit tolerance.
+
+The arrays are .npy files (see columnar_store) suffixed with a generation number. state.json names the current
+generation and is replaced last, so an interrupted update leaves the previous state intact.
+"""
+
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import arrival_profiles
+import arrival_series
+import columnar_store
+import trace_reader
+import workflow_structure
+
+state_format = 1
+state_file_name = "state.json"
+
+features = ["interarrival", "lifetime"]
+default_refit_tolerance = 0.01
+
+update_columns = ["trace", "new_files", "new_tasks", "rebuilt", "refitted"]
+
+
+def task_files(trace_location):
+    # OrderedDict of the path of every Parquet file of the tasks table, relative to the trace, to its size and mtime.
+    files = OrderedDict()
+    for path in sorted(trace_reader.open_dataset(trace_location).files):
+        files[os.path.relpath(path, trace_location)] = columnar_store.source_stat(path)
+    return files
+
+
+def merge_histograms(values, counts, new_values, new_counts):
+    merged, inverse = np.unique(np.concatenate((values, new_values)), return_inverse=True)
+    return merged, np.bincount(inverse, weights=np.concatenate((counts, new_counts)),
+                               minlength=merged.shape[0]).astype(np.int64)
+
+
+def histogram(values):
+    values, counts = np.unique(values, return_counts=True)
+    return values, counts.astype(np.int64)
+
+
+def histogram_ks(values, counts, other_values, other_counts):
+    """
+    KS distance between the distributions of two histograms of value and count columns.
+    """
+    if np.sum(counts) == 0 or np.sum(other_counts) == 0:
+        return 1.0 if np.sum(counts) != np.sum(other_counts) else 0.0
+    points = np.union1d(values, other_values)
+
+    def cdf(histogram_values, histogram_counts):
+        order = np.argsort(histogram_values, kind="mergesort")
+        cumulative = np.cumsum(np.asarray(histogram_counts, dtype=np.float64)[order])
+        positions = np.searchsorted(np.asarray(histogram_values)[order], points, side="right") - 1
+        return np.where(positions >= 0, cumulative[np.maximum(positions, 0)], 0) / cumulative[-1]
+
+    return float(np.max(np.abs(cdf(values, counts) - cdf(other_values, other_counts))))
+
+
+def finite_submit_times(table):
+    ts_submit = table.column("ts_submit").to_numpy()
+    return ts_submit[np.isfinite(ts_submit)] if ts_submit.dtype.kind == "f" else ts_submit
+
+
+def interarrival_histogram(ts_submit, previous=None):
+    # Histogram of the time between consecutive submissions, continuing after the submission at previous.
+    ts_submit = np.sort(ts_submit)
+    if previous is not None:
+        ts_submit = np.concatenate(([previous], ts_submit))
+    return histogram(np.diff(ts_submit))
+
+
+class TraceState(object):
+
+    def __init__(self, location):
+        self.location = location
+        self.reset()
+        self.load()
+
+    def reset(self):
+        self.meta = {
+            "format": state_format,
+            "generation": 0,
+            "files": OrderedDict(),
+            "first_hour": None,
+            "max_ts_submit": None,
+            "relationships": {},
+            "fitted": [],
+        }
+        empty = np.zeros(0, dtype=np.int64)
+        self.arrays = OrderedDict([("hourly", empty), ("workflow_ids", empty)])
+        for index, counts in enumerate(arrival_series.multi_scale_counts(empty)):
+            self.arrays["scale_{}".format(index)] = counts
+        for feature in features:
+            self.arrays["{}_values".format(feature)] = empty
+            self.arrays["{}_counts".format(feature)] = empty
+
+    def _array_location(self, name, generation):
+        return os.path.join(self.location, "{}.{}.npy".format(name, generation))
+
+    def load(self):
+        try:
+            with open(os.path.join(self.location, state_file_name)) as f:
+                meta = json.load(f, object_pairs_hook=OrderedDict)
+        except (IOError, OSError, ValueError):
+            return
+        if meta.get("format") != state_format:
+            return
+        self.meta = meta
+        self.arrays = OrderedDict((name, columnar_store.load_array(self._array_location(name, meta["generation"]),
+                                                                   mmap=False))
+                                  for name in meta["arrays"])
+
+    def save(self):
+        self.meta["generation"] += 1
+        self.meta["arrays"] = list(self.arrays)
+        for name, values in self.arrays.items():
+            columnar_store.save_array(self._array_location(name, self.meta["generation"]), values)
+
+        temporary_path = os.path.join(self.location, state_file_name + ".tmp")
+        with open(temporary_path, "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(temporary_path, os.path.join(self.location, state_file_name))
+        # Removes the previous generation, and what a reset or an interrupted update left behind.
+        current = set("{}.{}.npy".format(name, self.meta["generation"]) for name in self.arrays)
+        for file_name in os.listdir(self.location):
+            if file_name.endswith(".npy") and file_name not in current:
+                os.remove(os.path.join(self.location, file_name))
+
+    def hourly_counts(self):
+        return arrival_profiles.HourlyCounts(self.meta["first_hour"], self.arrays["hourly"])
+
+    def scale_counts(self):
+        return [self.arrays["scale_{}".format(index)] for index in range(len(arrival_series.time_scales))]
+
+    def feature_histogram(self, feature, fitted=False):
+        prefix = "fitted_{}".format(feature) if fitted else feature
+        return self.arrays.get(prefix + "_values"), self.arrays.get(prefix + "_counts")
+
+    def update(self, trace_location):
+        """
+        Folds the new part files of a trace into the state and saves it. Returns an OrderedDict with the number of new
+        files and tasks, and which partials were rebuilt from the whole trace ("all", "interarrival", "structure").
+        """
+        files = task_files(trace_location)
+        rebuilt = []
+        if any(files.get(path) != stat for path, stat in self.meta["files"].items()):
+            # The histograms of the last fits are kept, a rebuilt histogram is compared with them as usual.
+            fitted = self.meta["fitted"]
+            fitted_arrays = [(name, values) for name, values in self.arrays.items() if name.startswith("fitted_")]
+            self.reset()
+            self.meta["fitted"] = fitted
+            self.arrays.update(fitted_arrays)
+            rebuilt.append("all")
+        new_paths = [path for path in files if path not in self.meta["files"]]
+        report = OrderedDict([("trace", os.path.basename(os.path.normpath(trace_location))),
+                              ("new_files", len(new_paths)), ("new_tasks", 0), ("rebuilt", rebuilt)])
+        if len(new_paths) == 0:
+            return report
+
+        available = trace_reader.column_names(trace_location)
+        columns = [name for name in ["ts_submit", "runtime", "id", "children", "type", "workflow_id"]
+                   if name in available]
+        table = trace_reader.read_files([os.path.join(trace_location, path) for path in new_paths], columns)
+        report["new_tasks"] = table.num_rows
+
+        if "ts_submit" in columns:
+            self._add_submissions(trace_location, finite_submit_times(table), rebuilt)
+        if "runtime" in columns:
+            runtime = table.column("runtime").to_numpy()
+            self._add_histogram("lifetime", *histogram(runtime[runtime > 0]))
+        if "id" in columns and "children" in columns:
+            self._add_relationships(trace_location, table, rebuilt)
+
+        for path in new_paths:
+            self.meta["files"][path] = files[path]
+        os.makedirs(self.location, exist_ok=True)
+        self.save()
+        return report
+
+    def _add_histogram(self, feature, values, counts):
+        values_name, counts_name = "{}_values".format(feature), "{}_counts".format(feature)
+        self.arrays[values_name], self.arrays[counts_name] = merge_histograms(
+            self.arrays[values_name], self.arrays[counts_name], values, counts)
+
+    def _add_submissions(self, trace_location, ts_submit, rebuilt):
+        if ts_submit.shape[0] == 0:
+            return
+        hourly = self.hourly_counts().add_timestamps(ts_submit)
+        self.meta["first_hour"], self.arrays["hourly"] = hourly.first_hour, hourly.counts
+        for index, counts in enumerate(arrival_series.multi_scale_counts(ts_submit)):
+            self.arrays["scale_{}".format(index)] = self.arrays["scale_{}".format(index)] + counts
+
+        previous = self.meta["max_ts_submit"]
+        if previous is None or ts_submit.min() >= previous:
+            self._add_histogram("interarrival", *interarrival_histogram(ts_submit, previous))
+        else:
+            # Submissions in between processed ones change the interarrival times around them.
+            all_ts_submit = finite_submit_times(trace_reader.read_columns(trace_location, ["ts_submit"]))
+            self.arrays["interarrival_values"], self.arrays["interarrival_counts"] = \
+                interarrival_histogram(all_ts_submit)
+            rebuilt.append("interarrival")
+        maximum = ts_submit.max().item()
+        self.meta["max_ts_submit"] = maximum if previous is None else max(previous, maximum)
+
+    def _add_relationships(self, trace_location, table, rebuilt):
+        # Dummy chains and edges stay within a workflow, so the tallies of new workflows add up. Without workflow ids
+        # that cannot be checked, and the tallies are rebuilt whenever there were processed files.
+        if "workflow_id" in table.column_names:
+            workflow_ids = np.unique(table.column("workflow_id").to_numpy().astype(np.int64))
+            known = np.intersect1d(workflow_ids, self.arrays["workflow_ids"]).shape[0] > 0
+        else:
+            workflow_ids = self.arrays["workflow_ids"]
+            known = len(self.meta["files"]) > 0
+
+        if not known:
+            _, is_dummy, src, dst = workflow_structure.task_graph(table)
+            counts = workflow_structure.relationship_counts(is_dummy, src, dst)
+            for relationship, count in counts.items():
+                self.meta["relationships"][relationship] = self.meta["relationships"].get(relationship, 0) + count
+            self.arrays["workflow_ids"] = np.union1d(self.arrays["workflow_ids"], workflow_ids)
+            return
+
+        self.meta["relationships"] = workflow_structure.analyze_trace(trace_location)
+        if "workflow_id" in table.column_names:
+            self.arrays["workflow_ids"] = np.unique(trace_reader.read_column(trace_location, "workflow_id",
+                                                                             dtype=np.int64))
+        rebuilt.append("structure")
+
+    def features_to_refit(self, tolerance=default_refit_tolerance):
+        """
+        Returns an OrderedDict of the features whose histogram moved by more than tolerance (KS distance) since its
+        last fit, or that were never fitted, to that distance (None if never fitted).
+        """
+        result = OrderedDict()
+        for feature in features:
+            values, counts = self.feature_histogram(feature)
+            if np.sum(counts) == 0:
+                continue
+            if feature not in self.meta["fitted"]:
+                result[feature] = None
+                continue
+            distance = histogram_ks(values, counts, *self.feature_histogram(feature, fitted=True))
+            if distance > tolerance:
+                result[feature] = distance
+        return result
+
+    def mark_fitted(self, feature):
+        # Keeps the histogram the fits were made on, and saves the state.
+        values, counts = self.feature_histogram(feature)
+        self.arrays["fitted_{}_values".format(feature)] = np.array(values)
+        self.arrays["fitted_{}_counts".format(feature)] = np.array(counts)
+        if feature not in self.meta["fitted"]:
+            self.meta["fitted"].append(feature)
+        self.save()
+
+    def write_regression_input(self, feature, directory):
+        # Writes <feature>.csv with value and count columns, the input format of regression.prepare_datasets.
+        os.makedirs(directory, exist_ok=True)
+        values, counts = self.feature_histogram(feature)
+        pd.DataFrame({feature: values, "count": counts}, columns=[feature, "count"]).to_csv(
+            os.path.join(directory, "{}.csv".format(feature)), index=False)
+        return "{}.csv".format(feature)
+
+
+def update_traces(traces_location, state_location, trace_names=None):
+    """
+    Updates the state of every trace with a tasks table under state_location/<trace name>. Returns the reports.
+    """
+    if trace_names is None:
+        trace_names = [name for name in sorted(os.listdir(traces_location))
+                       if os.path.isdir(os.path.join(traces_location, name))]
+    reports = []
+    for trace_name in trace_names:
+        trace_location = os.path.join(traces_location, trace_name)
+        if not trace_reader.do_tasks_exist(trace_location):
+            continue
+        reports.append(TraceState(os.path.join(state_location, trace_name)).update(trace_location))
+    return reports
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python incremental.py <dir with trace directories> <state dir>")
+        sys.exit(1)
+    print(pd.DataFrame(update_traces(sys.argv[1], sys.argv[2]), columns=update_columns[:-1]).to_string(index=False))
@@ -0,0 +1,208 @@
+"""
+Lightweight profiling of the analysis pipeline.
+
+Code paths are wrapped in named spans (the span context manager or the timed decorator). Every span records its wall
+time, CPU time, the peak resident set size of the process when it ends and, where known, the number of rows it
+processed. Recording is off unless enable() is called or WTA_PROFILE is set, in which case spans cost two clock reads
+and a getrusage call. Spans recorded in pool workers are sent back with the results (see Collecting) and merged into
+the parent's events. The events can be summarized per span name, or exported as JSON or as a Chrome trace
+(chrome://tracing, Perfetto).
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_enabled = bool(os.environ.get("WTA_PROFILE"))
+_events = []
+_lock = threading.Lock()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        del _events[:]
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def merge(new_events):
+    with _lock:
+        _events.extend(new_events)
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if os.uname()[0] == "Darwin" else peak * 1024
+
+
+@contextmanager
+def span(name, rows=None, **attributes):
+    """
+    Records the enclosed block as an event called name. The yielded dict can be updated inside the block, e.g. to
+    set rows once they are known.
+    """
+    record = {"name": name, "rows": rows, "attributes": attributes}
+    if not _enabled:
+        yield record
+        return
+
+    start = time.time()
+    start_cpu = time.process_time()
+    try:
+        yield record
+    finally:
+        record.update({
+            "start": start,
+            "wall_time": time.time() - start,
+            "cpu_time": time.process_time() - start_cpu,
+            "peak_rss": peak_rss_bytes(),
+            "pid": os.getpid(),
+            "tid": threading.current_thread().ident,
+        })
+        with _lock:
+            _events.append(record)
+
+
+def timed(name=None, rows=None):
+    """
+    Decorator version of span. rows is a function of the call's result that returns the number of rows processed.
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with span(span_name) as record:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    record["rows"] = rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+class Collecting(object):
+    """
+    Wraps a function that runs in a pool worker so that it returns (result, events recorded during the call).
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args):
+        reset()
+        result = self.function(*args)
+        return result, events()
+
+
+def absorb(outputs):
+    # Merges the events of Collecting results into this process and returns the bare results.
+    results = []
+    for result, worker_events in outputs:
+        merge(worker_events)
+        results.append(result)
+    return results
+
+
+def pool_map(pool, function, items):
+    """
+    pool.map(function, items) with chunksize 1, bringing the events recorded in the workers back to this process.
+    """
+    if not _enabled:
+        return pool.map(function, items, chunksize=1)
+    return absorb(pool.map(Collecting(function), items, chunksize=1))
+
+
+def summary(recorded=None):
+    """
+    Returns a DataFrame with one row per span name: number of calls, total and maximum wall time, total CPU time,
+    rows and the largest peak RSS seen, sorted by total wall time.
+    """
+    recorded = events() if recorded is None else recorded
+    columns = ["name", "calls", "wall_time", "max_wall_time", "cpu_time", "rows", "peak_rss"]
+    if len(recorded) == 0:
+        return pd.DataFrame(columns=columns)
+    frame = pd.DataFrame([{
+        "name": event["name"],
+        "wall_time": event["wall_time"],
+        "cpu_time": event["cpu_time"],
+        "rows": event["rows"] or 0,
+        "peak_rss": event["peak_rss"] or 0,
+    } for event in recorded])
+    grouped = frame.groupby("name")
+    result = pd.DataFrame({
+        "calls": grouped.size(),
+        "wall_time": grouped["wall_time"].sum(),
+        "max_wall_time": grouped["wall_time"].max(),
+        "cpu_time": grouped["cpu_time"].sum(),
+        "rows": grouped["rows"].sum(),
+        "peak_rss": grouped["peak_rss"].max(),
+    }).reset_index()
+    return result[columns].sort_values("wall_time", ascending=False).reset_index(drop=True)
+
+
+def _json_value(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def export_json(path, recorded=None):
+    recorded = events() if recorded is None else recorded
+    with open(path, "w") as f:
+        json.dump(recorded, f, indent=1, default=_json_value)
+
+
+def export_chrome_trace(path, recorded=None):
+    """
+    Writes the events in the Chrome trace event format, one complete ("X") event per span.
+    """
+    recorded = events() if recorded is None else recorded
+    trace_events = []
+    for event in recorded:
+        arguments = dict(event["attributes"])
+        arguments.update({"cpu_time": event["cpu_time"], "rows": event["rows"], "peak_rss": event["peak_rss"]})
+        trace_events.append({
+            "name": event["name"],
+            "ph": "X",
+            "ts": event["start"] * 1e6,
+            "dur": event["wall_time"] * 1e6,
+            "pid": event["pid"],
+            "tid": event["tid"],
+            "args": arguments,
+        })
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, default=_json_value)
+
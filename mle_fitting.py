@@ -0,0 +1,200 @@
+"""
+Binned maximum-likelihood fitting of the candidate distributions.
+
+The fits work on the rebinned (bin, count) histogram directly: bin i holds the counts in (b_{i-1}, b_i], the last bin
+is open-ended and the histogram is treated as truncated below its first lower edge. Location is fixed at 0, all
+other parameters are optimized with L-BFGS-B. The log-likelihood of the whole finite-difference stencil is evaluated
+in one batched dist_functions.evaluate call, so each optimizer iteration costs a single vectorized evaluation. The
+covariance is the inverse of the finite-difference Hessian of the log-likelihood at the optimum, again from one
+batched call.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from scipy import stats
+from scipy.optimize import minimize
+
+import dist_functions
+
+euler_gamma = 0.5772156649015329
+levy_median_factor = 2.1981093383177324  # median of the standard Levy distribution
+
+# Per distribution: the scipy distribution and, for each shape parameter followed by the scale, whether it must be
+# positive (those are optimized in log space).
+distributions = OrderedDict([
+    ("weibull", (stats.weibull_min, [True, True])),
+    ("gen_pareto", (stats.genpareto, [False, True])),
+    ("expon", (stats.expon, [True])),
+    ("gamma", (stats.gamma, [True, True])),
+    ("lognormal", (stats.lognorm, [True, True])),
+    ("levy", (stats.levy, [True])),
+    ("nct", (stats.nct, [True, False, True])),
+])
+
+# Names of the distributions in dist_functions.evaluators, where they differ.
+evaluator_names = {"nct": "student"}
+
+
+def bin_edges(bins, lower_edge=None):
+    bins = np.asarray(bins, dtype=np.float64)
+    if lower_edge is None:
+        # Log-spaced bins: extrapolate one step below the first edge.
+        lower_edge = bins[0] ** 2 / bins[1] if bins.shape[0] > 1 and bins[0] > 0 else 0.0
+    lower = np.concatenate(([lower_edge], bins[:-1]))
+    upper = bins.copy()
+    upper[-1] = np.inf
+    return lower, upper
+
+
+def moment_estimates(dist_name, bins, counts):
+    bins = np.asarray(bins, dtype=np.float64)
+    weights = np.asarray(counts, dtype=np.float64)
+    weights = weights / weights.sum()
+
+    mean = np.dot(weights, bins)
+    var = max(np.dot(weights, (bins - mean) ** 2), 1e-12)
+    log_bins = np.log(np.maximum(bins, 1e-12))
+    log_mean = np.dot(weights, log_bins)
+    log_std = max(np.sqrt(np.dot(weights, (log_bins - log_mean) ** 2)), 1e-3)
+
+    if dist_name == "weibull":
+        c = np.pi / (np.sqrt(6) * log_std)
+        return [c, np.exp(log_mean + euler_gamma / c)]
+    if dist_name == "gen_pareto":
+        c = np.clip(0.5 * (1 - mean ** 2 / var), -0.45, 0.45)
+        return [c, mean * (1 - c)]
+    if dist_name == "expon":
+        return [mean]
+    if dist_name == "gamma":
+        return [mean ** 2 / var, var / mean]
+    if dist_name == "lognormal":
+        return [log_std, np.exp(log_mean)]
+    if dist_name == "levy":
+        median = bins[np.searchsorted(np.cumsum(weights), 0.5)]
+        return [median / levy_median_factor]
+    if dist_name == "nct":
+        return [10.0, mean / np.sqrt(var), np.sqrt(var)]
+    raise ValueError("Unknown distribution: {}".format(dist_name))
+
+
+def _to_internal(params, positive):
+    return np.where(positive, np.log(np.maximum(params, 1e-300)), params)
+
+
+def _to_natural(theta, positive):
+    return np.where(positive, np.exp(np.clip(theta, -700, 700)), theta)
+
+
+def _log_likelihoods(dist_name, natural, lower, upper, counts):
+    # natural has shape (m, k): m parameter sets of k shape/scale parameters, the last one being the scale.
+    params = np.hstack((natural[:, :-1], np.zeros((natural.shape[0], 1)), natural[:, -1:]))
+    evaluator_name = evaluator_names.get(dist_name, dist_name)
+
+    with np.errstate(all="ignore"):
+        log_sf_lower = dist_functions.evaluate(evaluator_name, lower, params, ["logsf"])["logsf"]
+        log_sf_upper = dist_functions.evaluate(evaluator_name, upper, params, ["logsf"])["logsf"]
+        # log(sf(a) - sf(b)) computed relative to sf(a) to stay accurate in the tail.
+        log_mass = log_sf_lower + np.log1p(-np.exp(log_sf_upper - log_sf_lower))
+        log_truncation = log_sf_lower[:, [0]]
+        log_likelihood = np.dot(log_mass - log_truncation, counts)
+
+    return np.where(np.isfinite(log_likelihood), log_likelihood, -np.inf)
+
+
+def binned_log_likelihood(dist_name, params, bins, counts, lower_edge=None):
+    lower, upper = bin_edges(bins, lower_edge)
+    natural = np.atleast_2d(np.asarray(params, dtype=np.float64))
+    return _log_likelihoods(dist_name, natural, lower, upper, np.asarray(counts, dtype=np.float64))
+
+
+def _natural_to_popt(natural):
+    # dist_functions order: shape parameters, loc, scale.
+    return np.concatenate((natural[:-1], [0.0], natural[-1:]))
+
+
+def _natural_to_pcov(pcov_natural):
+    size = pcov_natural.shape[0] + 1
+    loc_index = size - 2
+    keep = [i for i in range(size) if i != loc_index]
+    pcov = np.zeros((size, size))
+    pcov[np.ix_(keep, keep)] = pcov_natural
+    return pcov
+
+
+def _hessian(dist_name, theta, positive, lower, upper, counts, step):
+    # Central differences of the negative log-likelihood in the internal parameters; every entry (i, j) takes the four
+    # points theta +- h_i e_i +- h_j e_j, which for i == j is the second difference with step 2 h_i.
+    num_params = theta.shape[0]
+    steps = step * np.maximum(np.abs(theta), 1)
+    pairs = [(i, j) for i in range(num_params) for j in range(i, num_params)]
+    signs = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+    offsets = np.zeros((4 * len(pairs), num_params))
+    for n, (i, j) in enumerate(pairs):
+        for m, (sign_i, sign_j) in enumerate(signs):
+            offsets[4 * n + m, i] += sign_i * steps[i]
+            offsets[4 * n + m, j] += sign_j * steps[j]
+
+    values = -_log_likelihoods(dist_name, _to_natural(theta + offsets, positive), lower, upper, counts)
+    values = values.reshape(len(pairs), 4)
+    hessian = np.zeros((num_params, num_params))
+    for n, (i, j) in enumerate(pairs):
+        hessian[i, j] = hessian[j, i] = \
+            (values[n, 0] - values[n, 1] - values[n, 2] + values[n, 3]) / (4 * steps[i] * steps[j])
+    return hessian
+
+
+def _covariance(hessian):
+    # Like curve_fit, the covariance is infinite when it cannot be estimated.
+    if not np.all(np.isfinite(hessian)):
+        return np.full(hessian.shape, np.inf)
+    try:
+        return np.linalg.inv(hessian)
+    except np.linalg.LinAlgError:
+        return np.full(hessian.shape, np.inf)
+
+
+def fit_binned(dist_name, bins, counts, lower_edge=None, p0=None, maxiter=500, step=1e-5, hessian_step=1e-4):
+    """
+    Fits dist_name to the histogram by binned maximum likelihood and returns (popt, pcov) in the argument order of
+    the dist_functions wrappers, with loc fixed at 0.
+    """
+    _, positive = distributions[dist_name]
+    positive = np.asarray(positive)
+    lower, upper = bin_edges(bins, lower_edge)
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum()
+
+    if p0 is None:
+        p0 = moment_estimates(dist_name, bins, counts)
+    else:
+        # Accept popt-style starting points that include loc.
+        p0 = np.asarray(p0, dtype=np.float64)
+        if p0.shape[0] == positive.shape[0] + 1:
+            p0 = np.delete(p0, -2)
+    theta0 = _to_internal(np.asarray(p0, dtype=np.float64), positive)
+
+    num_params = theta0.shape[0]
+    stencil = np.vstack((np.zeros(num_params), np.eye(num_params) * step, -np.eye(num_params) * step))
+
+    def objective(theta):
+        natural = _to_natural(theta[np.newaxis, :] + stencil, positive)
+        values = -_log_likelihoods(dist_name, natural, lower, upper, counts) / total
+        if not np.isfinite(values[0]):
+            return 1e10, np.zeros(num_params)
+        gradient = (values[1:num_params + 1] - values[num_params + 1:]) / (2 * step)
+        return values[0], np.where(np.isfinite(gradient), gradient, 0.0)
+
+    if not np.isfinite(objective(theta0)[0]):
+        raise RuntimeError("Invalid starting point for {}".format(dist_name))
+
+    result = minimize(objective, theta0, jac=True, method="L-BFGS-B", options={"maxiter": maxiter})
+    if not np.isfinite(result.fun) or result.fun >= 1e10:
+        raise RuntimeError("Unable to fit {}: {}".format(dist_name, result.message))
+
+    natural = _to_natural(result.x, positive)
+    jacobian = np.diag(np.where(positive, natural, 1.0))
+    pcov_internal = _covariance(_hessian(dist_name, result.x, positive, lower, upper, counts, hessian_step))
+    pcov_natural = jacobian.dot(pcov_internal).dot(jacobian.T)
+
+    return _natural_to_popt(natural), _natural_to_pcov(pcov_natural)
@@ -0,0 +1,124 @@
+"""
+Vectorized versions of the normalize_df, normalize_group and normalize_workload_and_group helpers of notebooks 4-7.
+
+Rows are sorted once by (group codes, value) and the per-value counts, per-group totals and cumulative sums are taken
+over contiguous runs of that order, instead of calling a Python function for every group. The returned frames have
+the same columns, order and index as the groupby(...).apply(...).reset_index() calls they replace.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _group_codes(df, group_columns):
+    # Dense codes of the group columns, numbered in the sorted order of the group keys like groupby does.
+    codes = np.zeros(df.shape[0], dtype=np.int64)
+    uniques = []
+    for column in group_columns:
+        column_codes, column_uniques = pd.factorize(df[column], sort=True)
+        codes = codes * len(column_uniques) + column_codes
+        uniques.append(column_uniques)
+    return codes, uniques
+
+
+def _runs(*sorted_keys):
+    # Start index of every run of equal keys in arrays sorted together.
+    if sorted_keys[0].shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    changes = np.zeros(sorted_keys[0].shape[0] - 1, dtype=bool)
+    for keys in sorted_keys:
+        changes |= keys[1:] != keys[:-1]
+    return np.flatnonzero(np.concatenate(([True], changes)))
+
+
+def _normalize(group_codes, values, weights):
+    """
+    Sums weights per (group, value) and normalizes per group. Returns group codes, values, pdf and cdf of every
+    (group, value) pair, ordered by group and then by value.
+    """
+    order = np.lexsort((values, group_codes))
+    group_codes = group_codes[order]
+    values = values[order]
+    weights = weights[order]
+
+    pair_starts = _runs(group_codes, values)
+    pair_groups = group_codes[pair_starts]
+    pair_values = values[pair_starts]
+    pair_weights = np.add.reduceat(weights, pair_starts) if pair_starts.shape[0] > 0 else weights[:0]
+
+    # The per-group sums and cumulative sums run over slices of the sorted pairs, one numpy call per group, so they
+    # round exactly like the Series.sum and Series.cumsum of normalize_df.
+    pdf = np.empty(pair_weights.shape[0])
+    cdf = np.empty(pair_weights.shape[0])
+    group_starts = _runs(pair_groups)
+    for start, end in zip(group_starts, np.concatenate((group_starts[1:], [pair_groups.shape[0]]))):
+        pdf[start:end] = pair_weights[start:end] / pair_weights[start:end].sum()
+        cdf[start:end] = np.cumsum(pdf[start:end])
+    return pair_groups, pair_values, pdf, cdf
+
+
+def _frame(group_columns, uniques, pair_groups, col_name, pair_values, pdf, cdf):
+    columns = []
+    data = {}
+    remaining = pair_groups
+    for column, column_uniques in reversed(list(zip(group_columns, uniques))):
+        data[column] = np.asarray(column_uniques)[remaining % len(column_uniques)]
+        remaining = remaining // len(column_uniques)
+    columns += group_columns
+
+    # Position within the group, the index that reset_index() turns into a level_<n> column.
+    level_column = "level_{}".format(len(group_columns))
+    group_starts = _runs(pair_groups)
+    group_lengths = np.diff(np.concatenate((group_starts, [pair_groups.shape[0]])))
+    data[level_column] = np.arange(pair_groups.shape[0]) - np.repeat(group_starts, group_lengths)
+    columns.append(level_column)
+
+    data[col_name] = pair_values
+    data["pdf"] = pdf
+    data["cdf"] = cdf
+    columns += [col_name, "pdf", "cdf"]
+    return pd.DataFrame(data, columns=columns)
+
+
+def _valid_rows(df, columns):
+    return df.dropna(subset=columns) if df[columns].isnull().values.any() else df
+
+
+def normalize_df(df, col_name):
+    sorted_df = df.sort_values(col_name)
+    sorted_df["pdf"] = sorted_df["count"] / sorted_df["count"].sum()
+    sorted_df["cdf"] = sorted_df["pdf"].cumsum()
+    return sorted_df
+
+
+def normalize_group(df, col_name, group_columns):
+    """
+    Same as df.groupby(group_columns).apply(normalize_group, col_name).reset_index(): per group, the fraction of rows
+    with each value of col_name and its cumulative sum.
+    """
+    group_columns = list(group_columns)
+    df = _valid_rows(df, group_columns + [col_name])
+    codes, uniques = _group_codes(df, group_columns)
+    values = df[col_name].values
+    pair_groups, pair_values, pdf, cdf = _normalize(codes, values, np.ones(values.shape[0], dtype=np.int64))
+    return _frame(group_columns, uniques, pair_groups, col_name, pair_values, pdf, cdf)
+
+
+def normalize_workload_and_group(df, col_name, group_columns):
+    """
+    Same as df.groupby(group_columns).apply(normalize_workload_and_group, col_name).reset_index(): sums the per
+    workload pdfs of every value and renormalizes per group, so every workload weighs the same.
+    """
+    group_columns = list(group_columns)
+    df = _valid_rows(df, group_columns + [col_name])
+    codes, uniques = _group_codes(df, group_columns)
+    pair_groups, pair_values, pdf, cdf = _normalize(codes, df[col_name].values, df["pdf"].values)
+    return _frame(group_columns, uniques, pair_groups, col_name, pair_values, pdf, cdf)
+
+
+def normalize_per_workload(df, col_name, group_column, workload_column="workload"):
+    """
+    The two-step "normalized per workload" distribution of notebooks 4-7 for every group.
+    """
+    per_workload = normalize_group(df, col_name, [workload_column, group_column])
+    return normalize_workload_and_group(per_workload, col_name, [group_column])
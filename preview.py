@@ -0,0 +1,408 @@
+"""
+Preview mode: the trace analyses on a sample of every trace, with error bounds, for fast iteration on the figures.
+
+The sampling unit is the Parquet row group, so a preview reads only the sampled row groups and skips the others
+entirely. The row groups of a table, in file order, are split into strata of 1 / fraction consecutive row groups, and
+one row group is drawn at random from every stratum. As traces are written roughly in submission order, this spreads
+the sample over the time span of the trace, without locking on to a period such as the week as a fixed stride could.
+
+Estimates are scaled back to the whole trace. For counts over time, every row group is assumed to spread its rows
+evenly between the minimum and maximum ts_submit of its statistics, which gives the fraction of the rows of every
+period that the sample holds: 1 for the periods inside a sampled row group of a trace sorted by time, the sampled
+fraction of rows for a trace in random order. Periods that no sampled row group covers are unobserved rather than
+empty. Distributions are estimated as ratios over the sampled row groups, with the variance of a cluster sample.
+Bounds are normal intervals at the given confidence; they cover sampling error only.
+"""
+
+import math
+import multiprocessing
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import arrival_profiles
+import arrival_series
+import hurst_estimators
+import instrumentation
+import sketches
+import trace_names
+import trace_reader
+
+default_fraction = 0.05
+default_confidence = 0.95
+
+# The regression stage fits aggregated histograms rather than traces; a preview only fits fewer bins. Bootstrap
+# intervals refit every resample, so they are left to the configuration rather than forced on the preview.
+bin_budget = 50
+
+sampling_columns = ["trace", "table", "row_groups", "sampled_row_groups", "rows", "sampled_rows"]
+
+
+def sample_row_groups(groups, fraction, seed=0):
+    """
+    Stratified sample of at least one row group: one at random from every stratum of len(groups) / n consecutive row
+    groups.
+    """
+    if len(groups) == 0:
+        return []
+    num_sampled = min(max(int(math.ceil(fraction * len(groups))), 1), len(groups))
+    offsets = np.random.RandomState(seed).uniform(size=num_sampled)
+    positions = np.floor((np.arange(num_sampled) + offsets) * len(groups) / num_sampled).astype(np.int64)
+    return [groups[position] for position in positions]
+
+
+def sampling_record(trace_name, table, groups, selected):
+    return OrderedDict([
+        ("trace", trace_name),
+        ("table", table),
+        ("row_groups", len(groups)),
+        ("sampled_row_groups", len(selected)),
+        ("rows", sum(group.num_rows for group in groups)),
+        ("sampled_rows", sum(group.num_rows for group in selected)),
+    ])
+
+
+def write_sampling(records, path):
+    pd.DataFrame(records, columns=sampling_columns).to_csv(path, index=False)
+
+
+def z_value(confidence):
+    return stats.norm.ppf(0.5 + confidence / 2)
+
+
+def coverage(groups, selected, first, length, resolution):
+    """
+    Estimated fraction of the rows of every period [first + i, first + i + 1) * resolution that are in the selected
+    row groups: 1 for periods without rows or with only selected row groups, 0 for unobserved periods. The rows of a
+    row group are not spread evenly over the periods in which it starts or ends, so those periods are unobserved
+    unless only selected row groups overlap them.
+    """
+    def spread(chosen):
+        # Rows and row groups per period, with the rows of every row group spread evenly over the periods of its
+        # range, and the periods with the start or end of a row group.
+        rows = np.zeros(length + 1)
+        overlapping = np.zeros(length + 1, dtype=np.int64)
+        edges = np.zeros(length, dtype=bool)
+        for group in chosen:
+            if group.minimum is None:
+                low, high = first, first + length - 1
+            else:
+                low, high = int(group.minimum // resolution), int(group.maximum // resolution)
+                edges[[edge - first for edge in (low, high) if 0 <= edge - first < length]] = True
+            start, end = max(low - first, 0), min(high - first, length - 1)
+            if end < start:
+                continue
+            rows[start] += group.num_rows / float(high - low + 1)
+            rows[end + 1] -= group.num_rows / float(high - low + 1)
+            overlapping[start] += 1
+            overlapping[end + 1] -= 1
+        return np.cumsum(rows[:-1]), np.cumsum(overlapping[:-1]), edges
+
+    rows, overlapping, edges = spread(groups)
+    selected_rows, selected_overlapping, _ = spread(selected)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(rows > 0, np.minimum(selected_rows / rows, 1.0), 1.0)
+    complete = selected_overlapping == overlapping
+    fraction[complete] = 1.0
+    fraction[edges & ~complete] = 0.0
+    return fraction
+
+
+def scale_counts(counts, fraction):
+    """
+    Returns (estimate, variance) of the full counts from the sampled counts and the coverage of every period. The
+    variance is that of binomial thinning; unobserved periods are NaN.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    observed = fraction > 0
+    estimate = np.full(counts.shape[0], np.nan)
+    variance = np.full(counts.shape[0], np.nan)
+    estimate[observed] = counts[observed] / fraction[observed]
+    variance[observed] = counts[observed] * (1 - fraction[observed]) / fraction[observed] ** 2
+    return estimate, variance
+
+
+def hourly_estimate(trace_location, fraction=default_fraction, seed=0):
+    """
+    Returns (first_hour, estimate, variance, fraction, record): the estimated number of submissions in every hour of
+    the trace, NaN for unobserved hours, its variance, the coverage of every hour and the sampling record.
+    """
+    groups = trace_reader.row_groups(trace_location)
+    selected = sample_row_groups(groups, fraction, seed)
+    hourly = arrival_profiles.HourlyCounts()
+    for _, table in trace_reader.read_row_groups(selected, ["ts_submit"]):
+        hourly.add_timestamps(table.column(0).to_numpy())
+
+    record = sampling_record(os.path.basename(os.path.normpath(trace_location)), "tasks", groups, selected)
+    bounded = [group for group in groups if group.minimum is not None]
+    if len(bounded) == 0:
+        if hourly.first_hour is None:
+            return 0, np.zeros(0), np.zeros(0), np.zeros(0), record
+        first_hour, last_hour = hourly.first_hour, hourly.first_hour + hourly.counts.shape[0] - 1
+    else:
+        first_hour = int(min(group.minimum for group in bounded) // arrival_profiles.one_hour_in_milliseconds)
+        last_hour = int(max(group.maximum for group in bounded) // arrival_profiles.one_hour_in_milliseconds)
+
+    counts = np.zeros(last_hour - first_hour + 1)
+    if hourly.first_hour is not None:
+        counts_first = max(hourly.first_hour, first_hour)
+        counts_last = min(hourly.first_hour + hourly.counts.shape[0] - 1, last_hour)
+        counts[counts_first - first_hour:counts_last - first_hour + 1] = \
+            hourly.counts[counts_first - hourly.first_hour:counts_last - hourly.first_hour + 1]
+    fraction = coverage(groups, selected, first_hour, counts.shape[0], arrival_profiles.one_hour_in_milliseconds)
+    estimate, variance = scale_counts(counts, fraction)
+    return first_hour, estimate, variance, fraction, record
+
+
+def _read_hourly(task):
+    trace_location, fraction, seed = task
+    return hourly_estimate(trace_location, fraction, seed)
+
+
+def hourly_estimates(traces_location, fraction=default_fraction, seed=0,
+                     min_duration=trace_reader.one_week_in_milliseconds, processes=None):
+    """
+    Returns an OrderedDict of trace name to hourly_estimate for every trace that arrival_profiles selects.
+    """
+    selected = arrival_profiles._selected_traces(traces_location, min_duration, None)
+    tasks = [(os.path.join(traces_location, trace_name), fraction, seed) for trace_name in selected]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or len(tasks) <= 1:
+        estimates = [_read_hourly(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes=min(processes, len(tasks)))
+        try:
+            estimates = instrumentation.pool_map(pool, _read_hourly, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+    return OrderedDict(zip(selected, estimates))
+
+
+def profile_frame(first_hour, estimate, variance, fraction, period, offset, workload_name,
+                  confidence=default_confidence):
+    """
+    Estimated profile of one trace, like arrival_profiles.profile_frame, with the stderr, lower and upper bound of
+    every average. The standard error combines the spread over the observed non-empty hours, corrected for the
+    fraction of the hours of the period that is observed, and the thinning variance of the hours themselves. A preview
+    observes only a few hours of every hour of the period, so the spread is the relative spread pooled over the hours
+    of the period with more than one observed hour, or that of all observed hours if there are none.
+
+    Hours of the period without submissions in the sample are kept, with observed False and NaN estimates, unless all
+    of their hours were read in full (and empty, so the exact profile leaves them out as well). The bounds assume many
+    independent row groups; the sampling unit is a cluster of consecutive submissions, so with few sampled row groups
+    the bounds are too narrow and cover the exact averages less often than the confidence says.
+    """
+    column = "hour_of_week" if period == arrival_profiles.hours_in_a_week else "hour_of_day"
+    hour_of_period = (first_hour + np.arange(estimate.shape[0]) + offset) % period
+    observed = np.isfinite(estimate)
+    nonempty = observed & (np.nan_to_num(estimate) > 0)
+
+    all_hours = np.bincount(hour_of_period, minlength=period)
+    observed_hours = np.bincount(hour_of_period[observed], minlength=period)
+    complete_hours = np.bincount(hour_of_period[fraction >= 1], minlength=period)
+    hours = np.bincount(hour_of_period[nonempty], minlength=period)
+    sums = np.bincount(hour_of_period[nonempty], weights=estimate[nonempty], minlength=period)
+    squares = np.bincount(hour_of_period[nonempty], weights=estimate[nonempty] ** 2, minlength=period)
+    thinning = np.bincount(hour_of_period[nonempty], weights=variance[nonempty], minlength=period)
+
+    present = hours > 0
+    # Hours that may hold submissions in the full trace although the sample has none.
+    unknown = ~present & (complete_hours < all_hours)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        averages = sums / hours
+        spread = np.maximum(squares - hours * averages ** 2, 0) / (hours - 1)
+        pooled = hours > 1
+        if pooled.any():
+            relative_spread = (spread[pooled] / averages[pooled] ** 2 * (hours[pooled] - 1)).sum() / \
+                (hours[pooled] - 1).sum()
+        elif nonempty.sum() > 1:
+            relative_spread = estimate[nonempty].var(ddof=1) / estimate[nonempty].mean() ** 2
+        else:
+            relative_spread = np.nan
+        spread = relative_spread * averages ** 2
+        unobserved = 1 - observed_hours / all_hours.astype(np.float64)
+        between = np.where(unobserved > 0, unobserved * spread / hours, 0)
+        stderr = np.sqrt(between + thinning / hours ** 2)
+    z = z_value(confidence)
+    rows = present | unknown
+    averages = np.where(present, averages, np.nan)[rows]
+    stderr = np.where(present, stderr, np.nan)[rows]
+    return pd.DataFrame({
+        column: np.flatnonzero(rows),
+        "avg(count)": averages,
+        "stderr": stderr,
+        "lower": np.maximum(averages - z * stderr, 0),
+        "upper": averages + z * stderr,
+        "observed": present[rows],
+        "workload": workload_name,
+    }, columns=[column, "avg(count)", "stderr", "lower", "upper", "observed", "workload"])
+
+
+def arrival_profiles_estimate(estimates, period=arrival_profiles.hours_in_a_week, offsets=None,
+                              confidence=default_confidence, display_names=trace_names.name_to_name_map):
+    """
+    Returns the estimated profiles of hourly_estimates as one DataFrame, like arrival_profiles.arrival_profiles.
+    """
+    if offsets is None:
+        offsets = arrival_profiles.week_offsets if period == arrival_profiles.hours_in_a_week else \
+            arrival_profiles.day_offsets
+
+    frames = []
+    for trace_name, (first_hour, estimate, variance, fraction, _) in estimates.items():
+        workload_name = trace_names.folder_name_to_display_name(trace_name, display_names)
+        frames.append(profile_frame(first_hour, estimate, variance, fraction, period,
+                                    arrival_profiles.trace_offset(trace_name, offsets), workload_name, confidence))
+
+    if len(frames) == 0:
+        return profile_frame(0, np.zeros(0), np.zeros(0), np.zeros(0), period, 0, "", confidence)
+    return pd.concat(frames, ignore_index=True)
+
+
+def multi_scale_estimate(trace_location, fraction=default_fraction, seed=0, scales=arrival_series.time_scales,
+                         lengths=None):
+    """
+    Estimated arrival_series.trace_multi_scale_counts from a sample of the row groups with submissions in the longest
+    requested period. Every scale covers that whole period rather than its own lengths[i] periods, and periods that
+    contain an unobserved finest period are NaN. Returns (counts per scale, record).
+    """
+    base, factors, _, finest_length = arrival_series._finest_resolution(scales, lengths)
+    groups = [group for group in trace_reader.row_groups(trace_location)
+              if group.minimum is None or (group.maximum >= 0 and group.minimum < finest_length * base)]
+    selected = sample_row_groups(groups, fraction, seed)
+    finest = np.zeros(finest_length, dtype=np.int64)
+    for _, table in trace_reader.read_row_groups(selected, ["ts_submit"]):
+        ts_submit = table.column(0).to_numpy()
+        finest += arrival_series._count_finest(ts_submit[np.isfinite(ts_submit)], base, finest_length)
+
+    estimate, _ = scale_counts(finest, coverage(groups, selected, 0, finest_length, base))
+    record = sampling_record(os.path.basename(os.path.normpath(trace_location)), "tasks", groups, selected)
+    return arrival_series._coarsen(estimate, factors, [finest_length // factor for factor in factors]), record
+
+
+def observed_windows(counts, samples, sample_size=arrival_series.size_of_sample):
+    # Like arrival_series.sample_windows, but of the first samples windows without unobserved periods.
+    counts = np.asarray(counts)
+    windows = counts[:counts.shape[0] // sample_size * sample_size].reshape(-1, sample_size)
+    windows = windows[np.isfinite(windows).all(axis=1)][:samples]
+    return windows[windows.sum(axis=1) > 0]
+
+
+def hurst_rows(trace_location, workload_name, fraction=default_fraction, seed=0, confidence=default_confidence):
+    """
+    Returns (rows, record): the rows of the Hurst stage for one trace, with the number of windows of every estimate.
+    The windows are the first completely observed ones of every scale, which on a trace in random order are the
+    windows of the exact analysis. The bounds are the interval over the windows. On a trace sorted by time the
+    windows lie inside the sampled row groups, so a scale whose windows are longer than a row group has none; on a
+    trace in random order the windows are thinned, which biases the estimates of small fractions towards 0.5.
+    """
+    counts_per_scale, record = multi_scale_estimate(trace_location, fraction, seed)
+    rows = []
+    for counts, time_scale, samples in zip(counts_per_scale, arrival_series.time_scales, arrival_series.num_samples):
+        windows = observed_windows(counts, samples)
+        if windows.shape[0] == 0:
+            continue
+        estimate = hurst_estimators.combine_samples(hurst_estimators.rescaled_range(windows, confidence=confidence),
+                                                    confidence)
+        rows.append({
+            "workload": workload_name,
+            "window_size": time_scale,
+            "hurst_parameter": estimate.hurst,
+            "stderr": estimate.stderr,
+            "lower": estimate.lower,
+            "upper": estimate.upper,
+            "windows": windows.shape[0],
+        })
+    return rows, record
+
+
+def _cdf_at(keys, cumulative, at_keys):
+    # Step function: the cumulative weight at every key of at_keys.
+    positions = np.searchsorted(keys, at_keys, side="right") - 1
+    return np.where(positions >= 0, cumulative[np.maximum(positions, 0)], 0)
+
+
+def sketch_estimate(trace_location, column_name, fraction=default_fraction, seed=0, table="workflows",
+                    relative_accuracy=sketches.default_relative_accuracy, exact_below=sketches.default_exact_below,
+                    predicate=None):
+    """
+    Estimated sketches.trace_sketch of column_name in the rows that match the row predicate (see sketches.row_filter;
+    by default the rows where column_name is positive). Returns (sketch, cdf_variance, record):
+    the sketch with its weights scaled to the whole table, the variance of its cdf at every key, and the sampling
+    record. The cdf is a ratio estimate over the sampled row groups; its variance is the larger of the cluster sample
+    variance, which has sampled_row_groups - 1 degrees of freedom, and the binomial variance of independent rows.
+    """
+    groups = trace_reader.row_groups(trace_location, table, column_name)
+    selected = sample_row_groups(groups, fraction, seed)
+    record = sampling_record(os.path.basename(os.path.normpath(trace_location)), table, groups, selected)
+
+    if predicate is None:
+        predicate = (column_name, 0, False)
+    columns = [column_name] if predicate[0] == column_name else [column_name, predicate[0]]
+    group_sketches = []
+    for _, group_table in trace_reader.read_row_groups(selected, columns):
+        values = np.asarray(group_table.column(column_name).to_numpy(), dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            matched = sketches.row_mask(predicate, np.asarray(group_table.column(predicate[0]).to_numpy(),
+                                                              dtype=np.float64))
+        group_sketches.append(sketches.LogHistogram(relative_accuracy, exact_below).add(values[matched]))
+    sketch = sketches.merge_sketches(group_sketches) if group_sketches else \
+        sketches.LogHistogram(relative_accuracy, exact_below)
+    sampled = sketch.total()
+    if sampled == 0:
+        return sketch, np.zeros(0), record
+
+    cdf = sketch.cdf()
+    sizes = np.array([group_sketch.total() for group_sketch in group_sketches])
+    sampled_fraction = record["sampled_rows"] / float(record["rows"])
+    independent = (1 - sampled_fraction) * cdf * (1 - cdf) / sampled
+    if len(group_sketches) > 1:
+        # (count <= x) - cdf(x) * size of every row group, relative to the mean size.
+        residuals = np.array([_cdf_at(group_sketch.keys, np.cumsum(group_sketch.weights), sketch.keys)
+                              for group_sketch in group_sketches]) - np.outer(sizes, cdf)
+        clustered = (1 - len(selected) / float(len(groups))) * (residuals ** 2).sum(axis=0) / (
+            len(selected) * (len(selected) - 1) * sizes.mean() ** 2)
+        variance = np.maximum(clustered, independent)
+    else:
+        variance = independent
+
+    sketch.weights = sketch.weights * record["rows"] / float(record["sampled_rows"])
+    return sketch, variance, record
+
+
+def group_frame(estimates, groups, column_name, group_column, normalize_per_sketch=False,
+                confidence=default_confidence):
+    """
+    sketches.group_frame with cdf_lower and cdf_upper bounds, from estimates of (sketch, cdf_variance, degrees of
+    freedom). Every merged cdf is a weighted sum of the cdfs of its sketches, whose variances add with the squared
+    weights; the bounds are t intervals with the fewest degrees of freedom of the sketches of the group.
+    """
+    frame = sketches.group_frame([sketch for sketch, _, _ in estimates], groups, column_name, group_column,
+                                 normalize_per_sketch)
+    grouped = {}
+    for estimate, group in zip(estimates, groups):
+        grouped.setdefault(group, []).append(estimate)
+
+    errors = []
+    for group in sorted(grouped):
+        members = [(sketch, variance, freedom) for sketch, variance, freedom in grouped[group]
+                   if sketch.total() > 0 or not normalize_per_sketch]
+        keys = sketches.merge_sketches([sketch for sketch, _, _ in grouped[group]], normalize_per_sketch).keys
+        totals = np.array([1.0 if normalize_per_sketch else sketch.total() for sketch, _, _ in members])
+        weights = totals / totals.sum() if totals.sum() > 0 else totals
+        group_variance = np.zeros(keys.shape[0])
+        for weight, (sketch, variance, _) in zip(weights, members):
+            if sketch.keys.shape[0] > 0:
+                group_variance += weight ** 2 * _cdf_at(sketch.keys, variance, keys)
+        freedom = min([freedom for _, _, freedom in members] or [np.inf])
+        quantile = stats.t.ppf(0.5 + confidence / 2, freedom) if freedom >= 1 else z_value(confidence)
+        errors.append(quantile * np.sqrt(group_variance))
+
+    error = np.concatenate(errors) if errors else np.zeros(0)
+    frame["cdf_lower"] = np.clip(frame["cdf"].values - error, 0, 1)
+    frame["cdf_upper"] = np.clip(frame["cdf"].values + error, 0, 1)
+    return frame
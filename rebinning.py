@@ -0,0 +1,217 @@
+"""
+Functions to rebin (value, count) histograms onto a new set of bin edges.
+
+A bin with edge b_i holds every value in (b_{i-1}, b_i]. The first bin also takes every value below b_0 and the last
+bin takes every value above b_{n-2}, which matches the behaviour of the original per-bin loop in regression.rebin.
+With a single edge there is only the first bin, which holds the values up to b_0, as in that loop.
+"""
+
+import numpy as np
+
+
+def linear_bins(min_value, max_value, num=1000):
+    return np.linspace(start=min_value, stop=max_value, num=num, endpoint=False)
+
+
+def log_bins(max_value, num=1000, min_exponent=0):
+    return np.logspace(start=min_exponent, stop=np.log10(max_value), num=num, endpoint=False, base=10)
+
+
+def quantile_bins(feature_column, value_column, num=1000):
+    # Edges at evenly spaced quantiles of the weighted histogram, duplicates are collapsed.
+    feature, counts = _sorted_arrays(feature_column, value_column)
+    cumulative = np.cumsum(counts, dtype=np.float64)
+    if cumulative.shape[0] == 0 or cumulative[-1] <= 0:
+        return np.array([], dtype=np.float64)
+
+    targets = np.linspace(0, cumulative[-1], num=num + 1)[1:]
+    indices = np.minimum(np.searchsorted(cumulative, targets, side="left"), feature.shape[0] - 1)
+    return np.unique(feature[indices])
+
+
+def _weighted_quantiles(feature, cumulative, quantiles):
+    targets = np.asarray(quantiles, dtype=np.float64) * cumulative[-1]
+    return feature[np.minimum(np.searchsorted(cumulative, targets, side="left"), feature.shape[0] - 1)]
+
+
+def freedman_diaconis_width(feature, counts):
+    """
+    Freedman-Diaconis bin width 2 * IQR / n^(1/3) of a sorted weighted sample.
+    """
+    cumulative = np.cumsum(counts, dtype=np.float64)
+    if cumulative.shape[0] == 0 or cumulative[-1] <= 0:
+        return 0.0
+    first_quartile, third_quartile = _weighted_quantiles(feature, cumulative, [0.25, 0.75])
+    return 2 * (third_quartile - first_quartile) / cumulative[-1] ** (1.0 / 3)
+
+
+def min_count_bins(feature, counts, num, min_count):
+    """
+    Upper edges of at most num bins over a sorted weighted sample, each holding at least min_count (the remainder
+    goes into the last bin). A single value never spans two bins.
+    """
+    cumulative = np.cumsum(counts, dtype=np.float64)
+    if cumulative.shape[0] == 0 or cumulative[-1] <= 0:
+        return np.array([], dtype=np.float64)
+    per_bin = max(min_count, cumulative[-1] / max(num, 1))
+    targets = np.arange(1, int(cumulative[-1] // per_bin) + 1) * per_bin
+    edges = np.unique(feature[np.minimum(np.searchsorted(cumulative, targets, side="left"), feature.shape[0] - 1)])
+    if edges.shape[0] == 0:
+        return feature[-1:].astype(np.float64)
+    # The values above the last full bin are merged into it.
+    edges[-1] = feature[-1]
+    return edges.astype(np.float64)
+
+
+def adaptive_bins(feature_column, value_column, budget=200, tail_quantile=0.99, tail_fraction=0.25, min_tail_count=10,
+                  assume_sorted=False):
+    """
+    Bin edges for a heavy-tailed histogram, at most budget of them whatever the size of the data. The body, up to
+    the tail_quantile of the counts, gets log-spaced bins of the Freedman-Diaconis width of log10(value), so dense
+    regions are resolved as far as the data supports. The tail gets up to tail_fraction of the budget as bins of
+    equal count, at least min_tail_count each, so the few points far out are merged instead of spread over
+    hundreds of nearly empty log bins. Only positive values are binned, lower values fall in the first bin.
+    """
+    if assume_sorted:
+        feature, counts = _as_array(feature_column), _as_array(value_column)
+    else:
+        feature, counts = _sorted_arrays(feature_column, value_column)
+    # Sorted, so the positive values (NaNs sort last) are a slice.
+    first = np.searchsorted(feature, 0, side="right")
+    last = np.searchsorted(feature, np.nan, side="left") if np.issubdtype(feature.dtype, np.floating) else None
+    feature, counts = feature[first:last], counts[first:last]
+    cumulative = np.cumsum(counts, dtype=np.float64)
+    if cumulative.shape[0] == 0 or cumulative[-1] <= 0:
+        return np.array([], dtype=np.float64)
+
+    tail_budget = max(int(budget * tail_fraction), 1)
+    body_budget = max(budget - tail_budget - 1, 1)
+    split = np.searchsorted(cumulative, tail_quantile * cumulative[-1], side="left") + 1
+    low, high = np.log10(feature[0]), np.log10(feature[min(split, feature.shape[0]) - 1])
+
+    width = freedman_diaconis_width(np.log10(feature[:split]), counts[:split])
+    if width > 0:
+        num = int(min(max(np.ceil((high - low) / width), 1), body_budget))
+    else:
+        num = body_budget if high > low else 1
+    body = np.logspace(low, high, num=num + 1, base=10) if high > low else feature[:1].astype(np.float64)
+    tail = min_count_bins(feature[split:], counts[split:], tail_budget, min_tail_count)
+    return np.unique(np.concatenate((body, tail)))
+
+
+def _as_array(column):
+    return np.asarray(getattr(column, "values", column))
+
+
+def _sorted_arrays(feature_column, value_column):
+    feature = _as_array(feature_column)
+    counts = _as_array(value_column)
+    if feature.shape[0] > 1 and np.any(feature[1:] < feature[:-1]):
+        order = np.argsort(feature, kind="mergesort")
+        feature = feature[order]
+        counts = counts[order]
+    return feature, counts
+
+
+def _result_dtype(counts):
+    if np.issubdtype(counts.dtype, np.integer) or counts.dtype == np.bool_:
+        return np.int64
+    return np.float64
+
+
+def _single_bin_total(feature, counts, edge, dtype):
+    # With a single edge the original loop only takes the first bin, the values up to the edge.
+    return np.array([counts[feature <= edge].sum()], dtype=dtype)
+
+
+def bin_totals(feature_column, value_column, new_bins):
+    """
+    Returns the summed counts for every bin in new_bins (empty bins included) in a single pass over the data.
+    """
+    new_bins = np.asarray(new_bins)
+    feature = _as_array(feature_column)
+    counts = _as_array(value_column)
+    dtype = _result_dtype(counts)
+
+    if new_bins.shape[0] == 0:
+        return np.zeros(0, dtype=dtype)
+
+    valid = ~np.isnan(feature) if np.issubdtype(feature.dtype, np.floating) else slice(None)
+    if new_bins.shape[0] == 1:
+        return _single_bin_total(feature[valid], counts[valid], new_bins[0], dtype)
+    indices = np.minimum(np.searchsorted(new_bins, feature[valid], side="left"), new_bins.shape[0] - 1)
+    totals = np.bincount(indices, weights=counts[valid], minlength=new_bins.shape[0])
+    return totals.astype(dtype)
+
+
+def bin_totals_sorted(feature_column, value_column, new_bins):
+    """
+    Same as bin_totals, but for data sorted by feature. Only the bin edges are searched, so the cost is a cumulative
+    sum over the data plus O(len(new_bins) * log(n)).
+    """
+    new_bins = np.asarray(new_bins)
+    feature = _as_array(feature_column)
+    counts = _as_array(value_column)
+    dtype = _result_dtype(counts)
+
+    if new_bins.shape[0] == 0:
+        return np.zeros(0, dtype=dtype)
+
+    if np.issubdtype(feature.dtype, np.floating):
+        # NaNs sort to the end, leave them out.
+        feature = feature[:np.searchsorted(feature, np.nan, side="left")]
+        counts = counts[:feature.shape[0]]
+
+    if new_bins.shape[0] == 1:
+        return _single_bin_total(feature, counts, new_bins[0], dtype)
+    cumulative = np.concatenate(([0], np.cumsum(counts, dtype=dtype)))
+    boundaries = np.searchsorted(feature, new_bins[:-1], side="right")
+    boundaries = np.concatenate(([0], boundaries, [feature.shape[0]]))
+    return np.diff(cumulative[boundaries])
+
+
+def rebin(feature_column, value_column, new_bins, assume_sorted=False):
+    if assume_sorted:
+        totals = bin_totals_sorted(feature_column, value_column, new_bins)
+    else:
+        totals = bin_totals(feature_column, value_column, new_bins)
+
+    non_empty = totals > 0
+    return list(np.asarray(new_bins)[non_empty]), list(totals[non_empty])
+
+
+class IncrementalRebinner(object):
+    """
+    Rebins a histogram that is fed in chunks, e.g. when it does not fit in memory. Chunks that are sorted by
+    feature value use the cheaper sorted code path.
+    """
+
+    def __init__(self, new_bins, assume_sorted=True):
+        self.new_bins = np.asarray(new_bins)
+        self.assume_sorted = assume_sorted
+        self.totals = None
+
+    def add(self, feature_column, value_column):
+        if self.assume_sorted:
+            totals = bin_totals_sorted(feature_column, value_column, self.new_bins)
+        else:
+            totals = bin_totals(feature_column, value_column, self.new_bins)
+
+        if self.totals is None:
+            self.totals = totals
+        else:
+            self.totals = self.totals + totals
+        return self
+
+    def result(self):
+        if self.totals is None:
+            return [], []
+        non_empty = self.totals > 0
+        return list(self.new_bins[non_empty]), list(self.totals[non_empty])
+
+
+def rebin_chunks(chunks, new_bins, assume_sorted=True):
+    rebinner = IncrementalRebinner(new_bins, assume_sorted=assume_sorted)
+    for feature_column, value_column in chunks:
+        rebinner.add(feature_column, value_column)
+    return rebinner.result()
@@ -2,15 +2,22 @@
 import os
 import gc
 import json
+from collections import OrderedDict
+
 import numpy as np
-from plotnine import *
 import pandas as pd
-from scipy.optimize import curve_fit, least_squares
 from scipy.stats import linregress
-from scipy import stats
-from palettable.colorbrewer.qualitative import Paired_7
 
 from dist_functions import *
+import bootstrap
+import columnar_store
+import dist_functions
+import fit_cache
+import fit_metrics
+import fit_scheduler
+import instrumentation
+import mle_fitting
+import rebinning
 
 
 feature_to_xlab_map = {
@@ -51,7 +58,170 @@ cdf_functions = {
 }
 
 
-def do_regression(available_data, target_directory, source_directory):
+regression_runs = [
+    ("survival", "unweighted"),
+    ("pdf", "unweighted"),
+    ("survival", "weighted"),
+    ("pdf", "weighted"),
+]
+
+
+def functions_for(regression_type):
+    return sf_functions if regression_type == "survival" else pdf_functions
+
+
+# Fitting modes: "least_squares" fits each curve with curve_fit, "mle" fits each distribution once per feature by
+# binned maximum likelihood on the counts and reuses that fit for every regression type and weighting.
+fit_modes = ["least_squares", "mle"]
+
+# Rendering modes: "sync" draws every plot right after its fit results are stored, "async" hands the plots to a
+# background process pool, and "none" only writes the fit results so render_plots can draw them later.
+render_modes = ["sync", "async", "none"]
+
+# Binning of the feature histograms before fitting: "log" is the 1000 log bins from 10^0 to the maximum value,
+# "adaptive" the body/tail binning of rebinning.adaptive_bins with at most bin_budget bins.
+binning_modes = ["log", "adaptive"]
+default_bin_budget = 200
+
+
+def do_regression(available_data, target_directory, source_directory, processes=None,
+                  timeout=fit_scheduler.default_timeout, mode="least_squares", render="sync", cache_directory=None,
+                  cache_size=fit_cache.default_max_bytes, store_directory=None, binning="log",
+                  bin_budget=default_bin_budget, bootstrap_resamples=0, bootstrap_seed=0):
+    if mode not in fit_modes:
+        raise ValueError("Unknown fitting mode: {}".format(mode))
+    if render not in render_modes:
+        raise ValueError("Unknown rendering mode: {}".format(render))
+    if binning not in binning_modes:
+        raise ValueError("Unknown binning mode: {}".format(binning))
+
+    cache = fit_cache.FitCache(cache_directory, cache_size) if cache_directory is not None else None
+
+    prepared = prepare_datasets(available_data, target_directory, source_directory, store_directory, binning,
+                                bin_budget)
+
+    jobs = []
+    tasks = []
+    keys = []
+    for data_type, feature_name, new_dataset, storage_loc in prepared:
+        if mode == "mle":
+            feature_jobs, feature_tasks = create_mle_fit_tasks(new_dataset, feature_name, timeout=timeout,
+                                                               data_type=data_type)
+        else:
+            feature_jobs, feature_tasks = create_fit_tasks(new_dataset, feature_name, timeout=timeout,
+                                                           data_type=data_type)
+        jobs.extend(feature_jobs)
+        tasks.extend(feature_tasks)
+        if cache is not None:
+            keys.extend(cache_key(cache, new_dataset, job, mode) for job in feature_jobs)
+
+    fits = run_cached_fits(jobs, tasks, keys, cache, processes=processes)
+    job_keys = dict(zip(jobs, keys))
+
+    render_jobs = []
+    for data_type, feature_name, new_dataset, storage_loc in prepared:
+        store_dataset(new_dataset, storage_loc)
+        for regression_type, weight_nature in regression_runs:
+            run_fits = OrderedDict(
+                (job.dist_name, result) for job, result in fits.items()
+                if job.data_type == data_type and job.feature_name == feature_name and (mode == "mle" or (
+                    job.regression_type == regression_type and job.weight_nature == weight_nature))
+            )
+            diffs_quantified = store_fit_results(new_dataset, functions_for(regression_type), storage_loc,
+                                                 regression_type, weight_nature, fits=run_fits)
+
+            if cache is not None:
+                for dist_name, diffs in diffs_quantified.items():
+                    if mode == "mle":
+                        job = fit_scheduler.FitJob(data_type, feature_name, dist_name, "mle", "binned")
+                    else:
+                        job = fit_scheduler.FitJob(data_type, feature_name, dist_name, regression_type, weight_nature)
+                    metrics = dict((name, value) for name, value in diffs.items() if name != "popt")
+                    cache.add_metrics(job_keys[job], "{}_{}".format(regression_type, weight_nature), metrics)
+            render_jobs.append((storage_loc, regression_type, weight_nature))
+
+            # The MLE fits are the same for every run, so they are bootstrapped once.
+            if bootstrap_resamples > 0 and (mode != "mle" or (regression_type, weight_nature) == regression_runs[0]):
+                with instrumentation.span("bootstrap", feature=feature_name, run=regression_type):
+                    intervals = bootstrap.bootstrap_fits(new_dataset, run_fits, functions_for(regression_type), mode,
+                                                         regression_type, weight_nature, processes=processes,
+                                                         max_resamples=bootstrap_resamples, seed=bootstrap_seed)
+                if mode == "mle":
+                    bootstrap.store_bootstrap(intervals, storage_loc, "mle", "binned")
+                else:
+                    bootstrap.store_bootstrap(intervals, storage_loc, regression_type, weight_nature)
+
+    if render != "none":
+        import render_plots
+        if render == "sync":
+            render_plots.render_stored_fits(render_jobs, processes=1)
+        else:
+            render_plots.render_stored_fits(render_jobs, processes=processes, background=True)
+
+    return render_jobs
+
+
+def cache_key(cache, dataset, job, mode):
+    feature_column_name = dataset.columns[0]
+    return cache.key(dataset[feature_column_name].values, dataset["count"].values, job.dist_name,
+                     job.regression_type, job.weight_nature, mode)
+
+
+def run_cached_fits(jobs, tasks, keys, cache, processes=None):
+    """
+    Serves the jobs whose key is in the cache and fits the remaining ones. Fits that timed out are not cached.
+    """
+    if cache is None:
+        return fit_scheduler.run_fits(jobs, tasks, processes=processes)
+
+    fits = OrderedDict()
+    missing = []
+    for job, task, key in zip(jobs, tasks, keys):
+        entry = cache.get(key)
+        if entry is None:
+            fits[job] = None
+            missing.append((job, task, key))
+        else:
+            popt = None if entry["popt"] is None else np.asarray(entry["popt"])
+            pcov = None if entry["pcov"] is None else np.asarray(entry["pcov"])
+            fits[job] = fit_scheduler.FitResult(popt, pcov, entry["error"])
+
+    computed = fit_scheduler.run_fits([job for job, _, _ in missing], [task for _, task, _ in missing],
+                                      processes=processes)
+    for (job, _, key), result in zip(missing, computed.values()):
+        fits[job] = result
+        if result.error != fit_scheduler.timeout_error:
+            cache.put(key, result.popt, result.pcov, result.error)
+
+    return fits
+
+
+def read_feature(source_directory, filename, store_directory=None):
+    """
+    Returns the value and count columns of a feature histogram, sorted by value. filename is a CSV file or a
+    columnar_store directory. With a store_directory, CSV files are converted to a store there once and every later
+    run maps the sorted columns instead of parsing and sorting the CSV again.
+    """
+    location = os.path.join(source_directory, filename)
+    if not columnar_store.is_store(location):
+        if store_directory is None:
+            dataset = pd.read_csv(location, header=0)
+            dataset.sort_values(by=dataset.columns[0], inplace=True)
+            return dataset[dataset.columns[0]].values, dataset["count"].values
+        location = columnar_store.cached_store(location, store_directory)
+    columns = columnar_store.open_store(location)
+    return next(iter(columns.values())), columns["count"]
+
+
+def feature_bins(feature, counts, binning="log", bin_budget=default_bin_budget):
+    if binning == "adaptive":
+        return rebinning.adaptive_bins(feature, counts, budget=bin_budget, assume_sorted=True)
+    return rebinning.log_bins(np.nanmax(feature), num=1000)
+
+
+def prepare_datasets(available_data, target_directory, source_directory, store_directory=None, binning="log",
+                     bin_budget=default_bin_budget):
+    prepared = []
     for data_type, features in available_data.items():
         for feature_name, feature_values in features.items():
             # if feature_name not in ["interarrivalTimeByCluster", "interarrivalTimeOfFiles",
@@ -62,18 +232,11 @@ def do_regression(available_data, target_directory, source_directory):
             # if feature_name not in ["pathCountOverall"]:
             #     continue
             print(feature_name)
-            gc.collect()
-
-            # dataset_jan = pd.read_csv(os.path.join(source_directory, feature_values["january"]), header=0)
-            dataset_may = pd.read_csv(os.path.join(source_directory, feature_values["filename"]), header=0)
-
-            # dataset_jan.sort_values(by=dataset_jan.columns[0], inplace=True)
-            dataset_may.sort_values(by=dataset_may.columns[0], inplace=True)
 
-            # dataset_jan.reset_index(drop=True, inplace=True)
-            dataset_may.reset_index(drop=True, inplace=True)
-
-            gc.collect()
+            feature_store = None if store_directory is None else os.path.join(store_directory, data_type)
+            with instrumentation.span("read_feature", feature=feature_name) as record:
+                feature, counts = read_feature(source_directory, feature_values["filename"], feature_store)
+                record["rows"] = feature.shape[0]
 
             canonical_name = feature_name
 
@@ -84,8 +247,9 @@ def do_regression(available_data, target_directory, source_directory):
 
             feature_column_name = feature_name
             
-            bins = np.logspace(start=0, stop=np.log10(dataset_may[feature_column_name].max()), num=1000, endpoint=False, base=10)
-            generated_bins, new_hist = rebin(dataset_may[feature_column_name], dataset_may["count"], bins)
+            bins = feature_bins(feature, counts, binning, bin_budget)
+            generated_bins, new_hist = rebin(feature, counts, bins, assume_sorted=True)
+            del feature, counts
             new_dataset = pd.DataFrame({
                 feature_column_name: generated_bins,
                 "count": new_hist
@@ -98,43 +262,52 @@ def do_regression(available_data, target_directory, source_directory):
                 new_dataset = normalize_count(new_dataset, feature_column_name)
             except Exception as e:
                 print(new_dataset)
-                return
+                return prepared
             
             if new_dataset.shape[0] == 0:
                 continue
-            
-            setup_plots(new_dataset, sf_functions, feature_name, storage_loc, "survival")
-            gc.collect()
-            setup_plots(new_dataset, pdf_functions, feature_name, storage_loc, "pdf")
-            gc.collect()
 
-            setup_plots(new_dataset, sf_functions, feature_name, storage_loc, "survival", "weighted")
-            gc.collect()
-            setup_plots(new_dataset, pdf_functions, feature_name, storage_loc, "pdf", "weighted")
+            prepared.append((data_type, feature_name, new_dataset, storage_loc))
             gc.collect()
 
+    return prepared
 
-def rebin(feature_column, value_column, new_bins):
-    new_hist = []
-    generated_bins = []
-    prev_binvalue = 0
-    for (index,), binvalue in np.ndenumerate(new_bins):
-        sum_of_counts = 0
-        if index == 0:
-            sum_of_counts = value_column[feature_column <= binvalue].sum()
-        elif index == len(new_bins) - 1:
-            sum_of_counts = value_column[feature_column > prev_binvalue].sum()
-        else:
-            sum_of_counts = value_column[(feature_column <= binvalue) & (feature_column > prev_binvalue)].sum()
 
-        if sum_of_counts > 0:
-            new_hist.append(sum_of_counts)
-            generated_bins.append(binvalue)
-        prev_binvalue = binvalue
+def create_fit_tasks(dataset, feature_name, runs=regression_runs, timeout=fit_scheduler.default_timeout,
+                     data_type=None):
+    feature_column_name = dataset.columns[0]
+
+    jobs = []
+    tasks = []
+    for regression_type, weight_nature in runs:
+        for dist_name, func in functions_for(regression_type).items():
+            sigma = dataset["weight"] if weight_nature == "weighted" else None
+            jobs.append(fit_scheduler.FitJob(data_type, feature_name, dist_name, regression_type, weight_nature))
+            tasks.append(fit_scheduler.make_task(func, dataset[feature_column_name], dataset[regression_type],
+                                                 sigma=sigma, timeout=timeout))
+    return jobs, tasks
 
-    return generated_bins, new_hist
+
+def create_mle_fit_tasks(dataset, feature_name, timeout=fit_scheduler.default_timeout, data_type=None):
+    feature_column_name = dataset.columns[0]
+    bins = dataset[feature_column_name].values
+    counts = dataset["count"].values
+
+    jobs = []
+    tasks = []
+    for dist_name in sf_functions:
+        jobs.append(fit_scheduler.FitJob(data_type, feature_name, dist_name, "mle", "binned"))
+        tasks.append(fit_scheduler.make_generic_task(mle_fitting.fit_binned, (dist_name, bins, counts),
+                                                     timeout=timeout))
+    return jobs, tasks
 
 
+def rebin(feature_column, value_column, new_bins, assume_sorted=False):
+    with instrumentation.span("rebin", rows=len(feature_column), bins=len(new_bins)):
+        return rebinning.rebin(feature_column, value_column, new_bins, assume_sorted=assume_sorted)
+
+
+@instrumentation.timed(rows=len)
 def normalize_count(dataset, feature_column_name):
     dataset["pdf"] = dataset["count"] / dataset["count"].sum()
     dataset["cdf"] = dataset["pdf"].cumsum()
@@ -166,91 +339,76 @@ def getLegendPosition(regression_type):
         return (0.3, 0.3)
 
 
-def measure_difference(original, computed, fileprefix, regression_type, weight_nature):
-    dataset_col_to_measure = original.loc[computed.index, "pdf"]
-    # log_dataset_col = np.log(dataset_col_to_measure)
+def evaluate_curves(dist_name, x, popt):
+    # pdf, cdf and survival of a fitted distribution in one fused call.
+    values = dist_functions.evaluate(dist_name, x, popt)
+    return {"pdf": values["pdf"], "cdf": values["cdf"], "survival": values["sf"]}
+
 
-    ks_dist = np.max(np.abs(original.loc[computed.index, "cdf"] - computed["cdf"]))
-    chi2_dist, chi2_p = stats.chisquare(computed["pdf"], dataset_col_to_measure)
+def fit_curves(dataset, func_dict, fits):
+    feature_column_name = dataset.columns[0]
 
-    # print(np.sum(np.logical_not(np.isfinite(np.log(computed["pdf"])))))
-    # print(computed["pdf"][np.logical_not(np.isfinite(np.log(computed["pdf"])))])
+    fitted_curves = OrderedDict()
+    for dist_name in func_dict:
+        fit = fits.get(dist_name)
+        if fit is None or fit.popt is None:
+            continue
 
-    # kl_divergence = np.dot(dataset_col_to_measure, log_dataset_col - np.log(computed["pdf"]))
+        curves = evaluate_curves(dist_name, dataset[feature_column_name], fit.popt)
+        curves["popt"] = fit.popt
+        fitted_curves[dist_name] = curves
+    return fitted_curves
 
-    return {
-        "ks_dist": ks_dist,
-        "chi2_dist": chi2_dist,
-        "chi2_p": chi2_p
-    }
 
+def dataset_location(fileprefix):
+    return "{}_data.parquet".format(fileprefix)
 
-def setup_plots(dataset, func_dict, feature_name, fileprefix, regression_type, weight_nature="unweighted"):
-    feature_column_name = dataset.columns[0]
 
-    xlabel = feature_to_xlab_map[feature_name]
-    ylabel = feature_to_ylab_map[feature_name]
-
-    regressed_data_dfs = {}
-    diffs_quantified = {}
-
-    for dist_name, func in func_dict.items():
-        try:
-            if weight_nature == "weighted":
-                popt, pcov = curve_fit(func, dataset[feature_column_name], dataset[regression_type], maxfev=1000,
-                                       sigma=dataset["weight"], absolute_sigma=True)
-            else:
-                popt, pcov = curve_fit(func, dataset[feature_column_name], dataset[regression_type], maxfev=1000)
-
-            df = pd.DataFrame({
-                "variates": dataset[feature_column_name],
-                "pdf": pdf_functions[dist_name](dataset[feature_column_name], *popt),
-                "cdf": cdf_functions[dist_name](dataset[feature_column_name], *popt),
-                "survival": sf_functions[dist_name](dataset[feature_column_name], *popt),
-                "dist_name": dist_name
-            })
+def results_location(fileprefix, regression_type, weight_nature):
+    return "{}_{}_{}.json".format(fileprefix, regression_type, weight_nature)
+
+
+def plot_location(fileprefix, regression_type, weight_nature):
+    return "{}_{}_{}.png".format(fileprefix, regression_type, weight_nature)
+
 
-            # Filter NaN values
-            df = df[np.isfinite(df["pdf"]) & (df["pdf"] > 0)]
-            df = df[np.isfinite(df["survival"]) & (df["survival"] > 0)]
+def store_dataset(dataset, fileprefix):
+    dataset.to_parquet(dataset_location(fileprefix), index=False)
 
-            regressed_data_dfs[dist_name] = df
 
-            diffs = measure_difference(dataset, df, fileprefix, regression_type, weight_nature)
-            diffs_quantified[dist_name] = diffs
-        except RuntimeError:
-            print("Unable to fit: {} to {} with {}", regression_type, dist_name, weight_nature)
+def store_fit_results(dataset, func_dict, fileprefix, regression_type, weight_nature="unweighted", fits=None):
+    """
+    Scores the fits and writes the metrics together with the fitted parameters, which is all the rendering stage
+    needs besides the stored dataset.
+    """
+    for dist_name in func_dict:
+        fit = fits.get(dist_name)
+        if fit is None or fit.popt is None:
+            print("Unable to fit: {} to {} with {}".format(regression_type, dist_name, weight_nature))
 
-    with open("{}_{}_{}.json".format(fileprefix, regression_type, weight_nature), "w") as f:
+    fitted_curves = fit_curves(dataset, func_dict, fits)
+    diffs_quantified = fit_metrics.score_fits(dataset, fitted_curves)
+    for dist_name, diffs in diffs_quantified.items():
+        diffs["popt"] = [float(value) for value in fitted_curves[dist_name]["popt"]]
+
+    with open(results_location(fileprefix, regression_type, weight_nature), "w") as f:
         json.dump(diffs_quantified, f, indent=2)
 
-    dataset["dist_name"] = "original"
-
-    # print(dataset[[feature_column_name, regression_type]])
-    # print(dataset[regression_type].min())
-    # print(dataset.shape)
-
-    plt_layers = ggplot(dataset) + \
-                 theme_light(base_size=16) + \
-                 theme(legend_title=element_text(size=0, alpha=0),
-                       legend_box_spacing=0.1,
-                       legend_box_margin=0,
-                       legend_margin=0) + \
-                 geom_point(aes(x=feature_column_name, y=regression_type, color="dist_name")) + \
-                 scale_x_log10(labels=formatYaxisLabels) + \
-                 scale_y_log10(limits=(dataset[regression_type].min(), 1), labels=formatYaxisLabels) + \
-                 xlab(xlabel) +\
-                 ylab(ylabel)
-
-    for dist_name, df in regressed_data_dfs.items():
-        plt_layers = plt_layers + geom_line(aes(x="variates", y=regression_type, color="dist_name"), data=df)
-
-    # fig = plt_layers.draw()
-    # axs = fig.get_axes()
-    # ax1 = axs[0]
-    # ax1.set_yscale('log')
-    # ax1.set_ybound(lower=dataset[regression_type].min(), upper=1)
-    #
-    # fig.savefig("{}_{}_{}.png".format(fileprefix, regression_type, weight_nature), bbox_inches='tight', dpi=300)
-
-    plt_layers.save("{}_{}_{}.png".format(fileprefix, regression_type, weight_nature), dpi=300)
+    return diffs_quantified
+
+
+def setup_plots(dataset, func_dict, feature_name, fileprefix, regression_type, weight_nature="unweighted", fits=None,
+                render=True):
+    if fits is None:
+        jobs, tasks = create_fit_tasks(dataset, feature_name, runs=[(regression_type, weight_nature)])
+        fits = OrderedDict((job.dist_name, result) for job, result in fit_scheduler.run_fits(jobs, tasks, 1).items())
+
+    store_dataset(dataset, fileprefix)
+    diffs_quantified = store_fit_results(dataset, func_dict, fileprefix, regression_type, weight_nature, fits=fits)
+
+    if render:
+        import render_plots
+        popts = OrderedDict((dist_name, diffs["popt"]) for dist_name, diffs in diffs_quantified.items())
+        render_plots.render_fits(dataset.copy(), popts, feature_name, fileprefix, regression_type, weight_nature)
+
+    return diffs_quantified
@@ -0,0 +1,149 @@
+"""
+Rendering stage of the regression pipeline.
+
+Plots are drawn from the results regression.do_regression stores on disk (the rebinned dataset as Parquet and the
+fitted parameters in the JSON next to it), so they can be drawn later or in background processes without refitting.
+"""
+
+import glob
+import json
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+from plotnine import *
+
+import instrumentation
+import regression
+
+_executor = None
+_pending = []
+
+
+def render_fits(dataset, popts, feature_name, fileprefix, regression_type, weight_nature="unweighted"):
+    feature_column_name = dataset.columns[0]
+
+    xlabel = regression.feature_to_xlab_map[feature_name]
+    ylabel = regression.feature_to_ylab_map[feature_name]
+
+    regressed_data_dfs = {}
+    for dist_name, popt in popts.items():
+        curves = regression.evaluate_curves(dist_name, dataset[feature_column_name], popt)
+        df = pd.DataFrame({
+            "variates": dataset[feature_column_name],
+            "pdf": curves["pdf"],
+            "cdf": curves["cdf"],
+            "survival": curves["survival"],
+            "dist_name": dist_name
+        })
+
+        # Filter NaN values
+        df = df[np.isfinite(df["pdf"]) & (df["pdf"] > 0)]
+        df = df[np.isfinite(df["survival"]) & (df["survival"] > 0)]
+
+        regressed_data_dfs[dist_name] = df
+
+    dataset["dist_name"] = "original"
+
+    plt_layers = ggplot(dataset) + \
+                 theme_light(base_size=16) + \
+                 theme(legend_title=element_text(size=0, alpha=0),
+                       legend_box_spacing=0.1,
+                       legend_box_margin=0,
+                       legend_margin=0) + \
+                 geom_point(aes(x=feature_column_name, y=regression_type, color="dist_name")) + \
+                 scale_x_log10(labels=regression.formatYaxisLabels) + \
+                 scale_y_log10(limits=(dataset[regression_type].min(), 1), labels=regression.formatYaxisLabels) + \
+                 xlab(xlabel) +\
+                 ylab(ylabel)
+
+    for dist_name, df in regressed_data_dfs.items():
+        plt_layers = plt_layers + geom_line(aes(x="variates", y=regression_type, color="dist_name"), data=df)
+
+    plt_layers.save(regression.plot_location(fileprefix, regression_type, weight_nature), dpi=300)
+
+
+def render_stored(fileprefix, regression_type, weight_nature="unweighted"):
+    dataset = pd.read_parquet(regression.dataset_location(fileprefix))
+    with open(regression.results_location(fileprefix, regression_type, weight_nature)) as f:
+        results = json.load(f, object_pairs_hook=OrderedDict)
+
+    popts = OrderedDict((dist_name, diffs["popt"]) for dist_name, diffs in results.items())
+    render_fits(dataset, popts, dataset.columns[0], fileprefix, regression_type, weight_nature)
+    return regression.plot_location(fileprefix, regression_type, weight_nature)
+
+
+def _render_job(job):
+    fileprefix, regression_type, weight_nature = job
+    with instrumentation.span("render", fileprefix=fileprefix, regression_type=regression_type,
+                              weight_nature=weight_nature):
+        return render_stored(*job)
+
+
+def _result(future):
+    # Renders submitted while profiling return their events along with the plot location. The events are merged
+    # only the first time the result is asked for.
+    if getattr(future, "collecting", False):
+        future.location = instrumentation.absorb([future.result()])[0]
+        future.collecting = False
+    return getattr(future, "location", None) or future.result()
+
+
+def render_stored_fits(render_jobs, processes=None, background=False):
+    """
+    Renders (fileprefix, regression_type, weight_nature) jobs. processes=1 renders in the calling process. With
+    background=True the jobs are queued on a shared process pool and this returns immediately; use
+    wait_for_renders to block until they are drawn.
+    """
+    global _executor
+
+    if processes == 1 and not background:
+        return [_render_job(job) for job in render_jobs]
+
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=processes)
+    collecting = instrumentation.is_enabled()
+    render = instrumentation.Collecting(_render_job) if collecting else _render_job
+    futures = []
+    for job in render_jobs:
+        future = _executor.submit(render, job)
+        future.collecting = collecting
+        futures.append(future)
+    _pending.extend(futures)
+
+    if background:
+        return futures
+    return [_result(future) for future in futures]
+
+
+def wait_for_renders():
+    global _executor
+
+    done, _ = wait(_pending)
+    del _pending[:]
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    return [_result(future) for future in done]
+
+
+def find_stored_fits(directory):
+    render_jobs = []
+    for data_file in sorted(glob.glob(os.path.join(directory, "**", "*_data.parquet"), recursive=True)):
+        fileprefix = data_file[:-len("_data.parquet")]
+        for regression_type, weight_nature in regression.regression_runs:
+            if os.path.exists(regression.results_location(fileprefix, regression_type, weight_nature)):
+                render_jobs.append((fileprefix, regression_type, weight_nature))
+    return render_jobs
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python render_plots.py <directory with regression results> [processes]")
+        sys.exit(1)
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    for plot in render_stored_fits(find_stored_fits(sys.argv[1]), processes=processes):
+        print(plot)
@@ -0,0 +1,734 @@
+"""
+Runs the analyses of the notebooks headless, as a dependency graph of stages.
+
+    python run_analysis.py run --traces <dir with trace directories> --output <dir> --stages hurst,cp,lop
+    python run_analysis.py run --traces <dir with trace directories> --output <dir> --preview 0.05
+    python run_analysis.py list
+
+Every stage writes its results to the output directory. A stage is skipped when the stamp of its previous run matches
+the current fingerprint of its inputs: the Parquet files of the traces, the stage's options, the source of the
+modules it runs, and the stamps of the stages it depends on. Stages whose dependencies are done run concurrently, and
+stages that go over many traces spread them over a process pool. Timings are printed at the end and stored in
+timings.json; with --profile the spans of the hot paths (see instrumentation) are exported as well. With --preview the
+trace analyses are estimated from a sample of the row groups of every trace (see preview), with error bounds, into
+<output>/preview.
+"""
+
+import argparse
+import ast
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+import instrumentation
+
+base_directory = os.path.dirname(os.path.abspath(__file__))
+
+stamp_directory_name = ".stamps"
+timings_file_name = "timings.json"
+
+hurst_excluded_prefixes = ["askalon-new_ee68_", "OLD", "workflowhub"]
+
+default_preview_fraction = 0.05
+
+
+def _trace_directories(traces_location):
+    return [name for name in sorted(os.listdir(traces_location))
+            if os.path.isdir(os.path.join(traces_location, name))]
+
+
+def _map(function, items, processes):
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    pool = multiprocessing.Pool(processes=min(processes, len(items)))
+    try:
+        return instrumentation.pool_map(pool, function, items)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _output(context, *parts):
+    path = os.path.join(context["output"], *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def run_catalog(context):
+    import trace_catalog
+    trace_catalog.open_catalog(context["traces"], _output(context, trace_catalog.catalog_file_name))
+
+
+def _open_catalog(context):
+    import trace_catalog
+    return trace_catalog.TraceCatalog(os.path.join(context["output"], trace_catalog.catalog_file_name))
+
+
+def run_profiles(context):
+    import arrival_profiles
+    if context.get("preview"):
+        _preview_profiles(context)
+        return
+    catalog = _open_catalog(context)
+    for period, file_name in [(arrival_profiles.hours_in_a_week, "tasks_per_hour_of_week.csv"),
+                              (arrival_profiles.hours_in_a_day, "tasks_per_hour_of_day.csv")]:
+        frame = arrival_profiles.arrival_profiles(context["traces"], period=period, catalog=catalog,
+                                                  processes=context["processes"])
+        frame.to_csv(_output(context, "profiles", file_name), index=False)
+
+
+def _preview_profiles(context):
+    import arrival_profiles
+    import preview
+    estimates = preview.hourly_estimates(context["traces"], context["preview"], context.get("preview_seed", 0),
+                                         processes=context["processes"])
+    for period, file_name in [(arrival_profiles.hours_in_a_week, "tasks_per_hour_of_week.csv"),
+                              (arrival_profiles.hours_in_a_day, "tasks_per_hour_of_day.csv")]:
+        frame = preview.arrival_profiles_estimate(estimates, period=period)
+        frame.to_csv(_output(context, "profiles", file_name), index=False)
+    preview.write_sampling([record for _, _, _, _, record in estimates.values()],
+                           _output(context, "profiles", "sampling.csv"))
+
+
+def _hurst_rows(task):
+    import arrival_series
+    import trace_names
+
+    traces_location, output_location, trace_name = task
+    counts_per_scale = arrival_series.trace_multi_scale_counts(os.path.join(traces_location, trace_name))
+    arrival_series.write_series(os.path.join(output_location, trace_name), counts_per_scale)
+    return _hurst_estimates(counts_per_scale,
+                            trace_names.folder_name_to_display_name(trace_name, trace_names.name_to_hurst_name_map))
+
+
+def _hurst_estimates(counts_per_scale, workload_name):
+    import arrival_series
+    import hurst_estimators
+
+    rows = []
+    for counts, time_scale, samples in zip(counts_per_scale, arrival_series.time_scales,
+                                           arrival_series.num_samples):
+        windows = arrival_series.sample_windows(counts, samples)
+        if windows.shape[0] == 0:
+            continue
+        estimate = hurst_estimators.combine_samples(hurst_estimators.rescaled_range(windows))
+        rows.append({
+            "workload": workload_name,
+            "window_size": time_scale,
+            "hurst_parameter": estimate.hurst,
+            "stderr": estimate.stderr,
+            "lower": estimate.lower,
+            "upper": estimate.upper,
+        })
+    return rows
+
+
+def _preview_hurst_rows(task):
+    import preview
+    import trace_names
+    traces_location, trace_name, fraction, seed = task
+    return preview.hurst_rows(os.path.join(traces_location, trace_name),
+                              trace_names.folder_name_to_display_name(trace_name, trace_names.name_to_hurst_name_map),
+                              fraction, seed)
+
+
+def _preview_hurst(context, trace_names_to_analyze):
+    import preview
+    tasks = [(context["traces"], trace_name, context["preview"], context.get("preview_seed", 0))
+             for trace_name in trace_names_to_analyze]
+    results = _map(_preview_hurst_rows, tasks, context["processes"])
+    rows = [row for trace_rows, _ in results for row in trace_rows]
+    pd.DataFrame(rows, columns=["workload", "window_size", "hurst_parameter", "stderr", "lower", "upper",
+                                "windows"]).to_csv(_output(context, "hurst", "hurst_parameters.csv"), index=False)
+    preview.write_sampling([record for _, record in results], _output(context, "hurst", "sampling.csv"))
+
+
+def run_hurst(context):
+    import arrival_series
+    import trace_reader
+    if context.get("preview"):
+        # The catalog is not built for previews; the row-group statistics tell whether a trace is long enough.
+        long_enough = [trace_name for trace_name in _trace_directories(context["traces"])
+                       if trace_reader.do_tasks_exist(os.path.join(context["traces"], trace_name)) and
+                       trace_reader.is_trace_long_enough(os.path.join(context["traces"], trace_name),
+                                                         arrival_series.six_days_in_milliseconds)]
+    else:
+        long_enough = _open_catalog(context).long_enough(arrival_series.six_days_in_milliseconds)
+    trace_names_to_analyze = [
+        trace_name for trace_name in long_enough
+        if trace_name.endswith("parquet") and not any(trace_name.startswith(prefix)
+                                                      for prefix in hurst_excluded_prefixes)]
+    if context.get("preview"):
+        _preview_hurst(context, trace_names_to_analyze)
+        return
+    series_location = _output(context, "hurst", "series", "")
+    tasks = [(context["traces"], series_location, trace_name) for trace_name in trace_names_to_analyze]
+    rows = [row for trace_rows in _map(_hurst_rows, tasks, context["processes"]) for row in trace_rows]
+    pd.DataFrame(rows, columns=["workload", "window_size", "hurst_parameter", "stderr", "lower", "upper"]).to_csv(
+        _output(context, "hurst", "hurst_parameters.csv"), index=False)
+
+
+def run_structure(context):
+    import workflow_structure
+    workflow_structure.write_structure_ssv(context["traces"], _trace_directories(context["traces"]),
+                                           _output(context, "structure", "structure.ssv"))
+
+
+# Row predicates (see sketches.row_filter) of the notebooks per stage and grouping. Notebook 4 keeps the workflows with
+# a positive critical path task count, notebook 5 those with a non-negative one; the critical path length is taken
+# from the same rows. Notebooks 6 and 7 keep the workflows with a positive approximate level of parallelism.
+distribution_predicates = {
+    "cp": OrderedDict([("domain", ("critical_path_task_count", 0, False)),
+                       ("source", ("critical_path_task_count", 0, True))]),
+    "lop": OrderedDict([("domain", ("approx_max_concurrent_tasks", 0, False)),
+                        ("source", ("approx_max_concurrent_tasks", 0, False))]),
+}
+
+
+def _metrics_location(context, trace_name):
+    return os.path.join(context["output"], "workflow_metrics", trace_name, "workflow_metrics.parquet")
+
+
+def _sketch_task(task):
+    import sketches
+    import trace_reader
+    trace_location, metrics_location, column_names, predicates = task
+    stored = {}
+    for predicate in predicates:
+        if metrics_location is None:
+            trace_sketches = sketches.trace_sketches(trace_location, column_names,
+                                                     filter=sketches.row_filter(predicate))
+        else:
+            table = trace_reader.read_files([metrics_location], column_names, filter=sketches.row_filter(predicate))
+            trace_sketches = sketches.batch_sketches(table.to_batches(), column_names)
+        stored[sketches.predicate_name(predicate)] = dict(
+            (column_name, sketch.to_dict()) for column_name, sketch in trace_sketches.items())
+    return stored
+
+
+def _preview_sketch_task(task):
+    import preview
+    import sketches
+    trace_location, column_names, predicates, fraction, seed = task
+    stored = {}
+    for predicate in predicates:
+        stored[sketches.predicate_name(predicate)] = columns = {}
+        for column_name in column_names:
+            sketch, variance, record = preview.sketch_estimate(trace_location, column_name, fraction, seed,
+                                                               predicate=predicate)
+            columns[column_name] = dict(sketch.to_dict(), cdf_variance=variance.tolist(), sampling=record)
+    return stored
+
+
+def _distribution_stage(context, stage_name, column_names):
+    """
+    Sketches column_names of every trace whose workflows table has them, or else of the workflow metrics the metrics
+    stage computed from its tasks, and writes the distributions per domain and per source.
+    """
+    import sketches
+    import trace_names
+    import trace_reader
+
+    predicates = distribution_predicates[stage_name]
+    distinct_predicates = list(OrderedDict((predicate, None) for predicate in predicates.values()))
+    tasks = OrderedDict()
+    for trace_name in _trace_directories(context["traces"]):
+        trace_location = os.path.join(context["traces"], trace_name)
+        if trace_reader.do_workflows_exist(trace_location) and \
+                set(column_names).issubset(trace_reader.column_names(trace_location, "workflows")):
+            tasks[trace_name] = (trace_location, None)
+        elif not context.get("preview") and os.path.exists(_metrics_location(context, trace_name)):
+            tasks[trace_name] = (trace_location, _metrics_location(context, trace_name))
+
+    if context.get("preview"):
+        # Previews sample the row groups of the workflows tables; the metrics stage is not run for them.
+        preview_tasks = [(trace_location, column_names, distinct_predicates, context["preview"],
+                          context.get("preview_seed", 0))
+                         for trace_location, metrics_location in tasks.values() if metrics_location is None]
+        stored = OrderedDict(zip([trace_name for trace_name, (_, metrics_location) in tasks.items()
+                                  if metrics_location is None],
+                                 _map(_preview_sketch_task, preview_tasks, context["processes"])))
+    else:
+        sketch_tasks = [(trace_location, metrics_location, column_names, distinct_predicates)
+                        for trace_location, metrics_location in tasks.values()]
+        stored = OrderedDict(zip(tasks, _map(_sketch_task, sketch_tasks, context["processes"])))
+    with open(_output(context, stage_name, "sketches.json"), "w") as f:
+        json.dump(stored, f)
+    if context.get("preview"):
+        _preview_distribution_frames(context, stage_name, column_names, stored)
+        return
+
+    for group_column, to_group in [("domain", trace_names.folder_name_to_domain),
+                                   ("source", trace_names.folder_name_to_source)]:
+        name = sketches.predicate_name(predicates[group_column])
+        groups = [to_group(trace_name) for trace_name in stored]
+        for column_name in column_names:
+            trace_sketches = [sketches.LogHistogram.from_dict(columns[name][column_name])
+                              for columns in stored.values()]
+            for normalized, suffix in [(True, "normalized"), (False, "unnormalized")]:
+                frame = sketches.group_frame(trace_sketches, groups, column_name, group_column, normalized)
+                frame.to_csv(_output(context, stage_name, "{}_{}_{}_stratified.csv".format(
+                    column_name, suffix, group_column)), index=False)
+
+
+def _preview_distribution_frames(context, stage_name, column_names, stored):
+    import numpy as np
+    import preview
+    import sketches
+    import trace_names
+
+    predicates = distribution_predicates[stage_name]
+    for group_column, to_group in [("domain", trace_names.folder_name_to_domain),
+                                   ("source", trace_names.folder_name_to_source)]:
+        name = sketches.predicate_name(predicates[group_column])
+        groups = [to_group(trace_name) for trace_name in stored]
+        for column_name in column_names:
+            estimates = [(sketches.LogHistogram.from_dict(columns[name][column_name]),
+                          np.asarray(columns[name][column_name]["cdf_variance"]),
+                          columns[name][column_name]["sampling"]["sampled_row_groups"] - 1)
+                         for columns in stored.values()]
+            for normalized, suffix in [(True, "normalized"), (False, "unnormalized")]:
+                frame = preview.group_frame(estimates, groups, column_name, group_column, normalized)
+                frame.to_csv(_output(context, stage_name, "{}_{}_{}_stratified.csv".format(
+                    column_name, suffix, group_column)), index=False)
+    name = sketches.predicate_name(predicates["domain"])
+    preview.write_sampling([columns[name][column_names[0]]["sampling"] for columns in stored.values()],
+                           _output(context, stage_name, "sampling.csv"))
+
+
+def run_critical_path(context):
+    _distribution_stage(context, "cp", ["critical_path_task_count", "critical_path_length"])
+
+
+def run_parallelism(context):
+    _distribution_stage(context, "lop", ["approx_max_concurrent_tasks"])
+
+
+def run_workflow_metrics(context):
+    import trace_reader
+    import workflow_metrics
+    for trace_name in _trace_directories(context["traces"]):
+        trace_location = os.path.join(context["traces"], trace_name)
+        if not workflow_metrics.has_tasks(trace_location):
+            continue
+        if not {"workflow_id", "children", "runtime"}.issubset(trace_reader.column_names(trace_location)):
+            continue
+        frame = workflow_metrics.workflow_metrics(trace_location, processes=context["processes"])
+        frame.to_parquet(_output(context, "workflow_metrics", trace_name, "workflow_metrics.parquet"))
+
+
+def _regression_config(context):
+    if not context.get("regression_config"):
+        raise ValueError("The regression stage needs --regression-config")
+    with open(context["regression_config"]) as f:
+        return json.load(f)
+
+
+def run_regression(context):
+    import regression
+    config = _regression_config(context)
+    binning = config.get("binning", "log")
+    bin_budget = config.get("bin_budget", regression.default_bin_budget)
+    bootstrap_resamples = config.get("bootstrap_resamples", 0)
+    if context.get("preview"):
+        import preview
+        binning = "adaptive"
+        bin_budget = min(bin_budget, preview.bin_budget)
+    regression.do_regression(config["available_data"], _output(context, "regression", ""), config["source_directory"],
+                             processes=context["processes"], mode=config.get("mode", "least_squares"),
+                             render=config.get("render", "sync"),
+                             cache_directory=config.get("cache_directory"),
+                             store_directory=config.get("store_directory"), binning=binning, bin_budget=bin_budget,
+                             bootstrap_resamples=bootstrap_resamples,
+                             bootstrap_seed=config.get("bootstrap_seed", 0))
+
+
+def _incremental_update(task):
+    import incremental
+    traces_location, state_location, trace_name = task
+    return incremental.TraceState(os.path.join(state_location, trace_name)).update(
+        os.path.join(traces_location, trace_name))
+
+
+def run_incremental(context):
+    # The profiles, Hurst, structure and regression analyses from per-trace states that only fold in the part files
+    # appended since the last run (see incremental). Only the histograms that moved are fitted again.
+    import arrival_profiles
+    import arrival_series
+    import incremental
+    import regression
+    import trace_names
+    import trace_reader
+    import workflow_structure
+
+    state_location = _output(context, "incremental", "state", "")
+    trace_names_to_update = [trace_name for trace_name in _trace_directories(context["traces"])
+                             if trace_reader.do_tasks_exist(os.path.join(context["traces"], trace_name))]
+    tasks = [(context["traces"], state_location, trace_name) for trace_name in trace_names_to_update]
+    reports = _map(_incremental_update, tasks, context["processes"])
+    states = OrderedDict((trace_name, incremental.TraceState(os.path.join(state_location, trace_name)))
+                         for trace_name in trace_names_to_update)
+
+    for period, file_name in [(arrival_profiles.hours_in_a_week, "tasks_per_hour_of_week.csv"),
+                              (arrival_profiles.hours_in_a_day, "tasks_per_hour_of_day.csv")]:
+        offsets = arrival_profiles.week_offsets if period == arrival_profiles.hours_in_a_week else \
+            arrival_profiles.day_offsets
+        frames = [arrival_profiles.profile_frame(state.hourly_counts(), period,
+                                                 arrival_profiles.trace_offset(trace_name, offsets),
+                                                 trace_names.folder_name_to_display_name(trace_name))
+                  for trace_name, state in states.items()
+                  if state.meta["max_ts_submit"] is not None and
+                  state.meta["max_ts_submit"] >= trace_reader.one_week_in_milliseconds and
+                  not any(trace_name.startswith(prefix) for prefix in arrival_profiles.excluded_prefixes)]
+        frame = pd.concat(frames, ignore_index=True) if frames else \
+            arrival_profiles.profile_frame(arrival_profiles.HourlyCounts(), period, 0, "")
+        frame.to_csv(_output(context, "incremental", "profiles", file_name), index=False)
+
+    rows = [row for trace_name, state in states.items()
+            if state.meta["max_ts_submit"] is not None and
+            state.meta["max_ts_submit"] >= arrival_series.six_days_in_milliseconds and
+            trace_name.endswith("parquet") and not any(trace_name.startswith(prefix)
+                                                       for prefix in hurst_excluded_prefixes)
+            for row in _hurst_estimates(state.scale_counts(), trace_names.folder_name_to_display_name(
+                trace_name, trace_names.name_to_hurst_name_map))]
+    pd.DataFrame(rows, columns=["workload", "window_size", "hurst_parameter", "stderr", "lower", "upper"]).to_csv(
+        _output(context, "incremental", "hurst", "hurst_parameters.csv"), index=False)
+
+    with open(_output(context, "incremental", "structure", "structure.ssv"), "w") as f:
+        f.write("trace relationship count\n")
+        for trace_name, state in states.items():
+            for row in workflow_structure.structure_rows(trace_name, state.meta["relationships"]):
+                f.write(row + "\n")
+
+    config = _regression_config(context) if context.get("regression_config") else {}
+    for report, (trace_name, state) in zip(reports, states.items()):
+        report["refitted"] = []
+        for feature in state.features_to_refit(config.get("refit_tolerance", incremental.default_refit_tolerance)):
+            source_directory = _output(context, "incremental", "regression_inputs", trace_name, "")
+            file_name = state.write_regression_input(feature, source_directory)
+            regression.do_regression({trace_name: {feature: {"filename": file_name}}},
+                                     _output(context, "incremental", "regression", ""), source_directory,
+                                     processes=context["processes"], mode=config.get("mode", "least_squares"),
+                                     render=config.get("render", "none"))
+            state.mark_fitted(feature)
+            report["refitted"].append(feature)
+    pd.DataFrame(reports, columns=incremental.update_columns).to_csv(
+        _output(context, "incremental", "updates.csv"), index=False)
+
+
+def run_survey(context):
+    from survey_scripts import parse_survey_csv
+    parse_survey_csv.main(output_directory=_output(context, "survey", ""))
+
+
+def _trace_inputs(context):
+    import trace_catalog
+    return dict((trace_name, trace_catalog.fingerprint(os.path.join(context["traces"], trace_name)))
+                for trace_name in _trace_directories(context["traces"]))
+
+
+def _regression_inputs(context):
+    import columnar_store
+    config = _regression_config(context)
+    inputs = {"config": config}
+    for data_type, features in config["available_data"].items():
+        for feature_name, feature_values in features.items():
+            path = os.path.join(config["source_directory"], feature_values["filename"])
+            if columnar_store.is_store(path):
+                path = os.path.join(path, columnar_store.meta_file_name)
+            if os.path.exists(path):
+                stat = os.stat(path)
+                inputs[path] = [stat.st_size, stat.st_mtime_ns]
+    return inputs
+
+
+def _incremental_inputs(context):
+    # The refits read refit_tolerance, mode and render from the regression config, so it is an input as well.
+    config = _regression_config(context) if context.get("regression_config") else None
+    return {"traces": _trace_inputs(context), "regression_config": config}
+
+
+def _survey_inputs(context):
+    from survey_scripts import parse_survey_csv
+    stat = os.stat(parse_survey_csv.path_to_csv)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# sources are the modules the stage imports; together with the repository modules they import in turn (see
+# stage_sources) their code determines the stage's output. inputs returns what the stage reads.
+Stage = namedtuple("Stage", ["name", "function", "dependencies", "sources", "inputs"])
+
+stages = OrderedDict((stage.name, stage) for stage in [
+    Stage("catalog", run_catalog, [], ["trace_catalog.py"], _trace_inputs),
+    Stage("profiles", run_profiles, ["catalog"], ["arrival_profiles.py", "trace_catalog.py", "preview.py"],
+              _trace_inputs),
+    Stage("hurst", run_hurst, ["catalog"], ["arrival_series.py", "hurst_estimators.py", "trace_catalog.py",
+                                            "trace_names.py", "trace_reader.py", "preview.py"],
+              _trace_inputs),
+    Stage("structure", run_structure, [], ["workflow_structure.py"], _trace_inputs),
+    Stage("metrics", run_workflow_metrics, [], ["workflow_metrics.py", "trace_reader.py"], _trace_inputs),
+    Stage("cp", run_critical_path, ["metrics"], ["sketches.py", "trace_names.py", "trace_reader.py", "preview.py"],
+              _trace_inputs),
+    Stage("lop", run_parallelism, ["metrics"], ["sketches.py", "trace_names.py", "trace_reader.py", "preview.py"],
+              _trace_inputs),
+    Stage("regression", run_regression, [], ["regression.py", "preview.py"], _regression_inputs),
+    Stage("incremental", run_incremental, [],
+              ["incremental.py", "arrival_profiles.py", "arrival_series.py", "hurst_estimators.py",
+               "workflow_structure.py", "trace_names.py", "trace_reader.py", "regression.py"], _incremental_inputs),
+    Stage("survey", run_survey, [], [os.path.join("survey_scripts", "parse_survey_csv.py")], _survey_inputs),
+])
+
+default_stages = ["catalog", "profiles", "hurst", "structure", "metrics", "cp", "lop"]
+
+# Previews (see preview) read row-group statistics instead of the catalog, so a preview does not build it, and only
+# sample the workflows tables, so it does not compute the workflow metrics either.
+preview_dropped_dependencies = ["catalog", "metrics"]
+
+
+def stage_dependencies(stage_name, preview=False):
+    dependencies = stages[stage_name].dependencies
+    if preview:
+        return [dependency for dependency in dependencies if dependency not in preview_dropped_dependencies]
+    return dependencies
+
+
+def with_dependencies(stage_names, preview=False):
+    ordered = []
+
+    def visit(stage_name):
+        if stage_name not in stages:
+            raise ValueError("Unknown stage: {}".format(stage_name))
+        if stage_name in ordered:
+            return
+        for dependency in stage_dependencies(stage_name, preview):
+            visit(dependency)
+        ordered.append(stage_name)
+
+    for stage_name in stage_names:
+        visit(stage_name)
+    return ordered
+
+
+def _imported_modules(source):
+    # Names of the modules a source file imports, at the top or inside functions.
+    with open(os.path.join(base_directory, source)) as f:
+        tree = ast.parse(f.read(), source)
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.append(node.module)
+            names.extend("{}.{}".format(node.module, alias.name) for alias in node.names)
+    return names
+
+
+def stage_sources(stage):
+    """
+    The sources of a stage and the source files of every repository module they import, directly or not.
+    """
+    found = []
+    pending = list(stage.sources)
+    while pending:
+        source = pending.pop(0)
+        if source in found:
+            continue
+        found.append(source)
+        for name in _imported_modules(source):
+            path = name.replace(".", os.sep) + ".py"
+            if os.path.exists(os.path.join(base_directory, path)):
+                pending.append(path)
+    return sorted(found)
+
+
+def stage_fingerprint(stage, context, dependency_fingerprints):
+    digest = hashlib.sha256()
+    for source in stage_sources(stage):
+        with open(os.path.join(base_directory, source), "rb") as f:
+            digest.update(f.read())
+    options = dict((key, context.get(key)) for key in ["traces", "regression_config", "preview", "preview_seed"])
+    for part in [options, stage.inputs(context), dependency_fingerprints]:
+        digest.update(b"\0")
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _stamp_location(context, stage_name):
+    return os.path.join(context["output"], stamp_directory_name, stage_name)
+
+
+def _read_stamp(context, stage_name):
+    try:
+        with open(_stamp_location(context, stage_name)) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _write_stamp(context, stage_name, fingerprint):
+    path = _stamp_location(context, stage_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(fingerprint)
+
+
+def _run_stage(stage_name, context):
+    if context.get("profile"):
+        instrumentation.enable()
+        instrumentation.reset()
+    start = time.time()
+    start_cpu = time.process_time()
+    with instrumentation.span("stage", stage=stage_name):
+        stages[stage_name].function(context)
+    return time.time() - start, time.process_time() - start_cpu, instrumentation.events()
+
+
+def run(context, stage_names, jobs=1, force=False):
+    """
+    Runs the stages and their dependencies. Returns an OrderedDict of stage name to its timing record.
+    """
+    order = with_dependencies(stage_names, context.get("preview"))
+    fingerprints = {}
+    timings = OrderedDict()
+    pending = list(order)
+    running = {}
+    failed = set()
+
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=max(jobs, 1))
+    try:
+        while pending or running:
+            for stage_name in list(pending):
+                dependencies = stage_dependencies(stage_name, context.get("preview"))
+                if any(dependency in failed for dependency in dependencies):
+                    pending.remove(stage_name)
+                    failed.add(stage_name)
+                    timings[stage_name] = {"status": "blocked", "wall_time": 0.0, "cpu_time": 0.0}
+                    continue
+                if any(dependency not in fingerprints for dependency in dependencies):
+                    continue
+
+                pending.remove(stage_name)
+                try:
+                    fingerprint = stage_fingerprint(stages[stage_name], context,
+                                                    [fingerprints[dependency] for dependency in dependencies])
+                except Exception as e:
+                    failed.add(stage_name)
+                    timings[stage_name] = {"status": "failed", "error": repr(e), "wall_time": 0.0, "cpu_time": 0.0}
+                    continue
+                if not force and _read_stamp(context, stage_name) == fingerprint:
+                    fingerprints[stage_name] = fingerprint
+                    timings[stage_name] = {"status": "skipped", "wall_time": 0.0, "cpu_time": 0.0}
+                    continue
+                running[executor.submit(_run_stage, stage_name, context)] = (stage_name, fingerprint)
+
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(list(running), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                stage_name, fingerprint = running.pop(future)
+                try:
+                    wall_time, cpu_time, stage_events = future.result()
+                except Exception as e:
+                    failed.add(stage_name)
+                    timings[stage_name] = {"status": "failed", "error": repr(e), "wall_time": 0.0, "cpu_time": 0.0}
+                    continue
+                instrumentation.merge(stage_events)
+                _write_stamp(context, stage_name, fingerprint)
+                fingerprints[stage_name] = fingerprint
+                timings[stage_name] = {"status": "ran", "wall_time": wall_time, "cpu_time": cpu_time}
+    finally:
+        executor.shutdown(wait=True)
+
+    return OrderedDict((stage_name, timings[stage_name]) for stage_name in order)
+
+
+def print_timings(timings):
+    print("{:<12} {:<8} {:>10} {:>10}".format("stage", "status", "wall (s)", "cpu (s)"))
+    for stage_name, timing in timings.items():
+        print("{:<12} {:<8} {:>10.2f} {:>10.2f}".format(stage_name, timing["status"], timing["wall_time"],
+                                                        timing["cpu_time"]))
+        if "error" in timing:
+            print("    {}".format(timing["error"]))
+
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Run the WTA analyses without Jupyter.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="run analysis stages")
+    run_parser.add_argument("--traces", required=True, help="directory with the trace directories")
+    run_parser.add_argument("--output", required=True, help="directory for the results")
+    run_parser.add_argument("--stages", default=",".join(default_stages),
+                            help="comma separated stages, dependencies are added (default: %(default)s)")
+    run_parser.add_argument("--jobs", type=int, default=1, help="number of stages to run at the same time")
+    run_parser.add_argument("--processes", type=int, default=None,
+                            help="processes per stage for per-trace work (default: number of CPUs)")
+    run_parser.add_argument("--regression-config",
+                            help="JSON file with available_data, source_directory and optionally mode, render, "
+                                 "cache_directory, store_directory, binning, bin_budget, bootstrap_resamples and "
+                                 "bootstrap_seed for the regression stage, and refit_tolerance for the incremental "
+                                 "stage")
+    run_parser.add_argument("--preview", type=float, nargs="?", const=default_preview_fraction, default=None,
+                            metavar="FRACTION",
+                            help="estimate the trace analyses from a sample of FRACTION of the Parquet row groups "
+                                 "(default: %(const)s), with error bounds, and write the results to <output>/preview")
+    run_parser.add_argument("--preview-seed", type=int, default=0, help="seed of the preview sample")
+    run_parser.add_argument("--force", action="store_true", help="run stages even if their inputs are unchanged")
+    run_parser.add_argument("--profile", action="store_true",
+                            help="record spans of the hot paths and write profile.json, profile_summary.csv and "
+                                 "profile.trace.json (Chrome trace) to the output directory")
+
+    subparsers.add_parser("list", help="list the stages and their dependencies")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    arguments = parse_arguments(sys.argv[1:] if arguments is None else arguments)
+    if arguments.command == "list":
+        for stage in stages.values():
+            print("{:<12} depends on: {}".format(stage.name, ", ".join(stage.dependencies) or "-"))
+        return 0
+    if arguments.command != "run":
+        parse_arguments(["--help"])
+
+    context = {
+        "traces": os.path.abspath(arguments.traces),
+        "output": os.path.abspath(arguments.output),
+        "processes": arguments.processes,
+        "regression_config": arguments.regression_config and os.path.abspath(arguments.regression_config),
+        "profile": arguments.profile,
+        "preview": arguments.preview,
+        "preview_seed": arguments.preview_seed,
+    }
+    if arguments.preview is not None:
+        if not 0 < arguments.preview <= 1:
+            raise ValueError("The preview fraction must be in (0, 1]")
+        # Previews have their own results and stamps, the exact results are left alone.
+        context["output"] = os.path.join(context["output"], "preview")
+    os.makedirs(context["output"], exist_ok=True)
+    stage_names = [stage_name.strip() for stage_name in arguments.stages.split(",") if stage_name.strip()]
+
+    timings = run(context, stage_names, jobs=arguments.jobs, force=arguments.force)
+    with open(os.path.join(context["output"], timings_file_name), "w") as f:
+        json.dump(timings, f, indent=2)
+    print_timings(timings)
+    if arguments.profile:
+        instrumentation.export_json(os.path.join(context["output"], "profile.json"))
+        instrumentation.export_chrome_trace(os.path.join(context["output"], "profile.trace.json"))
+        profile_summary = instrumentation.summary()
+        profile_summary.to_csv(os.path.join(context["output"], "profile_summary.csv"), index=False)
+        print(profile_summary.to_string(index=False))
+    return 1 if any(timing["status"] in ["failed", "blocked"] for timing in timings.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
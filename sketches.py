@@ -0,0 +1,221 @@
+"""
+Mergeable histogram sketches for the per-workflow distributions of notebooks 4-7 (critical path task count and length,
+approximate level of parallelism).
+
+A LogHistogram keeps values below exact_below in exact integer buckets and larger values in logarithmic buckets with
+a relative accuracy of relative_accuracy, as in DDSketch. Only non-empty buckets are stored, so a sketch of a trace with
+millions of workflows takes a few kilobytes. Sketches of the same configuration merge by adding bucket weights, either
+as they are or after normalizing every sketch to a total weight of one. The latter is the "normalized per workload"
+aggregation of the notebooks (normalize_group per workload followed by normalize_workload_and_group).
+"""
+
+import math
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+import trace_reader
+
+default_relative_accuracy = 0.01
+default_exact_below = 1024
+
+
+class LogHistogram(object):
+
+    def __init__(self, relative_accuracy=default_relative_accuracy, exact_below=default_exact_below):
+        self.relative_accuracy = relative_accuracy
+        self.exact_below = max(int(exact_below), 1)
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # Keys below exact_below are the (integer) values themselves, larger keys are exact_below + log bucket index.
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.weights = np.zeros(0, dtype=np.float64)
+
+    def _same_configuration(self, other):
+        return self.relative_accuracy == other.relative_accuracy and self.exact_below == other.exact_below
+
+    def _first_log_bucket(self):
+        return int(math.ceil(math.log(self.exact_below) / self.log_gamma))
+
+    def bucket_keys(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        keys = np.empty(values.shape[0], dtype=np.int64)
+        exact = values < self.exact_below
+        keys[exact] = np.floor(values[exact]).astype(np.int64)
+        buckets = np.ceil(np.log(values[~exact]) / self.log_gamma).astype(np.int64)
+        keys[~exact] = self.exact_below + buckets - self._first_log_bucket()
+        return keys
+
+    def bucket_values(self, keys=None):
+        """
+        Representative value of every bucket: the value itself for exact buckets, otherwise the point with the
+        smallest relative error to every value in the bucket.
+        """
+        keys = self.keys if keys is None else np.asarray(keys, dtype=np.int64)
+        values = keys.astype(np.float64)
+        logarithmic = keys >= self.exact_below
+        buckets = keys[logarithmic] - self.exact_below + self._first_log_bucket()
+        values[logarithmic] = 2 * self.gamma ** buckets / (self.gamma + 1)
+        return values
+
+    def _add_keys(self, keys, weights):
+        if keys.shape[0] == 0:
+            return self
+        all_keys = np.concatenate((self.keys, keys))
+        all_weights = np.concatenate((self.weights, weights))
+        self.keys, inverse = np.unique(all_keys, return_inverse=True)
+        self.weights = np.bincount(inverse, weights=all_weights, minlength=self.keys.shape[0])
+        return self
+
+    def add(self, values, weights=None):
+        values = np.asarray(values, dtype=np.float64)
+        valid = np.isfinite(values) & (values >= 0)
+        weights = np.ones(values.shape[0]) if weights is None else np.asarray(weights, dtype=np.float64)
+        return self._add_keys(self.bucket_keys(values[valid]), weights[valid])
+
+    def merge(self, other, scale=1.0):
+        if not self._same_configuration(other):
+            raise ValueError("Cannot merge sketches with a different configuration")
+        return self._add_keys(other.keys, other.weights * scale)
+
+    def total(self):
+        return float(self.weights.sum())
+
+    def normalized(self):
+        result = self.copy()
+        total = self.total()
+        if total > 0:
+            result.weights = result.weights / total
+        return result
+
+    def copy(self):
+        result = LogHistogram(self.relative_accuracy, self.exact_below)
+        result.keys = self.keys.copy()
+        result.weights = self.weights.copy()
+        return result
+
+    def cdf(self):
+        total = self.total()
+        return np.cumsum(self.weights) / total if total > 0 else np.zeros(0)
+
+    def quantile(self, q):
+        q = np.asarray(q, dtype=np.float64)
+        if self.keys.shape[0] == 0:
+            return np.full(q.shape, np.nan)
+        positions = np.minimum(np.searchsorted(self.cdf(), q, side="left"), self.keys.shape[0] - 1)
+        return self.bucket_values(self.keys[positions])
+
+    def frame(self, column_name):
+        """
+        Returns a DataFrame with column_name (the bucket values), pdf and cdf, like normalize_df in the notebooks.
+        """
+        total = self.total()
+        pdf = self.weights / total if total > 0 else self.weights
+        return pd.DataFrame({column_name: self.bucket_values(), "pdf": pdf, "cdf": np.cumsum(pdf)},
+                            columns=[column_name, "pdf", "cdf"])
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "exact_below": self.exact_below,
+            "keys": self.keys.tolist(),
+            "weights": self.weights.tolist(),
+        }
+
+    @staticmethod
+    def from_dict(stored):
+        result = LogHistogram(stored["relative_accuracy"], stored["exact_below"])
+        result.keys = np.asarray(stored["keys"], dtype=np.int64)
+        result.weights = np.asarray(stored["weights"], dtype=np.float64)
+        return result
+
+
+def merge_sketches(sketches, normalize_per_sketch=False):
+    """
+    Merges sketches into one. With normalize_per_sketch every sketch contributes a total weight of one, so every
+    workload counts equally regardless of its number of workflows.
+    """
+    result = None
+    for sketch in sketches:
+        if result is None:
+            result = LogHistogram(sketch.relative_accuracy, sketch.exact_below)
+        total = sketch.total()
+        if normalize_per_sketch and total == 0:
+            continue
+        result.merge(sketch, 1.0 / total if normalize_per_sketch else 1.0)
+    return result if result is not None else LogHistogram()
+
+
+def trace_sketch(trace_location, column_name, filter=None, table="workflows",
+                 relative_accuracy=default_relative_accuracy, exact_below=default_exact_below):
+    sketch = LogHistogram(relative_accuracy, exact_below)
+    for batch in trace_reader.iter_batches(trace_location, [column_name], filter=filter, table=table):
+        sketch.add(batch.column(0).to_numpy(zero_copy_only=False))
+    return sketch
+
+
+def batch_sketches(batches, column_names, relative_accuracy=default_relative_accuracy,
+                   exact_below=default_exact_below):
+    # Sketches of several columns of the same rows, from record batches holding them.
+    result = OrderedDict((column_name, LogHistogram(relative_accuracy, exact_below)) for column_name in column_names)
+    for batch in batches:
+        for column_name, sketch in result.items():
+            sketch.add(batch.column(batch.schema.get_field_index(column_name)).to_numpy(zero_copy_only=False))
+    return result
+
+
+def trace_sketches(trace_location, column_names, filter=None, table="workflows", **kwargs):
+    return batch_sketches(trace_reader.iter_batches(trace_location, column_names, filter=filter, table=table),
+                          column_names, **kwargs)
+
+
+# A row predicate (column, threshold, inclusive) keeps the rows whose column is above threshold, or at least
+# threshold when inclusive, like the .filter of the notebooks.
+def row_filter(predicate):
+    column_name, threshold, inclusive = predicate
+    return ds.field(column_name) >= threshold if inclusive else ds.field(column_name) > threshold
+
+
+def row_mask(predicate, values):
+    _, threshold, inclusive = predicate
+    return values >= threshold if inclusive else values > threshold
+
+
+def predicate_name(predicate):
+    column_name, threshold, inclusive = predicate
+    return "{}{}{}".format(column_name, ">=" if inclusive else ">", threshold)
+
+
+def group_frame(sketches, groups, column_name, group_column, normalize_per_sketch=False):
+    """
+    Merges the sketches per group and returns one DataFrame with group_column, column_name, pdf and cdf, the
+    replacement for groupby(group).apply(normalize_group) and its per-workload normalized variant.
+    """
+    grouped = {}
+    for sketch, group in zip(sketches, groups):
+        grouped.setdefault(group, []).append(sketch)
+
+    frames = []
+    for group in sorted(grouped):
+        frame = merge_sketches(grouped[group], normalize_per_sketch).frame(column_name)
+        frame.insert(0, group_column, group)
+        frames.append(frame)
+    if len(frames) == 0:
+        return pd.DataFrame(columns=[group_column, column_name, "pdf", "cdf"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def workload_sketches(traces_location, column_name, trace_names, filter=None, table="workflows", **kwargs):
+    """
+    Returns a dict of trace name to the sketch of column_name for every listed trace that has the table.
+    """
+    result = {}
+    for trace_name in trace_names:
+        trace_location = os.path.join(traces_location, trace_name)
+        if table not in os.listdir(trace_location):
+            continue
+        result[trace_name] = trace_sketch(trace_location, column_name, filter, table, **kwargs)
+    return result
@@ -0,0 +1,342 @@
+"""
+Generates synthetic WTA traces (tasks/schema-1.0 and workflows/schema-1.0 Parquet) of any size, so the analyses can be
+benchmarked without the real traces.
+
+A trace is written in chunks of whole workflows, one Parquet file per chunk, so memory stays bounded by the chunk size
+and not by the number of tasks. Workflow sizes are geometric around a mean, and every workflow has one of these shapes:
+
+    chain       every task has the next task as its only child
+    fork_join   the first task forks into the middle tasks, which all join into the last task
+    dummy       like fork_join, but the fork and the join pass through a dummy task (type "dummy"), as in the Pegasus
+                and Askalon traces
+    mixed       every workflow picks one of the shapes above at random
+
+Workflows that are too small for their shape fall back to fork_join (fewer than 5 tasks) or chain (fewer than 3).
+Interarrival times of workflows and task runtimes are Pareto (Lomax) distributed. Arrivals are bursty: the trace
+alternates between calm and burst periods of geometric length, and within a burst workflows arrive burst_factor times
+faster. All tasks of a workflow are submitted together. The critical path and width of every workflow follow from its
+shape and are written to the workflows table.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import trace_reader
+
+shapes = ["chain", "fork_join", "dummy"]
+shape_choices = shapes + ["mixed"]
+
+parameters_file_name = "synthetic.json"
+trace_prefix = "synthetic"
+
+default_duration = 1000*60*60*24*8
+default_tasks_per_workflow = 10
+default_tasks_per_file = 1000 * 1000
+default_row_group_size = 256 * 1024
+
+
+def trace_name(num_tasks, shape="mixed"):
+    # benchmarks gives the prefix a domain and source for its runs, and the suffix lets the Hurst stage pick it up.
+    return "{}_{}_{}_parquet".format(trace_prefix, shape, num_tasks)
+
+
+def generation_parameters(num_tasks, shape="mixed", duration=default_duration,
+                          tasks_per_workflow=default_tasks_per_workflow, interarrival_alpha=1.5, runtime_alpha=1.8,
+                          runtime_scale=60*1000, wait_time_alpha=2.5, wait_time_scale=1000, burst_factor=20.0,
+                          mean_calm_workflows=1000, mean_burst_workflows=100, seed=0,
+                          tasks_per_file=default_tasks_per_file):
+    """
+    Returns the parameters of a trace as a dict. duration is the expected time between the first and the last
+    submission in milliseconds; the alphas are the tail indices of the Lomax distributions and must be above 1.
+    """
+    if shape not in shape_choices:
+        raise ValueError("Unknown shape: {}".format(shape))
+    if min(interarrival_alpha, runtime_alpha, wait_time_alpha) <= 1:
+        raise ValueError("The tail indices must be above 1 for the distributions to have a mean")
+    return {
+        "num_tasks": int(num_tasks),
+        "shape": shape,
+        "duration": int(duration),
+        "tasks_per_workflow": float(tasks_per_workflow),
+        "interarrival_alpha": float(interarrival_alpha),
+        "runtime_alpha": float(runtime_alpha),
+        "runtime_scale": float(runtime_scale),
+        "wait_time_alpha": float(wait_time_alpha),
+        "wait_time_scale": float(wait_time_scale),
+        "burst_factor": float(burst_factor),
+        "mean_calm_workflows": float(mean_calm_workflows),
+        "mean_burst_workflows": float(mean_burst_workflows),
+        "seed": int(seed),
+        "tasks_per_file": int(tasks_per_file),
+    }
+
+
+def interarrival_scale(parameters):
+    # Scale of the Lomax interarrival times that makes the trace last about duration milliseconds on average.
+    num_workflows = max(parameters["num_tasks"] / parameters["tasks_per_workflow"], 1.0)
+    calm = parameters["mean_calm_workflows"]
+    burst = parameters["mean_burst_workflows"]
+    mean_speedup = (calm + burst / parameters["burst_factor"]) / (calm + burst)
+    lomax_mean = 1.0 / (parameters["interarrival_alpha"] - 1)
+    return parameters["duration"] / num_workflows / (mean_speedup * lomax_mean)
+
+
+def workflow_sizes(rng, num_tasks, tasks_per_workflow):
+    # Geometric sizes of at least one task, the last one cut so the sizes add up to num_tasks.
+    sizes = []
+    remaining = num_tasks
+    while remaining > 0:
+        drawn = rng.geometric(1.0 / tasks_per_workflow, size=int(remaining / tasks_per_workflow) + 16)
+        total = np.cumsum(drawn)
+        end = np.searchsorted(total, remaining)
+        if end < drawn.shape[0]:
+            drawn = drawn[:end + 1]
+            drawn[-1] -= total[end] - remaining
+        sizes.append(drawn)
+        remaining -= int(drawn.sum())
+    return np.concatenate(sizes).astype(np.int64) if sizes else np.zeros(0, dtype=np.int64)
+
+
+def burst_states(rng, num_workflows, state, mean_calm_workflows, mean_burst_workflows):
+    """
+    Returns whether each of the next num_workflows workflows arrives in a burst. state is [in_burst, workflows left in
+    the current period] and is updated, so consecutive chunks continue the same on/off process.
+    """
+    states = []
+    remaining = num_workflows
+    while remaining > 0:
+        if state[1] == 0:
+            state[0] = not state[0]
+            state[1] = int(rng.geometric(1.0 / (mean_burst_workflows if state[0] else mean_calm_workflows)))
+        length = min(state[1], remaining)
+        states.append(np.full(length, state[0], dtype=bool))
+        state[1] -= length
+        remaining -= length
+    return np.concatenate(states) if states else np.zeros(0, dtype=bool)
+
+
+def _effective_shapes(shape_codes, sizes):
+    # Workflows too small for their shape fall back to a simpler one.
+    shape_codes = np.where((shape_codes == 2) & (sizes < 5), 1, shape_codes)
+    return np.where((shape_codes == 1) & (sizes < 3), 0, shape_codes)
+
+
+def workflow_edges(shape_codes, sizes):
+    """
+    Returns (src, dst, is_dummy) for the tasks of consecutive workflows: the parent->child edges as indices into the
+    tasks, and a mask of the dummy tasks. shape_codes index shapes.
+    """
+    starts = np.cumsum(sizes) - sizes
+    workflow = np.repeat(np.arange(sizes.shape[0]), sizes)
+    task = np.arange(workflow.shape[0], dtype=np.int64)
+    local = task - starts[workflow]
+    size = sizes[workflow]
+    shape = shape_codes[workflow]
+    first = starts[workflow]
+    last = first + size - 1
+
+    chain = (shape == 0) & (local < size - 1)
+    fork_join = (shape == 1) & (local >= 1) & (local <= size - 2)
+    dummy = (shape == 2) & (local >= 2) & (local <= size - 3)
+    dummy_workflows = np.flatnonzero(shape_codes == 2)
+    fork = starts[dummy_workflows] + 1
+    join = starts[dummy_workflows] + sizes[dummy_workflows] - 2
+
+    src = np.concatenate((task[chain], first[fork_join], task[fork_join], starts[dummy_workflows], fork[
+        np.repeat(np.arange(dummy_workflows.shape[0]), sizes[dummy_workflows] - 4)], task[dummy], join))
+    dst = np.concatenate((task[chain] + 1, task[fork_join], last[fork_join], fork, task[dummy], (last - 1)[dummy],
+                          join + 1))
+    is_dummy = np.zeros(task.shape[0], dtype=bool)
+    is_dummy[fork] = True
+    is_dummy[join] = True
+    return src, dst, is_dummy
+
+
+def workflow_paths(shape_codes, sizes, runtime, is_dummy):
+    """
+    Returns (critical_path_length, critical_path_task_count, width) of consecutive workflows, following their shapes.
+    Dummy tasks take no time.
+    """
+    starts = np.cumsum(sizes) - sizes
+    workflow = np.repeat(np.arange(sizes.shape[0]), sizes)
+    local = np.arange(workflow.shape[0]) - starts[workflow]
+    size = sizes[workflow]
+    shape = shape_codes[workflow]
+    middle = (((shape == 1) & (local >= 1) & (local <= size - 2)) |
+              ((shape == 2) & (local >= 2) & (local <= size - 3)))
+
+    runtime = np.where(is_dummy, 0, runtime)
+    longest_middle = np.maximum.reduceat(np.where(middle, runtime, 0), starts) if sizes.shape[0] else runtime[:0]
+    chain = shape_codes == 0
+    length = np.where(chain, np.add.reduceat(runtime, starts) if sizes.shape[0] else runtime[:0],
+                      runtime[starts] + longest_middle + runtime[starts + sizes - 1])
+    task_count = np.where(chain, sizes, np.where(shape_codes == 1, 3, 5))
+    width = np.where(chain, 1, np.where(shape_codes == 1, sizes - 2, sizes - 4))
+    return length, task_count, width
+
+
+def _id_lists(ids, src, dst, num_tasks):
+    # list<int64> column with, for every task, the ids of the dst of its edges.
+    order = np.argsort(src, kind="mergesort")
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=num_tasks)))).astype(np.int32)
+    return pa.ListArray.from_arrays(pa.array(offsets), pa.array(ids[dst[order]]))
+
+
+def _constant(value, length, type):
+    return pa.array(np.full(length, value), type=type)
+
+
+def _lomax(rng, alpha, scale, size):
+    return rng.pareto(alpha, size=size) * scale
+
+
+def generate_chunk(rng, parameters, num_tasks, first_task_id, first_workflow_id, last_ts_submit, state):
+    """
+    Generates about num_tasks tasks of whole workflows. Returns (tasks table, workflows table, ts_submit of the last
+    workflow).
+    """
+    sizes = workflow_sizes(rng, num_tasks, parameters["tasks_per_workflow"])
+    num_workflows = sizes.shape[0]
+    if parameters["shape"] == "mixed":
+        shape_codes = rng.randint(0, len(shapes), size=num_workflows)
+    else:
+        shape_codes = np.full(num_workflows, shapes.index(parameters["shape"]), dtype=np.int64)
+    shape_codes = _effective_shapes(shape_codes, sizes)
+
+    in_burst = burst_states(rng, num_workflows, state, parameters["mean_calm_workflows"],
+                            parameters["mean_burst_workflows"])
+    interarrival = _lomax(rng, parameters["interarrival_alpha"], interarrival_scale(parameters), num_workflows)
+    interarrival = np.where(in_burst, interarrival / parameters["burst_factor"], interarrival)
+    if first_workflow_id == 0 and num_workflows > 0:
+        interarrival[0] = 0
+    workflow_ts_submit = last_ts_submit + np.cumsum(interarrival).astype(np.int64)
+
+    tasks = int(sizes.sum())
+    src, dst, is_dummy = workflow_edges(shape_codes, sizes)
+    runtime = 1 + _lomax(rng, parameters["runtime_alpha"], parameters["runtime_scale"], tasks).astype(np.int64)
+    runtime[is_dummy] = 0
+    wait_time = _lomax(rng, parameters["wait_time_alpha"], parameters["wait_time_scale"], tasks).astype(np.int64)
+    wait_time[is_dummy] = 0
+    task_ids = first_task_id + np.arange(tasks, dtype=np.int64)
+    workflow_ids = first_workflow_id + np.arange(num_workflows, dtype=np.int64)
+    ts_submit = np.repeat(workflow_ts_submit, sizes)
+
+    tasks_table = pa.Table.from_arrays([
+        pa.array(task_ids),
+        pa.array(np.repeat(workflow_ids, sizes)),
+        pa.array(ts_submit),
+        _constant(0, tasks, pa.int32()),
+        pa.array(runtime),
+        _constant("core", tasks, pa.string()),
+        _constant(1.0, tasks, pa.float64()),
+        _id_lists(task_ids, dst, src, tasks),
+        _id_lists(task_ids, src, dst, tasks),
+        _constant(-1, tasks, pa.int32()),
+        _constant(-1, tasks, pa.int32()),
+        _constant("", tasks, pa.string()),
+        pa.array(wait_time),
+        _constant("", tasks, pa.string()),
+        _constant(-1.0, tasks, pa.float64()),
+        _constant(-1, tasks, pa.int64()),
+        _constant(-1, tasks, pa.int64()),
+        _constant(-1.0, tasks, pa.float64()),
+        _constant(-1, tasks, pa.int64()),
+        _constant(1.0, tasks, pa.float64()),
+        pa.array(np.where(is_dummy, "dummy", "task")),
+    ], names=["id", "workflow_id", "ts_submit", "submission_site", "runtime", "resource_type",
+              "resource_amount_requested", "parents", "children", "user_id", "group_id", "nfrs", "wait_time",
+              "params", "memory_requested", "disk_io_time", "disk_space_requested", "energy_consumption",
+              "network_io_time", "resource_used", "type"])
+
+    length, task_count, width = workflow_paths(shape_codes, sizes, runtime, is_dummy)
+    workflows_table = pa.Table.from_arrays([
+        pa.array(workflow_ids),
+        pa.array(workflow_ts_submit),
+        pa.array(sizes.astype(np.int32)),
+        pa.array(length.astype(np.int64)),
+        pa.array(task_count.astype(np.int32)),
+        pa.array(width.astype(np.int32)),
+        _constant("", num_workflows, pa.string()),
+        _constant("", num_workflows, pa.string()),
+        _constant("Synthetic", num_workflows, pa.string()),
+        pa.array(np.asarray(shapes)[shape_codes]),
+        _constant("Synthetic", num_workflows, pa.string()),
+        pa.array(np.add.reduceat(runtime, np.cumsum(sizes) - sizes).astype(np.float64) if num_workflows else
+                 np.zeros(0)),
+        _constant(-1.0, num_workflows, pa.float64()),
+        _constant(-1.0, num_workflows, pa.float64()),
+        _constant(-1.0, num_workflows, pa.float64()),
+        _constant(-1.0, num_workflows, pa.float64()),
+    ], names=["id", "ts_submit", "task_count", "critical_path_length", "critical_path_task_count",
+              "approx_max_concurrent_tasks", "nfrs", "scheduler", "domain", "application_name", "application_field",
+              "total_resources", "total_memory_usage", "total_network_usage", "total_disk_space_usage",
+              "total_energy_consumption"])
+
+    last = int(workflow_ts_submit[-1]) if num_workflows > 0 else last_ts_submit
+    return tasks_table, workflows_table, last
+
+
+def read_parameters(trace_location):
+    try:
+        with open(os.path.join(trace_location, parameters_file_name)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def generate_trace(trace_location, parameters, overwrite=False):
+    """
+    Writes a trace with the given generation_parameters to trace_location. An existing trace that was generated with
+    the same parameters is kept unless overwrite is set. Returns the number of tasks and workflows written.
+    """
+    if not overwrite and read_parameters(trace_location) == parameters:
+        return parameters["num_tasks"], trace_reader.row_count(trace_location, "workflows")
+
+    tasks_location = trace_reader.table_location(trace_location, "tasks")
+    workflows_location = trace_reader.table_location(trace_location, "workflows")
+    for location in [tasks_location, workflows_location]:
+        os.makedirs(location, exist_ok=True)
+        for file_name in os.listdir(location):
+            os.remove(os.path.join(location, file_name))
+    parameters_location = os.path.join(trace_location, parameters_file_name)
+    if os.path.exists(parameters_location):
+        os.remove(parameters_location)
+
+    rng = np.random.RandomState(parameters["seed"])
+    state = [True, 0]
+    written_tasks = 0
+    written_workflows = 0
+    last_ts_submit = 0
+    part = 0
+    while written_tasks < parameters["num_tasks"]:
+        chunk_tasks = min(parameters["tasks_per_file"], parameters["num_tasks"] - written_tasks)
+        tasks_table, workflows_table, last_ts_submit = generate_chunk(rng, parameters, chunk_tasks, written_tasks,
+                                                                      written_workflows, last_ts_submit, state)
+        # Zero-padded part numbers keep the files, and so the ts_submit order, sorted in the dataset.
+        file_name = "part.{:05d}.parquet".format(part)
+        pq.write_table(tasks_table, os.path.join(tasks_location, file_name), row_group_size=default_row_group_size)
+        pq.write_table(workflows_table, os.path.join(workflows_location, file_name),
+                       row_group_size=default_row_group_size)
+        written_tasks += tasks_table.num_rows
+        written_workflows += workflows_table.num_rows
+        part += 1
+
+    with open(parameters_location, "w") as f:
+        json.dump(parameters, f, indent=2)
+    return written_tasks, written_workflows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python synthetic_traces.py <dir for the trace directory> <number of tasks> [shape] [seed]")
+        sys.exit(1)
+    num_tasks = int(float(sys.argv[2]))
+    shape = sys.argv[3] if len(sys.argv) > 3 else "mixed"
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    location = os.path.join(sys.argv[1], trace_name(num_tasks, shape))
+    print(generate_trace(location, generation_parameters(num_tasks, shape, seed=seed)))
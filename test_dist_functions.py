@@ -0,0 +1,82 @@
+"""
+Checks dist_functions.evaluate against scipy.stats for every distribution and quantity, in the body and far in the
+tails of the distributions.
+"""
+
+import numpy as np
+import pytest
+from scipy import stats
+
+import dist_functions
+
+# Parameter sets per distribution, in the argument order of evaluate (shapes, loc, scale).
+parameters = {
+    "weibull": [[0.5, 0, 3], [1.7, 2, 10]],
+    "pareto": [[1.2, 0, 1], [3, -1, 5]],
+    "gen_pareto": [[0.4, 0, 2], [0, 1, 3], [-0.3, 0, 4]],
+    "expon": [[0, 1], [5, 0.2]],
+    "student": [[3, 0.5, 0, 2], [10, -1, 4, 1]],
+    "gamma": [[0.5, 0, 1], [1.95, 0, 10.39], [30, 2, 0.5]],
+    "lognormal": [[0.3, 0, 1], [2, 1, 50]],
+    "levy": [[0, 5], [2, 0.1]],
+}
+
+# Standardized points: outside the support, at its lower end, in the body and far in both tails.
+standardized = np.array([-5, 0, 1e-4, 0.0037, 0.01, 0.05, 0.3, 1, 2.5, 10, 100, 1e3, 1e4, 1e6])
+
+
+def points(params):
+    loc, scale = params[-2], params[-1]
+    return loc + scale * standardized
+
+
+def scipy_values(dist_name, x, params, name):
+    evaluator = dist_functions.evaluators[dist_name]
+    shapes = params[:evaluator.num_shapes]
+    return getattr(evaluator.dist, name)(x, *shapes, loc=params[-2], scale=params[-1])
+
+
+@pytest.mark.parametrize("dist_name", sorted(parameters))
+@pytest.mark.parametrize("name", dist_functions.quantities)
+def test_evaluate_matches_scipy(dist_name, name):
+    for params in parameters[dist_name]:
+        x = points(params)
+        expected = scipy_values(dist_name, x, params, name)
+        actual = dist_functions.evaluate(dist_name, x, params, [name])[name]
+        finite = np.isfinite(expected)
+        np.testing.assert_allclose(actual[finite], expected[finite], rtol=1e-6, atol=1e-300,
+                                   err_msg="{} {} {}".format(dist_name, name, params))
+        # Where scipy's log underflows evaluate may do better, but it must not do worse.
+        np.testing.assert_array_equal(actual[~finite & ~np.isfinite(actual)], expected[~finite & ~np.isfinite(actual)])
+
+
+@pytest.mark.parametrize("dist_name", sorted(parameters))
+def test_evaluate_matrix_matches_single(dist_name):
+    params = np.array(parameters[dist_name], dtype=np.float64)
+    x = points(params[0])
+    matrix = dist_functions.evaluate(dist_name, x, params, dist_functions.quantities)
+    for i in range(params.shape[0]):
+        single = dist_functions.evaluate(dist_name, x, params[i], dist_functions.quantities)
+        for name in dist_functions.quantities:
+            np.testing.assert_array_equal(matrix[name][i], single[name])
+
+
+def test_levy_logcdf_near_lower_end():
+    x = [0.0037, 0.01, 0.05]
+    np.testing.assert_allclose(dist_functions.evaluate("levy", x, [0, 5], ["logcdf"])["logcdf"],
+                               stats.levy.logcdf(x, loc=0, scale=5), rtol=1e-10)
+
+
+def test_gamma_logsf_far_in_the_tail():
+    # gammaincc underflows here, its log does not.
+    x = np.array([1e4, 1e5])
+    expected = stats.gamma.logsf(x, 1.95, loc=0, scale=1)
+    actual = dist_functions.evaluate("gamma", x, [1.95, 0, 1], ["logsf"])["logsf"]
+    assert np.all(np.isfinite(actual))
+    np.testing.assert_allclose(actual[np.isfinite(expected)], expected[np.isfinite(expected)], rtol=1e-8)
+
+
+def test_invalid_parameters_give_nan():
+    values = dist_functions.evaluate("gamma", [1, 2], [-1, 0, 1], dist_functions.quantities)
+    for name in dist_functions.quantities:
+        assert np.all(np.isnan(values[name]))
@@ -0,0 +1,71 @@
+"""
+Checks rebinning.rebin against the per-bin loop it replaced in regression.rebin.
+"""
+
+import numpy as np
+import pytest
+
+import rebinning
+
+
+def baseline_rebin(feature_column, value_column, new_bins):
+    # The original loop of regression.rebin.
+    new_hist = []
+    generated_bins = []
+    prev_binvalue = 0
+    for (index,), binvalue in np.ndenumerate(new_bins):
+        sum_of_counts = 0
+        if index == 0:
+            sum_of_counts = value_column[feature_column <= binvalue].sum()
+        elif index == len(new_bins) - 1:
+            sum_of_counts = value_column[feature_column > prev_binvalue].sum()
+        else:
+            sum_of_counts = value_column[(feature_column <= binvalue) & (feature_column > prev_binvalue)].sum()
+
+        if sum_of_counts > 0:
+            new_hist.append(sum_of_counts)
+            generated_bins.append(binvalue)
+        prev_binvalue = binvalue
+
+    return generated_bins, new_hist
+
+
+def random_case(rng, num_edges):
+    size = rng.randint(1, 200)
+    if rng.uniform() < 0.5:
+        feature = rng.randint(0, 1000, size).astype(np.int64)
+    else:
+        feature = rng.lognormal(3, 2, size)
+    counts = rng.randint(0, 50, size).astype(np.int64)
+    edges = np.sort(rng.uniform(-10, 1200, num_edges))
+    if rng.uniform() < 0.3:
+        # Edges on data values, where the side of the comparison matters.
+        edges = np.unique(rng.choice(feature, num_edges).astype(np.float64))
+    return feature, counts, edges
+
+
+@pytest.mark.parametrize("num_edges", [1, 2, 3, 10, 100])
+@pytest.mark.parametrize("assume_sorted", [False, True])
+def test_rebin_matches_baseline(num_edges, assume_sorted):
+    rng = np.random.RandomState(num_edges)
+    for _ in range(300):
+        feature, counts, edges = random_case(rng, num_edges)
+        if assume_sorted:
+            order = np.argsort(feature, kind="mergesort")
+            feature, counts = feature[order], counts[order]
+        expected_bins, expected_hist = baseline_rebin(feature, counts, edges)
+        bins, hist = rebinning.rebin(feature, counts, edges, assume_sorted=assume_sorted)
+        np.testing.assert_array_equal(np.asarray(bins), np.asarray(expected_bins))
+        np.testing.assert_array_equal(np.asarray(hist), np.asarray(expected_hist))
+
+
+def test_rebin_ignores_nan():
+    # Sorted, with the NaN last as np.sort leaves it.
+    feature = np.array([1.0, 5.0, 20.0, np.nan])
+    counts = np.array([1, 2, 3, 7])
+    for edges in [np.array([4.0]), np.array([4.0, 10.0, 30.0])]:
+        expected_bins, expected_hist = baseline_rebin(feature, counts, edges)
+        for assume_sorted in [False, True]:
+            bins, hist = rebinning.rebin(feature, counts, edges, assume_sorted=assume_sorted)
+            np.testing.assert_array_equal(np.asarray(bins), np.asarray(expected_bins))
+            np.testing.assert_array_equal(np.asarray(hist), np.asarray(expected_hist))
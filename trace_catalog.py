@@ -0,0 +1,212 @@
+"""
+Persistent index of per-trace summaries, so the cross-trace notebooks do not have to rescan every raw trace.
+
+For every trace directory the catalog stores the number of tasks and workflows, the ts_submit range, the hourly and
+daily submission histograms, and the domain and source of the trace. Entries are fingerprinted with the size and
+modification time of the trace's Parquet files; refreshing the catalog only indexes traces that are new or changed
+and drops traces that are gone. The catalog is a single JSON file that is replaced atomically on every save.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import arrival_profiles
+import trace_names
+import trace_reader
+
+catalog_file_name = "trace_catalog.json"
+catalog_format = 1
+
+hours_in_a_day = arrival_profiles.hours_in_a_day
+
+summary_columns = ["trace", "domain", "source", "num_tasks", "num_workflows", "min_ts_submit", "max_ts_submit",
+                   "duration"]
+
+
+def fingerprint(trace_location):
+    files = []
+    for table in ["tasks", "workflows"]:
+        table_location = trace_reader.table_location(trace_location, table)
+        for directory, _, file_names in os.walk(table_location):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                stat = os.stat(path)
+                files.append([os.path.relpath(path, trace_location), stat.st_size, stat.st_mtime_ns])
+    return sorted(files)
+
+
+def daily_counts(hourly_counts, first_hour):
+    # Aligns the hourly histogram to whole days before summing.
+    hourly_counts = np.asarray(hourly_counts, dtype=np.int64)
+    first_day = first_hour // hours_in_a_day
+    padding_before = first_hour - first_day * hours_in_a_day
+    padding_after = -(padding_before + hourly_counts.shape[0]) % hours_in_a_day
+    padded = np.concatenate((np.zeros(padding_before, dtype=np.int64), hourly_counts,
+                             np.zeros(padding_after, dtype=np.int64)))
+    return padded.reshape(-1, hours_in_a_day).sum(axis=1), first_day
+
+
+def summarize_trace(trace_location):
+    """
+    Computes the summary of one trace with a single streaming pass over ts_submit.
+    """
+    trace_name = os.path.basename(os.path.normpath(trace_location))
+    summary = {
+        "trace": trace_name,
+        "fingerprint": fingerprint(trace_location),
+        "domain": trace_names.match_prefix(trace_name.lower(), trace_names.name_to_domain_map),
+        "source": trace_names.match_prefix(trace_name.lower(), trace_names.name_to_source_map),
+        "num_tasks": 0,
+        "num_workflows": None,
+        "min_ts_submit": None,
+        "max_ts_submit": None,
+        "first_hour": None,
+        "hourly_counts": [],
+        "first_day": None,
+        "daily_counts": [],
+    }
+
+    if trace_reader.do_workflows_exist(trace_location):
+        summary["num_workflows"] = trace_reader.row_count(trace_location, "workflows")
+
+    if not trace_reader.do_tasks_exist(trace_location):
+        return summary
+    if "ts_submit" not in trace_reader.column_names(trace_location):
+        summary["num_tasks"] = trace_reader.row_count(trace_location)
+        return summary
+
+    hourly = arrival_profiles.HourlyCounts()
+    minimum = None
+    maximum = None
+    for batch in trace_reader.iter_batches(trace_location, ["ts_submit"]):
+        ts_submit = batch.column(0).to_numpy(zero_copy_only=False)
+        ts_submit = ts_submit[np.isfinite(ts_submit)] if ts_submit.dtype.kind == "f" else ts_submit
+        if ts_submit.shape[0] == 0:
+            continue
+        minimum = ts_submit.min() if minimum is None else min(minimum, ts_submit.min())
+        maximum = ts_submit.max() if maximum is None else max(maximum, ts_submit.max())
+        hourly.add_timestamps(ts_submit)
+
+    summary["num_tasks"] = hourly.total()
+    if hourly.first_hour is not None:
+        days, first_day = daily_counts(hourly.counts, hourly.first_hour)
+        summary.update({
+            "min_ts_submit": int(minimum),
+            "max_ts_submit": int(maximum),
+            "first_hour": hourly.first_hour,
+            "hourly_counts": hourly.counts.tolist(),
+            "first_day": int(first_day),
+            "daily_counts": days.tolist(),
+        })
+    return summary
+
+
+class TraceCatalog(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if stored.get("format") == catalog_format:
+            self.entries = stored["traces"]
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"format": catalog_format, "traces": self.entries}, f, separators=(",", ":"))
+        os.replace(temporary_path, self.path)
+
+    def is_current(self, trace_location):
+        entry = self.entries.get(os.path.basename(os.path.normpath(trace_location)))
+        return entry is not None and entry["fingerprint"] == fingerprint(trace_location)
+
+    def refresh(self, traces_location, trace_names_to_index=None):
+        """
+        Indexes every new or changed trace directory and forgets traces that no longer exist. Returns the names of
+        the traces that were (re)indexed.
+        """
+        if trace_names_to_index is None:
+            trace_names_to_index = [name for name in sorted(os.listdir(traces_location))
+                                    if os.path.isdir(os.path.join(traces_location, name))]
+
+        indexed = []
+        for trace_name in trace_names_to_index:
+            trace_location = os.path.join(traces_location, trace_name)
+            if self.is_current(trace_location):
+                continue
+            self.entries[trace_name] = summarize_trace(trace_location)
+            indexed.append(trace_name)
+
+        removed = [trace_name for trace_name in self.entries if trace_name not in trace_names_to_index]
+        for trace_name in removed:
+            del self.entries[trace_name]
+
+        if indexed or removed:
+            self.save()
+        return indexed
+
+    def __contains__(self, trace_name):
+        return trace_name in self.entries
+
+    def __getitem__(self, trace_name):
+        return self.entries[trace_name]
+
+    def trace_names(self):
+        return sorted(self.entries)
+
+    def summaries(self):
+        """
+        Returns a DataFrame with one row per trace and the summary_columns.
+        """
+        rows = []
+        for trace_name in self.trace_names():
+            entry = self.entries[trace_name]
+            row = dict((column, entry.get(column)) for column in summary_columns if column != "duration")
+            row["duration"] = None if entry["max_ts_submit"] is None else \
+                entry["max_ts_submit"] - entry["min_ts_submit"]
+            rows.append(row)
+        return pd.DataFrame(rows, columns=summary_columns)
+
+    def hourly_counts(self, trace_name):
+        # Returns (first_hour, counts) with counts[i] the submissions in hour first_hour + i.
+        entry = self.entries[trace_name]
+        return entry["first_hour"], np.asarray(entry["hourly_counts"], dtype=np.int64)
+
+    def daily_counts(self, trace_name):
+        entry = self.entries[trace_name]
+        return entry["first_day"], np.asarray(entry["daily_counts"], dtype=np.int64)
+
+    def long_enough(self, min_duration=trace_reader.one_week_in_milliseconds):
+        return [trace_name for trace_name in self.trace_names()
+                if self.entries[trace_name]["max_ts_submit"] is not None
+                and self.entries[trace_name]["max_ts_submit"] >= min_duration]
+
+
+def open_catalog(traces_location, catalog_path=None, refresh=True):
+    catalog = TraceCatalog(catalog_path or os.path.join(traces_location, catalog_file_name))
+    if refresh:
+        catalog.refresh(traces_location)
+    return catalog
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python trace_catalog.py <dir with trace directories> [catalog file]")
+        sys.exit(1)
+    catalog = TraceCatalog(sys.argv[2] if len(sys.argv) > 2 else os.path.join(sys.argv[1], catalog_file_name))
+    for trace_name in catalog.refresh(sys.argv[1]):
+        print("Indexed {}".format(trace_name))
+    print(catalog.summaries().to_string(index=False))
@@ -0,0 +1,103 @@
+"""
+Maps trace folder names to the domain, source and display names used in the notebooks.
+
+Folder names are matched by prefix, in the order of the maps below, so more specific prefixes come first.
+"""
+
+from collections import OrderedDict
+
+name_to_domain_map = OrderedDict([
+    ("askalon-new", "Scientific"),
+    ("askalon", "Engineering"),
+    ("icpe", "Scientific"),
+    ("lanl", "Scientific"),
+    ("pegasus", "Scientific"),
+    ("workflowhub", "Scientific"),
+    ("two", "Industry"),
+    ("google", "Industry"),
+    ("chronos", "Industry"),
+    ("alibaba", "Industry"),
+])
+
+name_to_source_map = OrderedDict([
+    ("askalon-new", "Askalon New"),
+    ("askalon", "Askalon Old"),
+    ("icpe", "SPEC"),
+    ("lanl", "LANL"),
+    ("pegasus", "Pegasus"),
+    ("workflowhub", "WorkflowHub"),
+    ("two", "2Sigma"),
+    ("google", "Google"),
+    ("chronos", "Shell"),
+    ("alibaba", "Alibaba"),
+])
+
+# Display names of the longitudinal analysis (notebooks 1 and 1b).
+name_to_name_map = OrderedDict([
+    ("askalon_ee", "Askalon Old 1"),
+    ("askalon_ee2", "Askalon Old 2"),
+    ("Two_Sigma_pit", "Two Sigma 1"),
+    ("Two_Sigma_dft", "Two Sigma 2"),
+    ("LANL_Trinity", "LANL 1"),
+    ("Google", "Google"),
+    ("alibaba2018", "Alibaba"),
+])
+
+# Display names of the Hurst parameter analysis (notebook 2).
+name_to_hurst_name_map = OrderedDict([
+    ("askalon_ee_", "Askalon Old 1"),
+    ("askalon_ee2_", "Askalon Old 2"),
+    ("Two", "Two Sigma"),
+    ("LANL_Trinity", "LANL 1"),
+    ("Google", "Google"),
+    ("alibaba2018", "Alibaba"),
+])
+
+# If a folder name (in lower case) starts with one of these strings, it has critical path info computed.
+has_cp_info = [
+    "askalon",
+    "icpe",
+    "pegasus",
+    "workflowhub",
+    "chronos",
+    "alibaba",
+]
+
+trace_has_structural_information = [
+    "icpe",
+    "askalon",
+    "chronos",
+    "alibaba",
+    "workflowhub",
+    "pegasus",
+]
+
+
+def match_prefix(folder_name, mapping):
+    for name, value in mapping.items():
+        if str(folder_name).startswith(name):
+            return value
+    return None
+
+
+def folder_name_to_domain(folder_name):
+    domain = match_prefix(str(folder_name).lower(), name_to_domain_map)
+    if domain is None:
+        raise NotImplementedError("Unknown folder!")
+    return domain
+
+
+def folder_name_to_source(folder_name):
+    source = match_prefix(str(folder_name).lower(), name_to_source_map)
+    if source is None:
+        raise NotImplementedError("Unknown folder!")
+    return source
+
+
+def folder_name_to_display_name(folder_name, mapping=name_to_name_map):
+    display_name = match_prefix(folder_name, mapping)
+    return folder_name if display_name is None else display_name
+
+
+def has_critical_path_info(folder_name):
+    return any(str(folder_name).lower().startswith(name) for name in has_cp_info)
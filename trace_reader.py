@@ -0,0 +1,162 @@
+"""
+Reads WTA traces (tasks/schema-1.0 and workflows/schema-1.0 Parquet tables) with pyarrow datasets.
+
+Only the requested columns are read, filters are pushed down to the Parquet reader, and min/max questions such as
+"is this trace at least a week long" are answered from the row-group statistics without scanning any data.
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import instrumentation
+
+one_week_in_milliseconds = 1000*60*60*24*7
+
+default_batch_size = 1024 * 1024
+
+RowGroup = namedtuple("RowGroup", ["path", "index", "num_rows", "minimum", "maximum"])
+
+
+def table_location(workload_location, table="tasks"):
+    return os.path.join(workload_location, table, "schema-1.0")
+
+
+def do_tasks_exist(workload_location):
+    return "tasks" in os.listdir(workload_location)
+
+
+def do_workflows_exist(workload_location):
+    return "workflows" in os.listdir(workload_location)
+
+
+def open_dataset(workload_location, table="tasks"):
+    return ds.dataset(table_location(workload_location, table), format="parquet")
+
+
+def column_names(workload_location, table="tasks"):
+    return open_dataset(workload_location, table).schema.names
+
+
+def read_columns(workload_location, columns, filter=None, table="tasks"):
+    with instrumentation.span("read_table", trace=workload_location, table=table, columns=columns) as record:
+        result = open_dataset(workload_location, table).to_table(columns=columns, filter=filter)
+        record["rows"] = result.num_rows
+        return result
+
+
+def read_files(paths, columns, filter=None):
+    # read_columns of some of the Parquet files of a table, such as the files appended since the last read.
+    with instrumentation.span("read_files", files=len(paths), columns=columns) as record:
+        result = ds.dataset(paths, format="parquet").to_table(columns=columns, filter=filter)
+        record["rows"] = result.num_rows
+        return result
+
+
+def iter_batches(workload_location, columns, filter=None, table="tasks", batch_size=default_batch_size):
+    dataset = open_dataset(workload_location, table)
+    batches = iter(dataset.to_batches(columns=columns, filter=filter, batch_size=batch_size))
+    while True:
+        # Only the reads are timed, not the work the caller does between batches.
+        with instrumentation.span("read_batch", trace=workload_location, table=table, columns=columns) as record:
+            batch = next(batches, None)
+            record["rows"] = 0 if batch is None else batch.num_rows
+        if batch is None:
+            return
+        if batch.num_rows > 0:
+            yield batch
+
+
+def row_groups(trace_location, table="tasks", column="ts_submit"):
+    """
+    Returns a RowGroup for every non-empty row group of a table, in file order, with the min and max of column from
+    the statistics (None when there are none).
+    """
+    groups = []
+    for path in sorted(open_dataset(trace_location, table).files):
+        metadata = pq.ParquetFile(path).metadata
+        column_index = metadata.schema.names.index(column) if column in metadata.schema.names else None
+        for index in range(metadata.num_row_groups):
+            row_group = metadata.row_group(index)
+            if row_group.num_rows == 0:
+                continue
+            minimum, maximum = None, None
+            if column_index is not None:
+                statistics = row_group.column(column_index).statistics
+                if statistics is not None and statistics.has_min_max:
+                    minimum, maximum = statistics.min, statistics.max
+            groups.append(RowGroup(path, index, row_group.num_rows, minimum, maximum))
+    return groups
+
+
+def read_row_groups(groups, columns):
+    # Yields (row group, pyarrow Table) for every row group.
+    files = {}
+    for group in groups:
+        if group.path not in files:
+            files[group.path] = pq.ParquetFile(group.path)
+        with instrumentation.span("read_row_group", rows=group.num_rows, path=group.path, columns=columns):
+            table = files[group.path].read_row_group(group.index, columns=columns)
+        yield group, table
+
+
+def read_column(workload_location, column, filter=None, table="tasks", dtype=None):
+    values = read_columns(workload_location, [column], filter=filter, table=table).column(column).to_numpy()
+    return values if dtype is None else values.astype(dtype)
+
+
+def list_column(arrow_table, column_name):
+    """
+    Returns (lengths, values) of a list<int64> column: the number of entries per row and all entries concatenated.
+    """
+    column = arrow_table.column(column_name)
+    lengths = [np.asarray(chunk.value_lengths().fill_null(0), dtype=np.int64) for chunk in column.chunks]
+    values = [np.asarray(chunk.flatten(), dtype=np.int64) for chunk in column.chunks]
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(lengths), np.concatenate(values)
+
+
+def column_range(workload_location, column="ts_submit", table="tasks"):
+    """
+    Returns (min, max) of a column from the Parquet row-group statistics. Falls back to scanning the column when a
+    row group has no statistics. Returns (None, None) for an empty table or a missing column.
+    """
+    dataset = open_dataset(workload_location, table)
+    minimum = None
+    maximum = None
+    for path in dataset.files:
+        metadata = pq.ParquetFile(path).metadata
+        if column not in metadata.schema.names:
+            continue
+        column_index = metadata.schema.names.index(column)
+        for row_group_index in range(metadata.num_row_groups):
+            row_group = metadata.row_group(row_group_index)
+            if row_group.num_rows == 0:
+                continue
+            statistics = row_group.column(column_index).statistics
+            if statistics is None or not statistics.has_min_max:
+                return _scan_range(workload_location, column, table)
+            minimum = statistics.min if minimum is None else min(minimum, statistics.min)
+            maximum = statistics.max if maximum is None else max(maximum, statistics.max)
+    return minimum, maximum
+
+
+def _scan_range(workload_location, column, table):
+    values = read_column(workload_location, column, table=table)
+    if values.shape[0] == 0:
+        return None, None
+    return values.min(), values.max()
+
+
+def is_trace_long_enough(workload_location, min_duration=one_week_in_milliseconds):
+    # Exclude traces shorter than min_duration.
+    _, max_timestamp = column_range(workload_location, "ts_submit")
+    return max_timestamp is not None and max_timestamp >= min_duration
+
+
+def row_count(workload_location, table="tasks"):
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in open_dataset(workload_location, table).files)
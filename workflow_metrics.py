@@ -0,0 +1,318 @@
+"""
+Computes the per-workflow critical path and parallelism metrics straight from a trace's tasks table, so traces
+without the precomputed workflows columns can be analyzed too.
+
+For every workflow:
+- critical_path_length: the largest sum of task runtimes along a parent->child path (ms).
+- critical_path_task_count: the number of tasks on that path.
+- approx_max_concurrent_tasks: the width of the widest topological level, the approximation used for the workflows
+  table.
+- max_concurrent_tasks: the exact maximum number of tasks running at the same time, from a sweep over the task start
+  and end times.
+
+Workflows are processed in batches that hold all tasks of their workflows. The row groups of the tasks table are
+clustered by the workflow_id ranges of their statistics: row groups whose ranges overlap are in the same cluster, so
+no workflow spans two clusters, and consecutive clusters are packed into batches of about batch_tasks tasks that read
+only their own row groups. A cluster much larger than a batch, such as the whole table when workflow ids are not
+clustered by row group, is read once and its rows are bucketed into contiguous workflow_id ranges of about batch_tasks
+tasks, which are spilled to temporary Parquet files. Either way every row group is read once, memory stays bounded by
+the batch size, and batches are spread over a process pool.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import instrumentation
+import trace_reader
+import workflow_structure
+
+metric_columns = ["critical_path_length", "critical_path_task_count", "approx_max_concurrent_tasks",
+                  "max_concurrent_tasks"]
+
+default_batch_tasks = 5 * 1000 * 1000
+# Clusters up to this many batches are read as one batch rather than spilled.
+default_spill_factor = 2
+
+
+def row_group_clusters(groups):
+    """
+    Splits RowGroups with workflow_id statistics into clusters with disjoint workflow_id ranges, ordered by range.
+    Without statistics for every row group, all row groups are one cluster.
+    """
+    if len(groups) == 0:
+        return []
+    if any(group.minimum is None for group in groups):
+        return [list(groups)]
+    clusters = []
+    end = None
+    for group in sorted(groups, key=lambda group: (group.minimum, group.maximum)):
+        if clusters and group.minimum <= end:
+            clusters[-1].append(group)
+            end = max(end, group.maximum)
+        else:
+            clusters.append([group])
+            end = group.maximum
+    return clusters
+
+
+def plan_batches(trace_location, batch_tasks=default_batch_tasks):
+    """
+    Packs the row-group clusters of a trace into batches, lists of RowGroups, of about batch_tasks tasks. A batch of
+    more than batch_tasks tasks is a single cluster.
+    """
+    batches = []
+    batch_rows = 0
+    for cluster in row_group_clusters(trace_reader.row_groups(trace_location, column="workflow_id")):
+        rows = sum(group.num_rows for group in cluster)
+        if batches and batch_rows + rows <= batch_tasks:
+            batches[-1].extend(cluster)
+            batch_rows += rows
+        else:
+            batches.append(list(cluster))
+            batch_rows = rows
+    return batches
+
+
+def workflow_ranges(workflow_ids, batch_tasks=default_batch_tasks):
+    """
+    Splits workflow ids into contiguous (first, last) ranges holding about batch_tasks tasks each.
+    """
+    unique_ids, task_counts = np.unique(workflow_ids, return_counts=True)
+    if unique_ids.shape[0] == 0:
+        return []
+
+    batch_numbers = (np.cumsum(task_counts) - task_counts) // batch_tasks
+    boundaries = np.flatnonzero(np.diff(batch_numbers)) + 1
+    firsts = unique_ids[np.concatenate(([0], boundaries))]
+    lasts = unique_ids[np.concatenate((boundaries - 1, [unique_ids.shape[0] - 1]))]
+    return list(zip(firsts.tolist(), lasts.tolist()))
+
+
+def batch_columns(trace_location):
+    available = trace_reader.column_names(trace_location)
+    return ["id", "workflow_id", "children", "runtime"] + [name for name in ["ts_start", "ts_submit", "wait_time"]
+                                                             if name in available]
+
+
+def spill_cluster(cluster, columns, batch_tasks, directory):
+    """
+    Reads the row groups of a cluster once and writes its rows to one Parquet file per contiguous workflow_id range of
+    about batch_tasks tasks. Returns the paths of the files.
+    """
+    workflow_ids = np.concatenate([np.asarray(table.column(0).to_numpy(), dtype=np.int64)
+                                   for _, table in trace_reader.read_row_groups(cluster, ["workflow_id"])])
+    lasts = np.array([last for _, last in workflow_ranges(workflow_ids, batch_tasks)], dtype=np.int64)
+    del workflow_ids
+
+    paths = [os.path.join(directory, "batch-{}.parquet".format(index)) for index in range(lasts.shape[0])]
+    writers = {}
+    try:
+        for _, table in trace_reader.read_row_groups(cluster, columns):
+            buckets = np.searchsorted(lasts, np.asarray(table.column("workflow_id").to_numpy(), dtype=np.int64))
+            order = np.argsort(buckets, kind="mergesort")
+            bounds = np.searchsorted(buckets[order], np.arange(lasts.shape[0] + 1))
+            for bucket in np.flatnonzero(np.diff(bounds)):
+                if bucket not in writers:
+                    writers[bucket] = pq.ParquetWriter(paths[bucket], table.schema)
+                writers[bucket].write_table(table.take(pa.array(order[bounds[bucket]:bounds[bucket + 1]])))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return [path for bucket, path in enumerate(paths) if bucket in writers]
+
+
+def read_batch(trace_location, batch, columns):
+    """
+    Reads a batch, a list of RowGroups or the path of a spilled batch, as the arrays compute_batch_metrics takes.
+    """
+    with instrumentation.span("read_batch", trace=trace_location, columns=columns) as record:
+        if isinstance(batch, str):
+            table = pq.read_table(batch, columns=columns)
+        else:
+            table = pa.concat_tables([table for _, table in trace_reader.read_row_groups(batch, columns)])
+        record["rows"] = table.num_rows
+
+    with instrumentation.span("to_pandas", rows=table.num_rows):
+        frame = table.drop(["children"]).to_pandas()
+    num_children, child_ids = trace_reader.list_column(table, "children")
+
+    if "ts_start" in frame.columns:
+        start = frame["ts_start"].values.astype(np.float64)
+    elif "wait_time" in frame.columns:
+        start = (frame["ts_submit"] + frame["wait_time"]).values.astype(np.float64)
+    else:
+        start = frame["ts_submit"].values.astype(np.float64)
+
+    return (frame["id"].values.astype(np.int64), frame["workflow_id"].values.astype(np.int64),
+            frame["runtime"].values.astype(np.float64), start, num_children, child_ids)
+
+
+def _out_edges(indptr, vertices):
+    starts = indptr[vertices]
+    lengths = indptr[vertices + 1] - starts
+    total = lengths.sum()
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Concatenated aranges of [start, start + length) for every vertex.
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total, dtype=np.int64)
+
+
+def critical_paths(num_vertices, runtime, src, dst):
+    """
+    Level-by-level topological sweep over all workflows of a batch at once. Returns, per task, the length and task
+    count of the heaviest path ending at it and its topological level (-1 for tasks on a cycle).
+    """
+    order = np.argsort(src, kind="mergesort")
+    src = src[order]
+    dst = dst[order]
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=num_vertices))))
+    remaining = np.bincount(dst, minlength=num_vertices)
+
+    runtime = np.where(np.isfinite(runtime) & (runtime > 0), runtime, 0)
+    length = np.full(num_vertices, -np.inf)
+    task_count = np.zeros(num_vertices, dtype=np.int64)
+    level = np.full(num_vertices, -1, dtype=np.int64)
+
+    frontier = np.flatnonzero(remaining == 0)
+    length[frontier] = runtime[frontier]
+    task_count[frontier] = 1
+    current_level = 0
+
+    while frontier.shape[0] > 0:
+        level[frontier] = current_level
+        edges = _out_edges(indptr, frontier)
+        if edges.shape[0] == 0:
+            break
+
+        edge_src = src[edges]
+        edge_dst = dst[edges]
+        candidate_length = length[edge_src] + runtime[edge_dst]
+        candidate_count = task_count[edge_src] + 1
+
+        # Best incoming candidate per destination: longest path, most tasks on ties.
+        best = np.lexsort((candidate_count, candidate_length, edge_dst))
+        last_of_group = np.concatenate((edge_dst[best][1:] != edge_dst[best][:-1], [True]))
+        best = best[last_of_group]
+        targets = edge_dst[best]
+        improved = (candidate_length[best] > length[targets]) | (
+            (candidate_length[best] == length[targets]) & (candidate_count[best] > task_count[targets]))
+        length[targets[improved]] = candidate_length[best][improved]
+        task_count[targets[improved]] = candidate_count[best][improved]
+
+        remaining -= np.bincount(edge_dst, minlength=num_vertices)
+        frontier = targets[remaining[targets] == 0]
+        current_level += 1
+
+    return length, task_count, level
+
+
+def max_concurrency(workflow_codes, num_workflows, start, runtime):
+    valid = np.isfinite(start) & np.isfinite(runtime) & (runtime >= 0)
+    codes = workflow_codes[valid]
+    times = np.concatenate((start[valid], start[valid] + runtime[valid]))
+    deltas = np.concatenate((np.ones(codes.shape[0], dtype=np.int64), -np.ones(codes.shape[0], dtype=np.int64)))
+    codes = np.concatenate((codes, codes))
+
+    result = np.zeros(num_workflows, dtype=np.int64)
+    if codes.shape[0] == 0:
+        return result
+
+    # Ends sort before starts at the same instant, so back-to-back tasks do not overlap. Every workflow's deltas
+    # sum to zero, so one running sum over the sorted events stays per workflow.
+    order = np.lexsort((deltas, times, codes))
+    running = np.cumsum(deltas[order])
+    np.maximum.at(result, codes[order], running)
+    return result
+
+
+def compute_batch_metrics(ids, workflow_ids, runtime, start, num_children, child_ids):
+    unique_workflows, workflow_codes = np.unique(workflow_ids, return_inverse=True)
+    num_workflows = unique_workflows.shape[0]
+    src, dst = workflow_structure.edges_from_children(ids, num_children, child_ids)
+
+    length, task_count, level = critical_paths(ids.shape[0], runtime, src, dst)
+
+    reachable = level >= 0
+    best = np.lexsort((task_count[reachable], length[reachable], workflow_codes[reachable]))
+    best_codes = workflow_codes[reachable][best]
+    last_of_group = np.concatenate((best_codes[1:] != best_codes[:-1], [True])) if best.shape[0] > 0 else best
+    cp_length = np.zeros(num_workflows)
+    cp_task_count = np.zeros(num_workflows, dtype=np.int64)
+    cp_length[best_codes[last_of_group]] = length[reachable][best][last_of_group]
+    cp_task_count[best_codes[last_of_group]] = task_count[reachable][best][last_of_group]
+
+    max_level = level.max() + 1 if level.shape[0] > 0 else 0
+    level_width = np.bincount(workflow_codes[reachable] * max_level + level[reachable],
+                              minlength=num_workflows * max_level)
+    approx_concurrency = level_width.reshape(num_workflows, max_level).max(axis=1) if max_level > 0 else \
+        np.zeros(num_workflows, dtype=np.int64)
+
+    return pd.DataFrame({
+        "workflow_id": unique_workflows,
+        "critical_path_length": cp_length,
+        "critical_path_task_count": cp_task_count,
+        "approx_max_concurrent_tasks": approx_concurrency,
+        "max_concurrent_tasks": max_concurrency(workflow_codes, num_workflows, start, runtime),
+    })
+
+
+def _batch_task(task):
+    trace_location, batch, columns = task
+    arrays = read_batch(trace_location, batch, columns)
+    with instrumentation.span("workflow_metrics", rows=arrays[0].shape[0], trace=trace_location):
+        return compute_batch_metrics(*arrays)
+
+
+def workflow_metrics(trace_location, processes=None, batch_tasks=default_batch_tasks, spill_directory=None,
+                     spill_factor=default_spill_factor):
+    """
+    Returns a DataFrame with one row per workflow_id and the metric_columns. Clusters of more than spill_factor *
+    batch_tasks tasks are spilled to a temporary directory in spill_directory.
+    """
+    columns = batch_columns(trace_location)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    spill_location = None
+    try:
+        batches = []
+        for batch in plan_batches(trace_location, batch_tasks):
+            if sum(group.num_rows for group in batch) <= spill_factor * batch_tasks:
+                batches.append(batch)
+                continue
+            if spill_location is None:
+                spill_location = tempfile.mkdtemp(prefix="workflow_metrics-", dir=spill_directory)
+            cluster_location = tempfile.mkdtemp(dir=spill_location)
+            with instrumentation.span("spill_cluster", trace=trace_location,
+                                      rows=sum(group.num_rows for group in batch)):
+                batches.extend(spill_cluster(batch, columns, batch_tasks, cluster_location))
+
+        tasks = [(trace_location, batch, columns) for batch in batches]
+        if processes <= 1 or len(tasks) <= 1:
+            frames = [_batch_task(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(processes=min(processes, len(tasks)))
+            try:
+                frames = instrumentation.pool_map(pool, _batch_task, tasks)
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        if spill_location is not None:
+            shutil.rmtree(spill_location, ignore_errors=True)
+
+    if len(frames) == 0:
+        return pd.DataFrame(columns=["workflow_id"] + metric_columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def has_tasks(trace_location):
+    return os.path.exists(trace_reader.table_location(trace_location))
@@ -0,0 +1,126 @@
+"""
+Single-node port of workflow-structure-analysis/graphAnalysis.scala.
+
+Counts, per trace, how many tasks have 0, 1 or N parents and 0, 1 or N children. Tasks of type "dummy" are not
+counted themselves but pass their relationships through: a task connected to another task via a chain of dummy tasks
+counts that task once for every such chain, exactly like the iterative GraphX message passing. The graph is held as
+int64 edge arrays and every propagation round is a single bincount over the edges leaving the current dummy frontier.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import trace_reader
+
+relationships = ["0:0", "0:1", "0:N", "1:0", "1:1", "1:N", "N:0", "N:1", "N:N"]
+
+
+def read_task_graph(trace_location):
+    """
+    Returns (ids, is_dummy, src, dst): the task ids, a mask of dummy tasks and the parent->child edges as indices into
+    ids. Edges to ids that are not in the trace are dropped.
+    """
+    columns = ["id", "children"]
+    if "type" in trace_reader.column_names(trace_location):
+        columns.append("type")
+    return task_graph(trace_reader.read_columns(trace_location, columns))
+
+
+def task_graph(table):
+    # read_task_graph of a table with the id, children and optionally type columns.
+    ids = table.column("id").to_numpy().astype(np.int64)
+    if "type" in table.column_names:
+        # Compared in Arrow, without turning the column into Python strings; null types are not dummies.
+        is_dummy = pc.fill_null(pc.equal(table.column("type"), pa.scalar("dummy")), False)
+        is_dummy = np.asarray(is_dummy.to_numpy(), dtype=bool)
+    else:
+        is_dummy = np.zeros(ids.shape[0], dtype=bool)
+
+    num_children, child_ids = trace_reader.list_column(table, "children")
+    src, dst = edges_from_children(ids, num_children, child_ids)
+    return ids, is_dummy, src, dst
+
+
+def edges_from_children(ids, num_children, child_ids):
+    src = np.repeat(np.arange(ids.shape[0], dtype=np.int64), num_children)
+    if ids.shape[0] == 0 or child_ids.shape[0] == 0:
+        return src[:0], src[:0]
+
+    order = np.argsort(ids, kind="mergesort")
+    sorted_ids = ids[order]
+    positions = np.minimum(np.searchsorted(sorted_ids, child_ids), ids.shape[0] - 1)
+    known = sorted_ids[positions] == child_ids
+    return src[known], order[positions[known]]
+
+
+def _propagate(num_vertices, is_dummy, src, dst, max_rounds=None):
+    # Direct relationships with non-dummy neighbours.
+    direct = np.bincount(dst[~is_dummy[src]], minlength=num_vertices).astype(np.int64)
+    totals = np.minimum(direct, 2)
+
+    # Only 0, 1 or "many" matters, so every value is capped at 2 to keep long dummy chains from overflowing.
+    frontier = np.where(is_dummy, totals, 0)
+    from_dummy = is_dummy[src]
+    dummy_src = src[from_dummy]
+    dummy_dst = dst[from_dummy]
+
+    rounds = 0
+    while frontier.any() and (max_rounds is None or rounds < max_rounds):
+        weights = frontier[dummy_src]
+        nonzero = weights > 0
+        messages = np.bincount(dummy_dst[nonzero], weights=weights[nonzero], minlength=num_vertices)
+        messages = np.minimum(messages, 2).astype(np.int64)
+        totals = np.where(is_dummy, totals, np.minimum(totals + messages, 2))
+        frontier = np.where(is_dummy, messages, 0)
+        rounds += 1
+
+    return totals
+
+
+def relationship_counts(is_dummy, src, dst, max_rounds=None):
+    """
+    Returns a dict of relationship ("<parents>:<children>" with 0, 1 or N) to the number of non-dummy tasks with it.
+    max_rounds guards against cycles through dummy tasks, which would make the original analysis loop forever.
+    """
+    num_vertices = is_dummy.shape[0]
+    num_parents = _propagate(num_vertices, is_dummy, src, dst, max_rounds)
+    num_children = _propagate(num_vertices, is_dummy, dst, src, max_rounds)
+
+    codes = num_parents[~is_dummy] * 3 + num_children[~is_dummy]
+    counts = np.bincount(codes, minlength=9)
+    return dict((relationship, int(count)) for relationship, count in zip(relationships, counts) if count > 0)
+
+
+def analyze_trace(trace_location, max_rounds=None):
+    _, is_dummy, src, dst = read_task_graph(trace_location)
+    return relationship_counts(is_dummy, src, dst, max_rounds=max_rounds)
+
+
+def structure_rows(trace_name, counts):
+    return ["{} {} {}".format(trace_name, relationship, counts[relationship])
+            for relationship in relationships if relationship in counts]
+
+
+def write_structure_ssv(traces_location, trace_names, output_path):
+    with open(output_path, "w") as f:
+        f.write("trace relationship count\n")
+        for trace_name in trace_names:
+            trace_location = os.path.join(traces_location, trace_name)
+            if not os.path.exists(trace_reader.table_location(trace_location)):
+                continue
+            counts = analyze_trace(trace_location)
+            for row in structure_rows(trace_name, counts):
+                f.write(row + "\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python workflow_structure.py <dir with trace directories> <output ssv> [trace ...]")
+        sys.exit(1)
+    traces_location = sys.argv[1]
+    trace_names = sys.argv[3:] or sorted(os.listdir(traces_location))
+    write_structure_ssv(traces_location, trace_names, sys.argv[2])